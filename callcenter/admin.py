@@ -9,7 +9,7 @@ from django.urls import reverse
 from django.utils.safestring import mark_safe
 from .models import (
     Operador, Producto, Lead, Conversacion, 
-    LlamadaIA, Venta
+    LlamadaIA, Venta, ImportJob
 )
 
 
@@ -110,7 +110,7 @@ class LeadAdmin(admin.ModelAdmin):
     list_display = [
         'nombre_completo', 'telefono', 'clasificacion_badge', 
         'estado_badge', 'score_badge', 'fuente', 'agente_asignado',
-        'ultima_interaccion', 'acciones'
+        'num_conversaciones', 'num_llamadas', 'ultima_interaccion', 'acciones'
     ]
     list_filter = [
         'clasificacion', 'estado', 'fuente', 'agente_asignado',
@@ -210,14 +210,14 @@ class LeadAdmin(admin.ModelAdmin):
     score_badge.short_description = 'Score'
     
     def total_conversaciones(self, obj):
-        count = obj.conversaciones.count()
-        return format_html('<strong>{}</strong> conversaciones', count)
+        return format_html('<strong>{}</strong> conversaciones', obj.num_conversaciones)
     total_conversaciones.short_description = 'Conversaciones'
+    total_conversaciones.admin_order_field = 'num_conversaciones'
     
     def total_llamadas(self, obj):
-        count = obj.llamadas.count()
-        return format_html('<strong>{}</strong> llamadas', count)
+        return format_html('<strong>{}</strong> llamadas', obj.num_llamadas)
     total_llamadas.short_description = 'Llamadas'
+    total_llamadas.admin_order_field = 'num_llamadas'
     
     def acciones(self, obj):
         return format_html(
@@ -242,9 +242,9 @@ class LeadAdmin(admin.ModelAdmin):
     marcar_como_cold.short_description = '❄️ Marcar como COLD'
     
     def actualizar_scores(self, request, queryset):
-        for lead in queryset:
-            lead.actualizar_score()
-        self.message_user(request, f'Scores actualizados para {queryset.count()} leads')
+        from .scoring import rescore_leads
+        stats = rescore_leads(queryset)
+        self.message_user(request, f'Scores recalculados para {stats["total"]} leads ({stats["updated"]} cambiaron)')
     actualizar_scores.short_description = '🔄 Actualizar Scores'
 
 
@@ -415,3 +415,55 @@ class VentaAdmin(admin.ModelAdmin):
             obj.get_estado_display()
         )
     estado_badge.short_description = 'Estado'
+
+
+@admin.register(ImportJob)
+class ImportJobAdmin(admin.ModelAdmin):
+    list_display = [
+        'id', 'nombre_archivo', 'estado_badge', 'total_procesados', 'leads_creados',
+        'leads_duplicados', 'num_errores', 'filas_por_segundo', 'creado_por', 'created_at'
+    ]
+    list_filter = ['estado', 'created_at']
+    search_fields = ['nombre_archivo']
+    date_hierarchy = 'created_at'
+    
+    fieldsets = (
+        ('Archivo', {
+            'fields': ('archivo', 'nombre_archivo', 'extension', 'operador_default', 'creado_por')
+        }),
+        ('Progreso', {
+            'fields': (
+                'estado', 'progreso', 'total_procesados', 'leads_creados',
+                'leads_duplicados', 'num_errores', 'filas_por_segundo'
+            )
+        }),
+        ('Resultado', {
+            'fields': ('archivo_errores', 'mensaje_error')
+        }),
+        ('Información del Sistema', {
+            'fields': ('created_at', 'started_at', 'finished_at', 'locked_by', 'locked_until'),
+            'classes': ('collapse',)
+        }),
+    )
+    
+    # Las importaciones se crean desde la página de leads y las actualiza el worker
+    def has_add_permission(self, request):
+        return False
+    
+    def get_readonly_fields(self, request, obj=None):
+        return [field.name for field in self.model._meta.fields]
+    
+    def estado_badge(self, obj):
+        colors = {
+            'PENDIENTE': '#ffc107',
+            'PROCESANDO': '#17a2b8',
+            'COMPLETADA': '#28a745',
+            'FALLIDA': '#dc3545'
+        }
+        return format_html(
+            '<span style="background-color: {}; color: white; padding: 3px 8px; '
+            'border-radius: 3px;">{}</span>',
+            colors.get(obj.estado, '#6c757d'),
+            obj.get_estado_display()
+        )
+    estado_badge.short_description = 'Estado'
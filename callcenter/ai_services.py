@@ -8,15 +8,74 @@ Servicios de IA para Call Center
 
 import json
 import re
-from typing import Dict, List, Tuple
+from typing import Dict, Iterable, List, Optional, Tuple
 from decimal import Decimal
 
 
+class KeywordMatcher:
+    """
+    Busca a la vez las palabras clave de varias tablas en una sola pasada
+
+    Todas las frases se compilan en una única expresión regular alternada; cada
+    coincidencia debe empezar y terminar en un límite de palabra (sin letras
+    alrededor), así 'no' no coincide dentro de 'nosotros' ni 'vs' dentro de
+    'volvs', pero sí '100mbps'. En cada posición gana la frase más larga
+    ('no me gusta') y cuenta también las frases que contiene ('no', 'me gusta').
+    """
+
+    # Límite de palabra por letras: los dígitos pegados ('50gb') no lo impiden
+    LIMITE = r'[^\W\d_]'
+
+    def __init__(self, tablas: Dict[str, Dict[str, Iterable[str]]]):
+        """
+        Args:
+            tablas: Tabla -> etiqueta -> frases (todas en minúsculas)
+        """
+        self.tablas = {tabla: list(etiquetas) for tabla, etiquetas in tablas.items()}
+        etiquetas_por_frase = {}
+        for tabla, etiquetas in tablas.items():
+            for etiqueta, frases in etiquetas.items():
+                for frase in frases:
+                    etiquetas_por_frase.setdefault(frase, set()).add((tabla, etiqueta, frase))
+        frases = sorted(etiquetas_por_frase, key=len, reverse=True)
+        # Cada frase arrastra las que contiene, que la búsqueda sin solapamiento se saltaría
+        self._coincidencias = {}
+        for frase in frases:
+            contenidas = set(etiquetas_por_frase[frase])
+            for otra in frases:
+                if otra != frase and len(otra) < len(frase) and self._contiene(frase, otra):
+                    contenidas |= etiquetas_por_frase[otra]
+            self._coincidencias[frase] = frozenset(contenidas)
+        alternativas = '|'.join(re.escape(frase) for frase in frases)
+        self._patron = re.compile(f'(?<!{self.LIMITE})(?:{alternativas})(?!{self.LIMITE})')
+
+    @classmethod
+    def _contiene(cls, frase: str, otra: str) -> bool:
+        return re.search(f'(?<!{cls.LIMITE}){re.escape(otra)}(?!{cls.LIMITE})', frase) is not None
+
+    def buscar(self, texto: str) -> Dict[str, Dict[str, set]]:
+        """
+        Returns:
+            Tabla -> etiqueta -> frases encontradas (solo las etiquetas con alguna)
+        """
+        encontradas = {tabla: {} for tabla in self.tablas}
+        for match in self._patron.finditer(texto.lower()):
+            for tabla, etiqueta, frase in self._coincidencias[match.group()]:
+                encontradas[tabla].setdefault(etiqueta, set()).add(frase)
+        return encontradas
+
+    def buscar_lote(self, textos: Iterable[str]) -> List[Dict[str, Dict[str, set]]]:
+        """Como buscar, para muchos textos"""
+        return [self.buscar(texto) for texto in textos]
+
+
 class LeadScorer:
     """Calcula el score de un lead basado en sus interacciones"""
     
+    PALABRAS_COMPRA = ['quiero', 'necesito', 'contratar', 'comprar', 'cuándo', 'precio', 'costo']
+    
     @staticmethod
-    def calcular_score(lead, mensaje: str = "") -> int:
+    def calcular_score(lead, mensaje: str = "", analisis: Optional[Dict] = None) -> int:
         """
         Calcula el score de un lead (0-100)
         
@@ -26,6 +85,8 @@ class LeadScorer:
         - Información específica (20%)
         - Tiempo de conversación (15%)
         - Respuestas positivas (10%)
+        
+        `analisis` es el resultado de analizar_texto(mensaje), si ya se calculó.
         """
         score = 0
         
@@ -46,16 +107,13 @@ class LeadScorer:
             score += 10
         
         # 4. Puntos por número de conversaciones (15 puntos)
-        num_conversaciones = lead.conversaciones.count()
-        score += min(num_conversaciones * 5, 15)
+        score += min(lead.num_conversaciones * 5, 15)
         
         # 5. Análisis del mensaje actual (10 puntos)
         if mensaje:
-            mensaje_lower = mensaje.lower()
-            
             # Palabras clave de alta intención
-            palabras_compra = ['quiero', 'necesito', 'contratar', 'comprar', 'cuándo', 'precio', 'costo']
-            if any(palabra in mensaje_lower for palabra in palabras_compra):
+            analisis = analisis or analizar_texto(mensaje)
+            if analisis['compra']:
                 score += 10
         
         # Limitar score entre 0 y 100
@@ -106,45 +164,23 @@ class IntentDetector:
         ]
     }
     
+    # En orden de prioridad: gana el primer tipo con alguna palabra en el mensaje
+    TIPOS_SERVICIO = {
+        'INTERNET': ['internet', 'wifi', 'fibra'],
+        'MOVIL': ['móvil', 'celular', 'plan', 'gigas'],
+        'TV': ['tv', 'cable', 'televisión'],
+        'COMBO': ['combo', 'paquete', 'todo'],
+    }
+    
     @classmethod
     def detectar_intenciones(cls, mensaje: str) -> List[str]:
         """Detecta todas las intenciones presentes en un mensaje"""
-        mensaje_lower = mensaje.lower()
-        intenciones_detectadas = []
-        
-        for intencion, palabras_clave in cls.INTENCIONES.items():
-            if any(palabra in mensaje_lower for palabra in palabras_clave):
-                intenciones_detectadas.append(intencion)
-        
-        return intenciones_detectadas
+        return analizar_texto(mensaje)['intenciones']
     
     @classmethod
     def extraer_informacion(cls, mensaje: str) -> Dict:
         """Extrae información estructurada del mensaje"""
-        info = {
-            'zona': None,
-            'presupuesto': None,
-            'tipo_servicio': None
-        }
-        
-        mensaje_lower = mensaje.lower()
-        
-        # Detectar tipo de servicio
-        if any(palabra in mensaje_lower for palabra in ['internet', 'wifi', 'fibra']):
-            info['tipo_servicio'] = 'INTERNET'
-        elif any(palabra in mensaje_lower for palabra in ['móvil', 'celular', 'plan', 'gigas']):
-            info['tipo_servicio'] = 'MOVIL'
-        elif any(palabra in mensaje_lower for palabra in ['tv', 'cable', 'televisión']):
-            info['tipo_servicio'] = 'TV'
-        elif any(palabra in mensaje_lower for palabra in ['combo', 'paquete', 'todo']):
-            info['tipo_servicio'] = 'COMBO'
-        
-        # Detectar presupuesto (números con $ o S/)
-        presupuesto_match = re.search(r'[\$S/]?\s*(\d+)', mensaje)
-        if presupuesto_match:
-            info['presupuesto'] = int(presupuesto_match.group(1))
-        
-        return info
+        return analizar_texto(mensaje)['info']
 
 
 class SentimentAnalyzer:
@@ -163,11 +199,11 @@ class SentimentAnalyzer:
     @classmethod
     def analizar_sentimiento(cls, mensaje: str) -> str:
         """Analiza el sentimiento del mensaje"""
-        mensaje_lower = mensaje.lower()
-        
-        positivos = sum(1 for palabra in cls.PALABRAS_POSITIVAS if palabra in mensaje_lower)
-        negativos = sum(1 for palabra in cls.PALABRAS_NEGATIVAS if palabra in mensaje_lower)
-        
+        return analizar_texto(mensaje)['sentimiento']
+    
+    @staticmethod
+    def clasificar(positivos: int, negativos: int) -> str:
+        """Sentimiento según la cantidad de palabras positivas y negativas distintas"""
         if positivos > negativos:
             return 'POSITIVO'
         elif negativos > positivos:
@@ -184,10 +220,13 @@ class WhatsAppBotIA:
         self.intent_detector = IntentDetector()
         self.sentiment_analyzer = SentimentAnalyzer()
     
-    def procesar_mensaje(self, lead, mensaje: str) -> Dict:
+    def procesar_mensaje(self, lead, mensaje: str, analisis: Optional[Dict] = None) -> Dict:
         """
         Procesa un mensaje del cliente y genera una respuesta
         
+        `analisis` es el resultado de analizar_texto(mensaje); con analizar_lote
+        se calcula de una vez para todos los mensajes de un lote.
+        
         Returns:
             Dict con:
             - respuesta: str
@@ -197,14 +236,11 @@ class WhatsAppBotIA:
             - clasificacion: str
             - siguiente_accion: str
         """
-        # Detectar intenciones
-        intenciones = self.intent_detector.detectar_intenciones(mensaje)
-        
-        # Analizar sentimiento
-        sentimiento = self.sentiment_analyzer.analizar_sentimiento(mensaje)
-        
-        # Extraer información
-        info_extraida = self.intent_detector.extraer_informacion(mensaje)
+        # Intenciones, sentimiento e información en una sola pasada por el texto
+        analisis = analisis or analizar_texto(mensaje)
+        intenciones = analisis['intenciones']
+        sentimiento = analisis['sentimiento']
+        info_extraida = analisis['info']
         
         # Actualizar lead con información extraída
         if info_extraida['tipo_servicio'] and not lead.tipo_servicio_interes:
@@ -214,7 +250,7 @@ class WhatsAppBotIA:
             lead.presupuesto_estimado = Decimal(str(info_extraida['presupuesto']))
         
         # Calcular score
-        score = self.scorer.calcular_score(lead, mensaje)
+        score = self.scorer.calcular_score(lead, mensaje, analisis)
         clasificacion = self.scorer.clasificar_lead(score)
         
         # Generar respuesta basada en intenciones
@@ -237,7 +273,7 @@ class WhatsAppBotIA:
         """Genera una respuesta apropiada basada en las intenciones detectadas"""
         
         # Saludo inicial si es el primer mensaje
-        if lead.conversaciones.count() == 0:
+        if lead.num_conversaciones == 0:
             return (
                 f"¡Hola {lead.nombre}! 👋\n\n"
                 "Soy tu asistente virtual de telecomunicaciones. "
@@ -343,6 +379,8 @@ class WhatsAppBotIA:
 class CallAI:
     """Servicio de IA para llamadas telefónicas"""
     
+    PALABRAS_CLAVE = ['precio', 'instalación', 'velocidad', 'cobertura', 'promoción']
+    
     @staticmethod
     def generar_script_llamada(lead, tipo_llamada: str = 'SALIENTE') -> str:
         """Genera un script para la llamada basado en el lead"""
@@ -396,14 +434,9 @@ Excelente. Tengo el plan perfecto para ti...
     def analizar_transcripcion(transcripcion: str) -> Dict:
         """Analiza la transcripción de una llamada"""
         
-        analyzer = SentimentAnalyzer()
-        detector = IntentDetector()
-        
-        # Analizar sentimiento
-        sentimiento = analyzer.analizar_sentimiento(transcripcion)
-        
-        # Detectar intenciones
-        intenciones = detector.detectar_intenciones(transcripcion)
+        analisis = analizar_texto(transcripcion)
+        sentimiento = analisis['sentimiento']
+        intenciones = analisis['intenciones']
         
         # Detectar objeciones
         objeciones = []
@@ -411,10 +444,7 @@ Excelente. Tengo el plan perfecto para ti...
             objeciones.append('Precio alto')
         
         # Extraer palabras clave
-        palabras_clave = []
-        for palabra in ['precio', 'instalación', 'velocidad', 'cobertura', 'promoción']:
-            if palabra in transcripcion.lower():
-                palabras_clave.append(palabra)
+        palabras_clave = [palabra for palabra in CallAI.PALABRAS_CLAVE if palabra in analisis['palabras_clave']]
         
         return {
             'sentimiento': sentimiento,
@@ -423,3 +453,63 @@ Excelente. Tengo el plan perfecto para ti...
             'palabras_clave': palabras_clave,
             'duracion_palabras': len(transcripcion.split())
         }
+
+
+# Todas las tablas de palabras clave en un solo patrón, compilado al importar el módulo
+keyword_matcher = KeywordMatcher({
+    'intenciones': IntentDetector.INTENCIONES,
+    'tipo_servicio': IntentDetector.TIPOS_SERVICIO,
+    'sentimiento': {
+        'POSITIVO': SentimentAnalyzer.PALABRAS_POSITIVAS,
+        'NEGATIVO': SentimentAnalyzer.PALABRAS_NEGATIVAS,
+    },
+    'compra': {'COMPRA': LeadScorer.PALABRAS_COMPRA},
+    'palabras_clave': {palabra: [palabra] for palabra in CallAI.PALABRAS_CLAVE},
+})
+
+# Presupuesto: números con $ o S/
+PRESUPUESTO_RE = re.compile(r'[\$S/]?\s*(\d+)')
+
+
+def _resumir(mensaje: str, encontradas: Dict[str, Dict[str, set]]) -> Dict:
+    """Resultado de analizar_texto a partir de las coincidencias del matcher"""
+    positivos = len(encontradas['sentimiento'].get('POSITIVO', ()))
+    negativos = len(encontradas['sentimiento'].get('NEGATIVO', ()))
+    presupuesto_match = PRESUPUESTO_RE.search(mensaje)
+    return {
+        'intenciones': [
+            intencion for intencion in IntentDetector.INTENCIONES if intencion in encontradas['intenciones']
+        ],
+        'positivos': positivos,
+        'negativos': negativos,
+        'sentimiento': SentimentAnalyzer.clasificar(positivos, negativos),
+        'info': {
+            'zona': None,
+            'presupuesto': int(presupuesto_match.group(1)) if presupuesto_match else None,
+            'tipo_servicio': next(
+                (tipo for tipo in IntentDetector.TIPOS_SERVICIO if tipo in encontradas['tipo_servicio']), None
+            ),
+        },
+        'compra': bool(encontradas['compra']),
+        'palabras_clave': sorted(encontradas['palabras_clave']),
+    }
+
+
+def analizar_texto(mensaje: str) -> Dict:
+    """
+    Intenciones, sentimiento, tipo de servicio y presupuesto de un mensaje en una sola pasada
+
+    Returns:
+        Dict con intenciones, positivos, negativos, sentimiento, info
+        (zona, presupuesto, tipo_servicio), compra y palabras_clave
+    """
+    return _resumir(mensaje, keyword_matcher.buscar(mensaje))
+
+
+def analizar_lote(mensajes: Iterable[str]) -> List[Dict]:
+    """Como analizar_texto, para muchos mensajes"""
+    mensajes = list(mensajes)
+    return [
+        _resumir(mensaje, encontradas)
+        for mensaje, encontradas in zip(mensajes, keyword_matcher.buscar_lote(mensajes))
+    ]
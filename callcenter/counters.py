@@ -0,0 +1,90 @@
+"""
+Reconciliación de los contadores de interacciones de Lead.
+
+`num_conversaciones`, `num_llamadas` y `ultima_interaccion` se actualizan con
+F() al crear o borrar conversaciones y llamadas (señales en models). Lo que se
+escribe sin señales (bulk_create, borrados con .delete() sobre querysets de
+otra app, cargas de datos) puede dejarlos desfasados: `reconcile_counters`
+los recalcula por páginas y corrige solo los leads con diferencias.
+"""
+
+import time
+from typing import Any, Dict
+
+from django.db import transaction
+from django.db.models import Count, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def _subquery(model, expression, output_field=None):
+    """Agregado por lead de `model` como subconsulta correlacionada"""
+    return Subquery(
+        model.objects.filter(lead=OuterRef('pk')).order_by().values('lead').annotate(value=expression)
+        .values('value'),
+        output_field=output_field,
+    )
+
+
+def reconcile_counters(queryset=None, batch_size: int = 1000, dry_run: bool = False) -> Dict[str, Any]:
+    """
+    Recalcula los contadores de interacciones y guarda los leads desfasados
+
+    La última interacción solo se adelanta a la conversación o llamada más
+    reciente: no se borra la que se registró a mano sin conversación.
+
+    Args:
+        queryset: Leads a revisar (default: todos)
+        batch_size: Leads por consulta y por bulk_update
+        dry_run: Calcular sin guardar
+
+    Returns:
+        Dict con leads revisados, corregidos, desfase total de cada contador
+        y duración
+    """
+    from .models import Conversacion, Lead, LlamadaIA
+
+    started = time.monotonic()
+    queryset = Lead.objects.all() if queryset is None else queryset
+    queryset = queryset.annotate(
+        conversaciones_real=Coalesce(_subquery(Conversacion, Count('id'), IntegerField()), Value(0)),
+        llamadas_real=Coalesce(_subquery(LlamadaIA, Count('id'), IntegerField()), Value(0)),
+        ultima_conversacion=_subquery(Conversacion, Max('created_at')),
+        ultima_llamada=_subquery(LlamadaIA, Max('created_at')),
+    ).values(
+        'id', 'num_conversaciones', 'num_llamadas', 'ultima_interaccion',
+        'conversaciones_real', 'llamadas_real', 'ultima_conversacion', 'ultima_llamada',
+    ).order_by('id')
+
+    stats = {'total': 0, 'fixed': 0, 'conversaciones_drift': 0, 'llamadas_drift': 0}
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        changed = []
+        for row in rows:
+            ultima = max(
+                (moment for moment in (row['ultima_interaccion'], row['ultima_conversacion'], row['ultima_llamada'])
+                 if moment is not None),
+                default=None,
+            )
+            if (row['num_conversaciones'], row['num_llamadas'], row['ultima_interaccion']) == (
+                    row['conversaciones_real'], row['llamadas_real'], ultima):
+                continue
+            stats['conversaciones_drift'] += abs(row['conversaciones_real'] - row['num_conversaciones'])
+            stats['llamadas_drift'] += abs(row['llamadas_real'] - row['num_llamadas'])
+            changed.append(Lead(
+                id=row['id'],
+                num_conversaciones=row['conversaciones_real'],
+                num_llamadas=row['llamadas_real'],
+                ultima_interaccion=ultima,
+            ))
+        stats['total'] += len(rows)
+        stats['fixed'] += len(changed)
+        if changed and not dry_run:
+            with transaction.atomic():
+                Lead.objects.bulk_update(changed, ['num_conversaciones', 'num_llamadas', 'ultima_interaccion'])
+
+    stats['elapsed'] = time.monotonic() - started
+    return stats
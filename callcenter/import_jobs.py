@@ -0,0 +1,292 @@
+"""
+Importaciones de leads en segundo plano.
+
+La vista guarda el archivo subido en un ImportJob PENDIENTE y responde al
+momento. Un worker toma la importación con lease (outbox.lease_rows), la
+procesa con LeadImporter y guarda contadores, filas/segundo y progreso tras
+cada lote para que la página de leads los consulte. Si el worker se detiene,
+el lease vence y la importación se retoma desde la última fila guardada.
+
+El worker es el comando run_import_worker o un hilo dentro del proceso web
+(LEAD_IMPORT_INLINE_WORKER): en Railway cada servicio tiene su propio disco y
+el archivo subido solo existe en el contenedor web que lo recibió.
+"""
+
+import logging
+import threading
+import time
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db import connection
+from django.urls import reverse
+from django.utils import timezone
+
+from subscriptions.outbox import get_lease_seconds, lease_rows, make_worker_id
+
+from .importer import LeadImporter, iter_rows
+from .models import EstadoImportacion, ImportJob
+
+logger = logging.getLogger(__name__)
+
+
+class _LeasePerdido(Exception):
+    """Otro worker tomó la importación (el lease venció sin renovarse)"""
+
+
+class _Interrumpida(Exception):
+    """Se pidió detener el worker: la importación queda para otro worker"""
+
+
+def crear_importacion(file, extension: str, operador_default=None, usuario=None) -> ImportJob:
+    """
+    Guarda el archivo subido y deja la importación pendiente
+
+    Args:
+        file: Archivo subido (request.FILES)
+        extension: Extensión validada (ver importer.EXTENSIONES)
+        operador_default: Operador para las filas sin operador conocido
+        usuario: Usuario que sube el archivo
+
+    Returns:
+        ImportJob PENDIENTE
+    """
+    return ImportJob.objects.create(
+        archivo=file,
+        nombre_archivo=file.name[:255],
+        extension=extension,
+        operador_default=operador_default,
+        creado_por=usuario if usuario is not None and usuario.is_authenticated else None,
+    )
+
+
+def importaciones_visibles(usuario):
+    """
+    Importaciones que `usuario` puede consultar: las suyas, o todas si es staff
+
+    Returns:
+        QuerySet de ImportJob
+    """
+    if usuario.is_staff:
+        return ImportJob.objects.all()
+    return ImportJob.objects.filter(creado_por=usuario)
+
+
+def lease_importacion(worker_id: str, lease_seconds: Optional[int] = None) -> Optional[ImportJob]:
+    """
+    Toma la importación más antigua sin worker: pendiente o con el lease vencido
+
+    Returns:
+        ImportJob tomado por `worker_id`, o None si no hay ninguna libre
+    """
+    queryset = ImportJob.objects.filter(
+        estado__in=[EstadoImportacion.PENDIENTE, EstadoImportacion.PROCESANDO]
+    )
+    return lease_rows(queryset, worker_id, batch_size=1, lease_seconds=lease_seconds).first()
+
+
+def _progreso(archivo, tamano: int) -> Optional[int]:
+    """Porcentaje del archivo leído según la posición del archivo abierto"""
+    try:
+        return min(int(archivo.tell() * 100 / tamano), 99) if tamano else None
+    except (OSError, ValueError):
+        return None
+
+
+def ejecutar_importacion(job: ImportJob, worker_id: str, lease_seconds: Optional[int] = None,
+                         stop_event: Optional[threading.Event] = None) -> ImportJob:
+    """
+    Procesa una importación tomada con lease_importacion
+
+    Tras cada lote guarda los contadores y renueva el lease. Si la importación
+    ya había avanzado (worker anterior detenido), salta las filas procesadas.
+    Los errores de ese intento anterior se cuentan pero no están en el
+    archivo de errores.
+
+    Args:
+        job: Importación tomada por `worker_id`
+        worker_id: Identificador del worker (ver make_worker_id)
+        lease_seconds: Duración del lease que se renueva tras cada lote
+        stop_event: Si se activa, se suelta la importación tras el lote en curso
+
+    Returns:
+        La importación actualizada
+    """
+    lease_seconds = lease_seconds or get_lease_seconds()
+    skip = job.total_procesados
+    errores_previos = job.num_errores
+    job.estado = EstadoImportacion.PROCESANDO
+    job.started_at = job.started_at or timezone.now()
+    job.save(update_fields=['estado', 'started_at'])
+    if skip:
+        logger.info(f'Retomando importación #{job.pk} desde la fila {skip + 2}')
+
+    try:
+        archivo = job.archivo.open('rb')
+    except (OSError, ValueError) as e:
+        logger.error(f'Importación #{job.pk}: archivo no disponible ({e})')
+        return _finalizar(job, EstadoImportacion.FALLIDA,
+                          'El archivo subido ya no está disponible en este servidor')
+
+    started = time.monotonic()
+    tamano = job.archivo.size if job.extension == 'csv' else 0
+
+    def on_chunk(stats: Dict[str, Any]) -> None:
+        elapsed = time.monotonic() - started
+        job.total_procesados = stats['total_procesados']
+        job.leads_creados = stats['leads_creados']
+        job.leads_duplicados = stats['leads_duplicados']
+        job.num_errores = errores_previos + len(stats['errores'])
+        job.filas_por_segundo = (stats['total_procesados'] - skip) / elapsed if elapsed > 0 else 0.0
+        job.progreso = _progreso(archivo, tamano)
+        job.locked_until = timezone.now() + timedelta(seconds=lease_seconds)
+        updated = ImportJob.objects.filter(pk=job.pk, locked_by=worker_id).update(
+            **{field: getattr(job, field) for field in ImportJob.PROGRESS_FIELDS}
+        )
+        if not updated:
+            raise _LeasePerdido()
+        if stop_event is not None and stop_event.is_set():
+            raise _Interrumpida()
+
+    try:
+        importer = LeadImporter(job.operador_default)
+        stats = importer.run(
+            iter_rows(archivo, job.extension), on_chunk=on_chunk, skip=skip,
+            stats={'leads_creados': job.leads_creados, 'leads_duplicados': job.leads_duplicados},
+        )
+    except _LeasePerdido:
+        logger.warning(f'Importación #{job.pk}: el lease pasó a otro worker, se deja de procesar')
+        return job
+    except _Interrumpida:
+        logger.info(f'Importación #{job.pk} interrumpida en la fila {job.total_procesados + 2}')
+        ImportJob.objects.filter(pk=job.pk, locked_by=worker_id).update(locked_by='', locked_until=None)
+        return job
+    except Exception as e:
+        logger.exception(f'Error en importación #{job.pk}')
+        return _finalizar(job, EstadoImportacion.FALLIDA, f'Error al procesar archivo: {str(e)}')
+    finally:
+        archivo.close()
+
+    job.total_procesados = stats['total_procesados']
+    job.leads_creados = stats['leads_creados']
+    job.leads_duplicados = stats['leads_duplicados']
+    job.num_errores = errores_previos + len(stats['errores'])
+    job.filas_por_segundo = stats['throughput']
+    if stats['errores']:
+        lineas = stats['errores']
+        if errores_previos:
+            lineas = [f'({errores_previos} errores de un intento anterior no se incluyen)'] + lineas
+        job.archivo_errores.save(
+            f'importacion_{job.pk}_errores.txt', ContentFile('\n'.join(lineas).encode('utf-8')), save=False
+        )
+    if not job.total_procesados:
+        return _finalizar(job, EstadoImportacion.FALLIDA, 'El archivo está vacío')
+    logger.info(
+        f'Importación #{job.pk} completada: {job.leads_creados} creados, {job.leads_duplicados} duplicados, '
+        f'{job.num_errores} errores ({stats["throughput"]:.0f} filas/s)'
+    )
+    return _finalizar(job, EstadoImportacion.COMPLETADA)
+
+
+def _finalizar(job: ImportJob, estado: str, mensaje_error: str = '') -> ImportJob:
+    """Guarda el resultado final y suelta el lease"""
+    job.estado = estado
+    job.mensaje_error = mensaje_error
+    job.progreso = 100 if estado == EstadoImportacion.COMPLETADA and job.extension == 'csv' else job.progreso
+    job.finished_at = timezone.now()
+    job.locked_by = ''
+    job.locked_until = None
+    job.save()
+    return job
+
+
+def procesar_pendientes(worker_id: str, lease_seconds: Optional[int] = None,
+                        stop_event: Optional[threading.Event] = None) -> int:
+    """
+    Procesa importaciones una a una hasta que no quede ninguna libre
+
+    Returns:
+        Número de importaciones procesadas
+    """
+    procesadas = 0
+    while stop_event is None or not stop_event.is_set():
+        job = lease_importacion(worker_id, lease_seconds)
+        if job is None:
+            break
+        ejecutar_importacion(job, worker_id, lease_seconds, stop_event)
+        procesadas += 1
+    return procesadas
+
+
+# Hilo del proceso web que procesa las importaciones (uno por proceso, ver iniciar_worker_en_proceso)
+_inline_thread = None
+_inline_pending = threading.Event()
+_inline_lock = threading.Lock()
+
+
+def _inline_worker() -> None:
+    """Procesa las importaciones pendientes y termina cuando no queda ninguna"""
+    global _inline_thread
+    worker_id = make_worker_id('import')
+    try:
+        while True:
+            _inline_pending.clear()
+            try:
+                procesar_pendientes(worker_id)
+            except Exception as e:
+                logger.exception(f'Error en worker de importaciones {worker_id}: {e}')
+            with _inline_lock:
+                # Si se encoló otra importación mientras se procesaba, seguir
+                if not _inline_pending.is_set():
+                    _inline_thread = None
+                    return
+    finally:
+        # El hilo abre su propia conexión; cerrarla al salir
+        connection.close()
+
+
+def iniciar_worker_en_proceso() -> bool:
+    """
+    Arranca (si no está corriendo) el hilo que procesa importaciones en este proceso
+
+    Desactivado con LEAD_IMPORT_INLINE_WORKER=False cuando las importaciones
+    las procesa el comando run_import_worker con almacenamiento compartido.
+
+    Returns:
+        True si se arrancó un hilo nuevo
+    """
+    global _inline_thread
+    if not getattr(settings, 'LEAD_IMPORT_INLINE_WORKER', True):
+        return False
+    with _inline_lock:
+        _inline_pending.set()
+        if _inline_thread is not None:
+            return False
+        _inline_thread = threading.Thread(target=_inline_worker, name='lead-import', daemon=True)
+        _inline_thread.start()
+    return True
+
+
+def estado_importacion(job: ImportJob) -> Dict[str, Any]:
+    """Estado y contadores de la importación para el endpoint de consulta"""
+    return {
+        'id': job.pk,
+        'estado': job.estado,
+        'estado_display': job.get_estado_display(),
+        'terminada': job.terminada,
+        'nombre_archivo': job.nombre_archivo,
+        'total_procesados': job.total_procesados,
+        'leads_creados': job.leads_creados,
+        'leads_duplicados': job.leads_duplicados,
+        'errores': job.num_errores,
+        'filas_por_segundo': round(job.filas_por_segundo, 1),
+        'progreso': job.progreso,
+        'mensaje_error': job.mensaje_error,
+        'errores_url': (
+            reverse('callcenter:import_job_errors', args=[job.pk]) if job.archivo_errores else None
+        ),
+        'created_at': job.created_at.isoformat(),
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
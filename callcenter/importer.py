@@ -0,0 +1,225 @@
+"""
+Importación masiva de leads desde CSV o Excel.
+
+El archivo se lee por filas sin cargarlo entero (CSV decodificado línea a
+línea, Excel con openpyxl en modo read_only). Los teléfonos ya registrados y
+los operadores se cargan una vez al empezar, así que validar una fila no
+hace consultas; las filas válidas se insertan con bulk_create en una
+transacción por lote de CHUNK_SIZE filas.
+"""
+
+import codecs
+import csv
+import itertools
+import logging
+import time
+from decimal import Decimal, InvalidOperation
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+from django.db import transaction
+
+from subscriptions.phone import normalize_phone, phone_key
+
+logger = logging.getLogger(__name__)
+
+# Intentar importar openpyxl para Excel
+try:
+    import openpyxl
+    OPENPYXL_AVAILABLE = True
+except ImportError:
+    OPENPYXL_AVAILABLE = False
+
+EXTENSIONES = ('csv', 'xlsx', 'xls')
+
+# Filas por validación, transacción y bulk_create
+CHUNK_SIZE = 1000
+
+
+def iter_csv_rows(file) -> Iterator[Dict[str, Any]]:
+    """Filas de un CSV (utf-8, con o sin BOM) como dicts, leyendo el archivo línea a línea"""
+    yield from csv.DictReader(codecs.iterdecode(file, 'utf-8-sig'))
+
+
+def iter_excel_rows(file) -> Iterator[Dict[str, Any]]:
+    """Filas de la hoja activa de un Excel como dicts, con openpyxl en modo read_only"""
+    workbook = openpyxl.load_workbook(file, read_only=True, data_only=True)
+    try:
+        rows = workbook.active.iter_rows(values_only=True)
+        headers = next(rows, None) or ()
+        for row in rows:
+            row_dict = {
+                headers[i]: value for i, value in enumerate(row)
+                if i < len(headers) and headers[i]
+            }
+            if row_dict:  # Solo filas con datos bajo algún encabezado
+                yield row_dict
+    finally:
+        workbook.close()
+
+
+def iter_rows(file, extension: str) -> Iterator[Dict[str, Any]]:
+    """Filas del archivo según su extensión (ver EXTENSIONES)"""
+    if extension == 'csv':
+        return iter_csv_rows(file)
+    return iter_excel_rows(file)
+
+
+def _texto(value) -> str:
+    """Valor de una celda como texto sin espacios (Excel devuelve números y None)"""
+    if value is None:
+        return ''
+    if isinstance(value, float) and value.is_integer():
+        value = int(value)
+    return str(value).strip()
+
+
+class LeadImporter:
+    """Valida e inserta leads por lotes con deduplicación por teléfono en memoria"""
+
+    def __init__(self, operador_default=None, chunk_size: int = CHUNK_SIZE):
+        """
+        Args:
+            operador_default: Operador para las filas sin operador conocido
+            chunk_size: Filas por lote de validación e inserción
+        """
+        from .models import Lead, Operador, TipoServicio
+
+        self.operador_default = operador_default
+        self.chunk_size = chunk_size
+        self.tipos_servicio = set(dict(TipoServicio.choices))
+        self.operadores = {operador.nombre.lower(): operador for operador in Operador.objects.all()}
+        self.telefonos = set(
+            Lead.objects.exclude(telefono_e164='').values_list('telefono_e164', flat=True).iterator(chunk_size=5000)
+        )
+
+    def run(self, rows: Iterable[Dict[str, Any]],
+            on_chunk: Optional[Callable[[Dict[str, Any]], None]] = None,
+            skip: int = 0, stats: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Importa las filas (la fila 1 del archivo son los encabezados)
+
+        Args:
+            rows: Dicts por fila (ver iter_rows)
+            on_chunk: Callback opcional con los contadores tras cada lote guardado
+            skip: Filas de datos ya importadas en un intento anterior (se saltan)
+            stats: Contadores de ese intento anterior, para continuarlos
+
+        Returns:
+            Dict con total_procesados, leads_creados, leads_duplicados, errores
+            (todos, 'Fila N: motivo'), duración y filas/segundo de esta ejecución
+        """
+        stats = {
+            'total_procesados': skip, 'leads_creados': 0, 'leads_duplicados': 0, 'errores': [],
+            **(stats or {}),
+        }
+        started = time.monotonic()
+        chunk = []
+        # start=2 porque la fila 1 son headers
+        for idx, row in enumerate(itertools.islice(rows, skip, None), start=2 + skip):
+            chunk.append((idx, row))
+            if len(chunk) >= self.chunk_size:
+                self._import_chunk(chunk, stats)
+                chunk = []
+                if on_chunk:
+                    on_chunk(stats)
+        if chunk:
+            self._import_chunk(chunk, stats)
+            if on_chunk:
+                on_chunk(stats)
+        stats['elapsed'] = time.monotonic() - started
+        processed = stats['total_procesados'] - skip
+        stats['throughput'] = processed / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+        return stats
+
+    def _build_lead(self, idx: int, row: Dict[str, Any], stats: Dict[str, Any]):
+        """Lead sin guardar para la fila, o None si es inválida (se anota el error) o duplicada"""
+        from .models import Lead
+
+        # Validar campos requeridos
+        nombre = _texto(row.get('nombre'))
+        apellido = _texto(row.get('apellido'))
+        telefono = _texto(row.get('telefono'))
+        zona = _texto(row.get('zona'))
+        if not all([nombre, apellido, telefono, zona]):
+            stats['errores'].append(f"Fila {idx}: Faltan campos requeridos (nombre, apellido, telefono, zona)")
+            return None
+
+        # Normalizar teléfono
+        telefono_normalizado = normalize_phone(telefono)
+        if not telefono_normalizado:
+            stats['errores'].append(f"Fila {idx}: Teléfono inválido ({telefono})")
+            return None
+
+        # Verificar si ya existe (en la base o antes en el mismo archivo)
+        if telefono_normalizado in self.telefonos:
+            stats['leads_duplicados'] += 1
+            return None
+
+        presupuesto = _texto(row.get('presupuesto'))
+        try:
+            presupuesto = Decimal(presupuesto) if presupuesto else None
+        except InvalidOperation:
+            stats['errores'].append(f"Fila {idx}: Presupuesto inválido ({presupuesto})")
+            return None
+
+        # Buscar operador
+        operador = self.operadores.get(_texto(row.get('operador')).lower(), self.operador_default)
+
+        # Validar tipo de servicio
+        tipo_servicio = _texto(row.get('tipo_servicio')).upper()
+        if tipo_servicio not in self.tipos_servicio:
+            tipo_servicio = ''
+
+        self.telefonos.add(telefono_normalizado)
+        # bulk_create no pasa por Lead.save(): las columnas normalizadas se calculan aquí
+        return Lead(
+            nombre=nombre,
+            apellido=apellido,
+            telefono=telefono_normalizado,
+            telefono_e164=telefono_normalizado,
+            telefono_clave=phone_key(telefono_normalizado),
+            email=_texto(row.get('email')) or None,
+            zona=zona,
+            operador_interes=operador,
+            tipo_servicio_interes=tipo_servicio,
+            presupuesto_estimado=presupuesto,
+            notas=_texto(row.get('notas')),
+            clasificacion='COLD',
+            estado='NUEVO',
+            fuente='WEB',
+            score=30,
+        )
+
+    def _import_chunk(self, chunk: List, stats: Dict[str, Any]) -> None:
+        """Valida un lote y lo inserta en una transacción"""
+        from .models import Lead
+
+        leads = []
+        for idx, row in chunk:
+            try:
+                lead = self._build_lead(idx, row, stats)
+            except Exception as e:
+                logger.exception(f"Error procesando fila {idx}")
+                stats['errores'].append(f"Fila {idx}: {str(e)}")
+                continue
+            if lead is not None:
+                leads.append((idx, lead))
+        stats['total_procesados'] += len(chunk)
+        if not leads:
+            return
+        try:
+            with transaction.atomic():
+                Lead.objects.bulk_create([lead for _, lead in leads], batch_size=self.chunk_size)
+            stats['leads_creados'] += len(leads)
+        except Exception:
+            # Si el lote falla (p. ej. un valor que excede la columna), insertar fila por fila
+            # para reportar solo las que fallan
+            for idx, lead in leads:
+                try:
+                    with transaction.atomic():
+                        Lead.objects.bulk_create([lead])
+                    stats['leads_creados'] += 1
+                except Exception as e:
+                    logger.exception(f"Error procesando fila {idx}")
+                    self.telefonos.discard(lead.telefono_e164)
+                    stats['errores'].append(f"Fila {idx}: {str(e)}")
@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from callcenter.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = ('Recalcula num_conversaciones, num_llamadas y ultima_interaccion de los leads '
+            'y corrige los que quedaron desfasados')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Leads por consulta y por bulk_update (default: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Mostrar el desfase sin corregirlo'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size debe ser mayor que 0')
+
+        self.stdout.write('🔢 Revisando contadores de interacciones de los leads...')
+        stats = reconcile_counters(batch_size=options['batch_size'], dry_run=options['dry_run'])
+
+        self.stdout.write(f'Leads revisados: {stats["total"]}')
+        action = 'Desfasados' if options['dry_run'] else 'Corregidos'
+        style = self.style.WARNING if stats['fixed'] else self.style.SUCCESS
+        self.stdout.write(style(f'{action}: {stats["fixed"]}'))
+        if stats['fixed']:
+            self.stdout.write(f'   • Conversaciones de diferencia: {stats["conversaciones_drift"]}')
+            self.stdout.write(f'   • Llamadas de diferencia: {stats["llamadas_drift"]}')
+        self.stdout.write(f'Duración: {stats["elapsed"]:.1f}s')
+        if options['dry_run'] and stats['fixed']:
+            self.stdout.write(self.style.WARNING('\nModo de prueba: no se corrigió ningún lead'))
@@ -0,0 +1,66 @@
+from datetime import datetime, timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+
+from callcenter.scoring import rescore_leads
+
+
+class Command(BaseCommand):
+    help = ('Recalcula score y clasificación de los leads con una consulta anotada por lote '
+            'y guarda solo los que cambiaron')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--since',
+            help='Solo leads con cambios desde esta fecha (YYYY-MM-DD, YYYY-MM-DD HH:MM) '
+                 'o hace este tiempo (12h, 7d)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Leads por consulta y por bulk_update (default: 1000)'
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Calcular y mostrar los cambios sin guardarlos'
+        )
+
+    def handle(self, *args, **options):
+        if options['batch_size'] <= 0:
+            raise CommandError('--batch-size debe ser mayor que 0')
+        since = self._parse_since(options['since']) if options['since'] else None
+
+        scope = f'con cambios desde {timezone.localtime(since):%d/%m/%Y %H:%M}' if since else 'todos'
+        self.stdout.write(f'🔄 Recalculando scores de leads ({scope})...')
+        stats = rescore_leads(since=since, batch_size=options['batch_size'], dry_run=options['dry_run'])
+
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write(self.style.SUCCESS('📊 RESUMEN DEL RESCORING'))
+        self.stdout.write('='*50)
+        self.stdout.write(f'Leads revisados: {stats["total"]}')
+        action = 'A actualizar' if options['dry_run'] else 'Actualizados'
+        self.stdout.write(f'{action}: {stats["updated"]}')
+        for transition, count in sorted(stats['transitions'].items()):
+            self.stdout.write(f'   • {transition}: {count}')
+        self.stdout.write(f'Duración: {stats["elapsed"]:.1f}s')
+        self.stdout.write(f'Throughput: {stats["throughput"]:.0f} leads/s')
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING('\nModo de prueba: no se guardó ningún cambio'))
+
+    @staticmethod
+    def _parse_since(value):
+        """Fecha absoluta o relativa (12h, 7d) de --since"""
+        units = {'h': 'hours', 'd': 'days', 'm': 'minutes'}
+        if value[-1:] in units and value[:-1].isdigit():
+            return timezone.now() - timedelta(**{units[value[-1]]: int(value[:-1])})
+        moment = parse_datetime(value)
+        if moment is None:
+            day = parse_date(value)
+            if day is None:
+                raise CommandError(f'--since inválido: {value!r}')
+            moment = datetime.combine(day, datetime.min.time())
+        return timezone.make_aware(moment) if timezone.is_naive(moment) else moment
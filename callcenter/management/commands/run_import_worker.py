@@ -0,0 +1,68 @@
+from django.core.management.base import BaseCommand, CommandError
+from callcenter.import_jobs import ejecutar_importacion, lease_importacion
+from callcenter.models import EstadoImportacion
+from subscriptions.outbox import get_lease_seconds, make_worker_id
+import signal
+import threading
+
+
+class Command(BaseCommand):
+    help = ('Procesa las importaciones de leads pendientes (ImportJob) y retoma las que '
+            'quedaron sin worker. Requiere acceso a los archivos subidos por el proceso web')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            help='Duración del lease, renovado tras cada lote (default: OUTBOX_LEASE_SECONDS)'
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=5.0,
+            help='Segundos de espera cuando no hay importaciones pendientes (default: 5)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Terminar cuando no queden importaciones pendientes en lugar de seguir esperando'
+        )
+
+    def handle(self, *args, **options):
+        if options['idle_sleep'] < 0:
+            raise CommandError('--idle-sleep no puede ser negativo')
+
+        lease_seconds = options['lease_seconds'] or get_lease_seconds()
+        worker_id = make_worker_id('import')
+        stop_event = threading.Event()
+        # Railway detiene los procesos con SIGTERM: soltar la importación tras el lote en curso
+        signal.signal(signal.SIGTERM, lambda signum, frame: stop_event.set())
+
+        self.stdout.write(f'📥 Worker de importaciones de leads iniciado ({worker_id})')
+        try:
+            while not stop_event.is_set():
+                job = lease_importacion(worker_id, lease_seconds)
+                if job is None:
+                    if options['once']:
+                        break
+                    stop_event.wait(options['idle_sleep'])
+                    continue
+
+                self.stdout.write(f'📄 Importación #{job.pk}: {job.nombre_archivo}')
+                job = ejecutar_importacion(job, worker_id, lease_seconds, stop_event)
+                self._report(job)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\n🛑 Worker detenido'))
+
+    def _report(self, job):
+        """Muestra el resultado de una importación"""
+        summary = (
+            f'{job.total_procesados} filas: {job.leads_creados} creados, {job.leads_duplicados} duplicados, '
+            f'{job.num_errores} errores ({job.filas_por_segundo:.0f} filas/s)'
+        )
+        if job.estado == EstadoImportacion.COMPLETADA:
+            self.stdout.write(self.style.SUCCESS(f'   ✓ Completada - {summary}'))
+        elif job.estado == EstadoImportacion.FALLIDA:
+            self.stdout.write(self.style.ERROR(f'   ✗ Fallida - {job.mensaje_error}'))
+        else:
+            self.stdout.write(self.style.WARNING(f'   ⏸ Interrumpida en la fila {job.total_procesados + 2} - {summary}'))
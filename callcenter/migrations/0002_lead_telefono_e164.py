@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callcenter', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='telefono_clave',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Últimos 9 dígitos, para coincidir con o sin código de país', max_length=9, verbose_name='Clave de Teléfono'),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='telefono_e164',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=16, verbose_name='Teléfono E.164'),
+        ),
+    ]
@@ -0,0 +1,61 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:27
+
+from django.db import migrations, models
+from django.db.models import Count, DateTimeField, F, IntegerField, Max, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+
+
+def backfill_counters(apps, schema_editor):
+    """
+    Contadores iniciales de los leads existentes (luego se mantienen al escribir)
+
+    La última interacción se adelanta a la conversación o llamada más reciente:
+    el scoring ya no la calcula a partir de las conversaciones.
+    """
+    Lead = apps.get_model('callcenter', 'Lead')
+    Conversacion = apps.get_model('callcenter', 'Conversacion')
+    LlamadaIA = apps.get_model('callcenter', 'LlamadaIA')
+
+    def count(model):
+        return Coalesce(Subquery(
+            model.objects.filter(lead=OuterRef('pk')).order_by().values('lead').annotate(total=Count('id'))
+            .values('total'),
+            output_field=IntegerField(),
+        ), Value(0))
+
+    def latest(model):
+        return Subquery(
+            model.objects.filter(lead=OuterRef('pk')).order_by().values('lead').annotate(ultima=Max('created_at'))
+            .values('ultima'),
+            output_field=DateTimeField(),
+        )
+
+    Lead.objects.update(num_conversaciones=count(Conversacion), num_llamadas=count(LlamadaIA))
+    # Greatest devuelve NULL si algún argumento es NULL en SQLite: cada uno cae en los demás
+    registrada, conversacion, llamada = F('ultima_interaccion'), latest(Conversacion), latest(LlamadaIA)
+    Lead.objects.update(ultima_interaccion=Greatest(
+        Coalesce(registrada, conversacion, llamada),
+        Coalesce(conversacion, registrada, llamada),
+        Coalesce(llamada, registrada, conversacion),
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callcenter', '0002_lead_telefono_e164'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='lead',
+            name='num_conversaciones',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Conversaciones'),
+        ),
+        migrations.AddField(
+            model_name='lead',
+            name='num_llamadas',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Llamadas'),
+        ),
+        migrations.RunPython(backfill_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,47 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:34
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callcenter', '0003_lead_counters'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('archivo', models.FileField(upload_to='imports/leads/%Y/%m/', verbose_name='Archivo')),
+                ('nombre_archivo', models.CharField(max_length=255, verbose_name='Nombre del archivo')),
+                ('extension', models.CharField(max_length=10, verbose_name='Extensión')),
+                ('estado', models.CharField(choices=[('PENDIENTE', 'Pendiente'), ('PROCESANDO', 'Procesando'), ('COMPLETADA', 'Completada'), ('FALLIDA', 'Fallida')], default='PENDIENTE', max_length=20, verbose_name='Estado')),
+                ('total_procesados', models.PositiveIntegerField(default=0, verbose_name='Filas procesadas')),
+                ('leads_creados', models.PositiveIntegerField(default=0, verbose_name='Leads creados')),
+                ('leads_duplicados', models.PositiveIntegerField(default=0, verbose_name='Duplicados')),
+                ('num_errores', models.PositiveIntegerField(default=0, verbose_name='Errores')),
+                ('filas_por_segundo', models.FloatField(default=0, verbose_name='Filas/segundo')),
+                ('progreso', models.PositiveSmallIntegerField(blank=True, help_text='Porcentaje del archivo leído (solo CSV)', null=True, verbose_name='Progreso (%)')),
+                ('archivo_errores', models.FileField(blank=True, upload_to='imports/errores/%Y/%m/', verbose_name='Archivo de errores')),
+                ('mensaje_error', models.TextField(blank=True, verbose_name='Mensaje de error')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Tomado por')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Lease hasta')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Inicio')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Fin')),
+                ('creado_por', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='importaciones_leads', to=settings.AUTH_USER_MODEL, verbose_name='Creado por')),
+                ('operador_default', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='importaciones', to='callcenter.operador', verbose_name='Operador por defecto')),
+            ],
+            options={
+                'verbose_name': 'Importación de leads',
+                'verbose_name_plural': 'Importaciones de leads',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['estado', 'created_at'], name='callcenter__estado_73ed26_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+from django.db import migrations
+
+from subscriptions.phone import backfill_phone_columns
+
+
+def backfill_lead_telefono(apps, schema_editor):
+    """
+    Rellena las columnas normalizadas agregadas en 0002: sin ellas los mensajes
+    entrantes crean leads duplicados en lugar de encontrar los existentes
+    """
+    Lead = apps.get_model('callcenter', 'Lead')
+    backfill_phone_columns(Lead.objects.filter(telefono_e164=''), 'telefono', 'telefono_e164', 'telefono_clave')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callcenter', '0004_importjob'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_lead_telefono, migrations.RunPython.noop),
+    ]
@@ -4,11 +4,17 @@ Gestión de leads, conversaciones, productos de telecomunicaciones y ventas
 """
 
 from django.db import models
+from django.db.models import F, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.utils import timezone
 from django.core.validators import MinValueValidator, MaxValueValidator
 from decimal import Decimal
 
+from subscriptions.phone import normalize_phone, phone_key
+
 
 class Operador(models.Model):
     """Operadores de telecomunicaciones (Claro, Movistar, etc.)"""
@@ -196,6 +202,23 @@ class Lead(models.Model):
     nombre = models.CharField(max_length=100, verbose_name='Nombre')
     apellido = models.CharField(max_length=100, verbose_name='Apellido')
     telefono = models.CharField(max_length=20, verbose_name='Teléfono', db_index=True)
+    telefono_e164 = models.CharField(
+        max_length=16,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name='Teléfono E.164'
+    )
+    telefono_clave = models.CharField(
+        max_length=9,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name='Clave de Teléfono',
+        help_text='Últimos 9 dígitos, para coincidir con o sin código de país'
+    )
     email = models.EmailField(blank=True, null=True, verbose_name='Email')
     direccion = models.TextField(blank=True, verbose_name='Dirección')
     zona = models.CharField(max_length=100, blank=True, verbose_name='Zona/Distrito')
@@ -293,6 +316,17 @@ class Lead(models.Model):
         blank=True,
         verbose_name='Última Interacción'
     )
+    # Contadores mantenidos al crear/borrar conversaciones y llamadas (ver reconcile_lead_counters)
+    num_conversaciones = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Conversaciones'
+    )
+    num_llamadas = models.PositiveIntegerField(
+        default=0,
+        editable=False,
+        verbose_name='Llamadas'
+    )
     proxima_accion = models.TextField(
         blank=True,
         verbose_name='Próxima Acción Sugerida'
@@ -330,40 +364,59 @@ class Lead(models.Model):
         """Retorna el nombre completo del lead"""
         return f"{self.nombre} {self.apellido}".strip()
     
+    # Columnas que solo cambian con UPDATEs atómicos (registrar_interaccion, reconcile_counters)
+    INTERACTION_FIELDS = ('num_conversaciones', 'num_llamadas', 'ultima_interaccion')
+    
+    def save(self, *args, **kwargs):
+        # Mantener sincronizadas las columnas normalizadas del teléfono
+        self.telefono_e164 = normalize_phone(self.telefono) or ''
+        self.telefono_clave = phone_key(self.telefono)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'telefono' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'telefono_e164', 'telefono_clave'}
+        elif update_fields is None and not self._state.adding and not kwargs.get('force_insert'):
+            # Un save() completo de un lead ya guardado no escribe los contadores: sus valores
+            # en memoria pueden ser anteriores a incrementos concurrentes de las señales
+            kwargs['update_fields'] = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key and field.name not in self.INTERACTION_FIELDS
+            ]
+        super().save(*args, **kwargs)
+    
     def actualizar_score(self):
-        """Calcula y actualiza el score del lead basado en interacciones"""
-        score = 0
+        """Calcula y actualiza el score del lead basado en interacciones (ver scoring)"""
+        from .scoring import calcular_scores, clasificar
         
-        # Puntos por tener producto de interés específico
-        if self.producto_interes:
-            score += 25
-        
-        # Puntos por presupuesto definido
-        if self.presupuesto_estimado:
-            score += 20
-        
-        # Puntos por número de conversaciones
-        num_conversaciones = self.conversaciones.count()
-        score += min(num_conversaciones * 10, 30)
-        
-        # Puntos por interacciones recientes (últimas 48 horas)
-        if self.ultima_interaccion:
-            horas_desde_ultima = (timezone.now() - self.ultima_interaccion).total_seconds() / 3600
-            if horas_desde_ultima < 48:
-                score += 25
-        
-        # Limitar score entre 0 y 100
-        self.score = min(max(score, 0), 100)
-        
-        # Actualizar clasificación basada en score
-        if self.score >= 80:
-            self.clasificacion = ClasificacionLead.HOT
-        elif self.score >= 50:
-            self.clasificacion = ClasificacionLead.WARM
-        else:
-            self.clasificacion = ClasificacionLead.COLD
+        self.score = calcular_scores(
+            [self.producto_interes_id is not None],
+            [bool(self.presupuesto_estimado)],
+            [self.num_conversaciones],
+            [self.ultima_interaccion],
+        )[0]
+        self.clasificacion = clasificar(self.score)
         
         self.save(update_fields=['score', 'clasificacion'])
+    
+    @classmethod
+    def registrar_interaccion(cls, lead_id, momento, conversaciones: int = 0, llamadas: int = 0):
+        """
+        Suma conversaciones/llamadas al lead con un UPDATE atómico (F()) y
+        adelanta su última interacción a `momento` si es posterior
+        
+        Con valores negativos (borrados) los contadores no bajan de 0 y la
+        última interacción no cambia.
+        """
+        cambios = {}
+        if conversaciones:
+            cambios['num_conversaciones'] = Greatest(F('num_conversaciones') + conversaciones, 0)
+        if llamadas:
+            cambios['num_llamadas'] = Greatest(F('num_llamadas') + llamadas, 0)
+        if momento is not None and conversaciones + llamadas > 0:
+            cambios['ultima_interaccion'] = Greatest(
+                Coalesce('ultima_interaccion', Value(momento)), Value(momento)
+            )
+        if cambios:
+            cls.objects.filter(pk=lead_id).update(**cambios)
 
 
 class CanalConversacion(models.TextChoices):
@@ -682,3 +735,125 @@ class Venta(models.Model):
     def total_con_instalacion(self):
         """Calcula el total incluyendo instalación"""
         return self.precio_final + self.producto.precio_instalacion
+
+
+
+class EstadoImportacion(models.TextChoices):
+    PENDIENTE = 'PENDIENTE', 'Pendiente'
+    PROCESANDO = 'PROCESANDO', 'Procesando'
+    COMPLETADA = 'COMPLETADA', 'Completada'
+    FALLIDA = 'FALLIDA', 'Fallida'
+
+
+class ImportJob(models.Model):
+    """Importación de leads desde un archivo, procesada en segundo plano (ver import_jobs)"""
+    
+    archivo = models.FileField(upload_to='imports/leads/%Y/%m/', verbose_name='Archivo')
+    nombre_archivo = models.CharField(max_length=255, verbose_name='Nombre del archivo')
+    extension = models.CharField(max_length=10, verbose_name='Extensión')
+    operador_default = models.ForeignKey(
+        Operador,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='importaciones',
+        verbose_name='Operador por defecto'
+    )
+    creado_por = models.ForeignKey(
+        User,
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='importaciones_leads',
+        verbose_name='Creado por'
+    )
+    
+    estado = models.CharField(
+        max_length=20,
+        choices=EstadoImportacion.choices,
+        default=EstadoImportacion.PENDIENTE,
+        verbose_name='Estado'
+    )
+    
+    # Progreso (se guarda tras cada lote)
+    total_procesados = models.PositiveIntegerField(default=0, verbose_name='Filas procesadas')
+    leads_creados = models.PositiveIntegerField(default=0, verbose_name='Leads creados')
+    leads_duplicados = models.PositiveIntegerField(default=0, verbose_name='Duplicados')
+    num_errores = models.PositiveIntegerField(default=0, verbose_name='Errores')
+    filas_por_segundo = models.FloatField(default=0, verbose_name='Filas/segundo')
+    progreso = models.PositiveSmallIntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Progreso (%)',
+        help_text='Porcentaje del archivo leído (solo CSV)'
+    )
+    
+    # Resultado
+    archivo_errores = models.FileField(
+        upload_to='imports/errores/%Y/%m/',
+        blank=True,
+        verbose_name='Archivo de errores'
+    )
+    mensaje_error = models.TextField(blank=True, verbose_name='Mensaje de error')
+    
+    # Lease del worker que está procesando la importación (ver outbox.lease_rows)
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Tomado por'
+    )
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Lease hasta'
+    )
+    
+    # Control
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='Inicio')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='Fin')
+    
+    class Meta:
+        verbose_name = 'Importación de leads'
+        verbose_name_plural = 'Importaciones de leads'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['estado', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Importación #{self.pk} - {self.nombre_archivo} ({self.get_estado_display()})"
+    
+    # Campos que se guardan tras cada lote
+    PROGRESS_FIELDS = [
+        'total_procesados', 'leads_creados', 'leads_duplicados', 'num_errores',
+        'filas_por_segundo', 'progreso', 'locked_until',
+    ]
+    
+    @property
+    def terminada(self):
+        """Si la importación ya no va a avanzar (completada o fallida)"""
+        return self.estado in (EstadoImportacion.COMPLETADA, EstadoImportacion.FALLIDA)
+
+# Contadores de interacciones del lead: se mantienen al escribir para no contar al leer
+@receiver(post_save, sender=Conversacion)
+def contar_conversacion(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Lead.registrar_interaccion(instance.lead_id, instance.created_at, conversaciones=1)
+
+
+@receiver(post_delete, sender=Conversacion)
+def descontar_conversacion(sender, instance, **kwargs):
+    Lead.registrar_interaccion(instance.lead_id, None, conversaciones=-1)
+
+
+@receiver(post_save, sender=LlamadaIA)
+def contar_llamada(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        Lead.registrar_interaccion(instance.lead_id, instance.created_at, llamadas=1)
+
+
+@receiver(post_delete, sender=LlamadaIA)
+def descontar_llamada(sender, instance, **kwargs):
+    Lead.registrar_interaccion(instance.lead_id, None, llamadas=-1)
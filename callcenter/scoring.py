@@ -0,0 +1,142 @@
+"""
+Score y clasificación de leads.
+
+`Lead.actualizar_score` puntúa un lead; `rescore_leads` recalcula toda la base
+(o los leads con cambios desde `since`) sin un COUNT ni un save() por lead:
+los datos de entrada (contadores de conversaciones, última interacción,
+producto y presupuesto) salen de una consulta de columnas por página, los
+scores se calculan por columnas y solo las filas que cambiaron se escriben con
+bulk_update por lotes.
+"""
+
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Sequence
+
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+# Puntos de cada factor (máximo 100)
+PUNTOS_PRODUCTO = 25
+PUNTOS_PRESUPUESTO = 20
+PUNTOS_POR_CONVERSACION = 10
+MAX_PUNTOS_CONVERSACIONES = 30
+PUNTOS_RECIENTE = 25
+
+# Una interacción cuenta como reciente durante estas horas
+HORAS_RECIENTE = 48
+
+UMBRAL_HOT = 80
+UMBRAL_WARM = 50
+
+
+def clasificar(score: int) -> str:
+    """Clasificación (HOT, WARM o COLD) que corresponde al score"""
+    from .models import ClasificacionLead
+
+    if score >= UMBRAL_HOT:
+        return ClasificacionLead.HOT
+    if score >= UMBRAL_WARM:
+        return ClasificacionLead.WARM
+    return ClasificacionLead.COLD
+
+
+def calcular_scores(tiene_producto: Sequence[bool], tiene_presupuesto: Sequence[bool],
+                    num_conversaciones: Sequence[int], ultima_interaccion: Sequence[Optional[datetime]],
+                    ahora: Optional[datetime] = None) -> List[int]:
+    """
+    Scores de muchos leads a partir de sus columnas de entrada (misma longitud)
+
+    Args:
+        tiene_producto: Si cada lead tiene producto de interés
+        tiene_presupuesto: Si cada lead tiene presupuesto estimado
+        num_conversaciones: Conversaciones de cada lead
+        ultima_interaccion: Última interacción de cada lead (o None)
+        ahora: Referencia para las interacciones recientes (default: ahora)
+
+    Returns:
+        Score 0-100 de cada lead, en el mismo orden
+    """
+    limite_reciente = (ahora or timezone.now()) - timedelta(hours=HORAS_RECIENTE)
+    return [
+        min(
+            PUNTOS_PRODUCTO * producto
+            + PUNTOS_PRESUPUESTO * presupuesto
+            + min(conversaciones * PUNTOS_POR_CONVERSACION, MAX_PUNTOS_CONVERSACIONES)
+            + (PUNTOS_RECIENTE if ultima is not None and ultima > limite_reciente else 0),
+            100,
+        )
+        for producto, presupuesto, conversaciones, ultima in zip(
+            tiene_producto, tiene_presupuesto, num_conversaciones, ultima_interaccion
+        )
+    ]
+
+
+def rescore_leads(queryset=None, since: Optional[datetime] = None, batch_size: int = 1000,
+                  dry_run: bool = False, ahora: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Recalcula score y clasificación de los leads y guarda solo los que cambiaron
+
+    Recorre los leads por páginas de `batch_size` con keyset sobre el id; cada
+    página es una consulta de las columnas de entrada y, si hay cambios,
+    un bulk_update en su propia transacción.
+
+    Args:
+        queryset: Leads a recalcular (default: todos)
+        since: Solo leads modificados o cuya última interacción (conversaciones
+            nuevas incluidas) entró o salió de la ventana de HORAS_RECIENTE desde esa fecha
+        batch_size: Leads por página y por bulk_update
+        dry_run: Calcular sin guardar
+        ahora: Referencia para las interacciones recientes (default: ahora)
+
+    Returns:
+        Dict con leads revisados, actualizados, cambios de clasificación
+        (`transitions`, 'COLD->WARM': n), duración y leads/segundo
+    """
+    from .models import Lead
+
+    started = time.monotonic()
+    ahora = ahora or timezone.now()
+    queryset = Lead.objects.all() if queryset is None else queryset
+    if since is not None:
+        queryset = queryset.filter(
+            Q(updated_at__gte=since) | Q(ultima_interaccion__gte=since - timedelta(hours=HORAS_RECIENTE))
+        )
+    queryset = queryset.values(
+        'id', 'score', 'clasificacion', 'producto_interes_id', 'presupuesto_estimado',
+        'ultima_interaccion', 'num_conversaciones',
+    ).order_by('id')
+
+    stats = {'total': 0, 'updated': 0, 'transitions': {}}
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id)[:batch_size])
+        if not rows:
+            break
+        last_id = rows[-1]['id']
+        scores = calcular_scores(
+            [row['producto_interes_id'] is not None for row in rows],
+            [bool(row['presupuesto_estimado']) for row in rows],
+            [row['num_conversaciones'] for row in rows],
+            [row['ultima_interaccion'] for row in rows],
+            ahora,
+        )
+        changed = []
+        for row, score in zip(rows, scores):
+            clasificacion = clasificar(score)
+            if score == row['score'] and clasificacion == row['clasificacion']:
+                continue
+            changed.append(Lead(id=row['id'], score=score, clasificacion=clasificacion))
+            if clasificacion != row['clasificacion']:
+                transition = f"{row['clasificacion']}->{clasificacion}"
+                stats['transitions'][transition] = stats['transitions'].get(transition, 0) + 1
+        stats['total'] += len(rows)
+        stats['updated'] += len(changed)
+        if changed and not dry_run:
+            with transaction.atomic():
+                Lead.objects.bulk_update(changed, ['score', 'clasificacion'])
+
+    stats['elapsed'] = time.monotonic() - started
+    stats['throughput'] = stats['total'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+    return stats
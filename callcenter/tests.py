@@ -0,0 +1,156 @@
+from datetime import timedelta
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.test import TestCase
+from django.urls import reverse
+from django.utils import timezone
+
+from subscriptions.phone import backfill_phone_columns
+
+from .ai_services import KeywordMatcher
+from .counters import reconcile_counters
+from .models import CanalConversacion, Conversacion, EstadoImportacion, ImportJob, Lead, TipoConversacion
+from .views_actions import buscar_lead_por_telefono
+
+
+def make_lead(**overrides):
+    fields = {'nombre': 'Ana', 'apellido': 'Pérez', 'telefono': '0991234567', 'zona': 'Quito'}
+    fields.update(overrides)
+    return Lead.objects.create(**fields)
+
+
+def make_conversacion(lead):
+    return Conversacion.objects.create(
+        lead=lead,
+        canal=CanalConversacion.choices[0][0],
+        tipo=TipoConversacion.choices[0][0],
+        mensaje_cliente='hola',
+    )
+
+
+class LeadCountersTests(TestCase):
+    def test_conversations_update_counters(self):
+        lead = make_lead()
+        conversacion = make_conversacion(lead)
+        lead.refresh_from_db()
+        self.assertEqual(lead.num_conversaciones, 1)
+        self.assertEqual(lead.ultima_interaccion, conversacion.created_at)
+
+        conversacion.delete()
+        lead.refresh_from_db()
+        self.assertEqual(lead.num_conversaciones, 0)
+
+    def test_full_save_keeps_concurrent_increments(self):
+        lead = make_lead()
+        stale = Lead.objects.get(pk=lead.pk)
+        # Otro proceso registra una conversación mientras `stale` está en memoria
+        make_conversacion(lead)
+
+        stale.notas = 'editado'
+        stale.save()
+
+        lead.refresh_from_db()
+        self.assertEqual(lead.notas, 'editado')
+        self.assertEqual(lead.num_conversaciones, 1)
+        self.assertIsNotNone(lead.ultima_interaccion)
+
+    def test_reconcile_fixes_counters_and_last_interaction(self):
+        lead = make_lead()
+        conversacion = make_conversacion(lead)
+        # Desfase como el de datos cargados sin señales
+        Lead.objects.filter(pk=lead.pk).update(num_conversaciones=0, ultima_interaccion=None)
+
+        stats = reconcile_counters()
+
+        lead.refresh_from_db()
+        self.assertEqual(stats['fixed'], 1)
+        self.assertEqual(lead.num_conversaciones, 1)
+        self.assertEqual(lead.ultima_interaccion, conversacion.created_at)
+
+    def test_reconcile_keeps_later_manual_interaction(self):
+        lead = make_lead()
+        make_conversacion(lead)
+        later = timezone.now() + timedelta(hours=1)
+        Lead.objects.filter(pk=lead.pk).update(ultima_interaccion=later)
+
+        self.assertEqual(reconcile_counters()['fixed'], 0)
+        lead.refresh_from_db()
+        self.assertEqual(lead.ultima_interaccion, later)
+
+
+class ImportJobAccessTests(TestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user('owner', password='x')
+        self.other = User.objects.create_user('other', password='x')
+        self.staff = User.objects.create_user('staff', password='x', is_staff=True)
+        self.job = ImportJob.objects.create(
+            nombre_archivo='leads.csv', extension='csv', creado_por=self.owner,
+            estado=EstadoImportacion.COMPLETADA, num_errores=1,
+        )
+        self.job.archivo_errores.save('errores.txt', ContentFile(b'Fila 2: telefono vacio'))
+        self.addCleanup(self.job.archivo_errores.delete, save=False)
+
+    def get(self, user, name):
+        self.client.force_login(user)
+        return self.client.get(reverse(f'callcenter:{name}', args=[self.job.pk]))
+
+    def test_only_owner_and_staff_see_job(self):
+        for name in ('import_job_status', 'import_job_errors'):
+            self.assertEqual(self.get(self.owner, name).status_code, 200)
+            self.assertEqual(self.get(self.staff, name).status_code, 200)
+            self.assertEqual(self.get(self.other, name).status_code, 404)
+
+    def test_other_user_polling_does_not_start_worker(self):
+        ImportJob.objects.filter(pk=self.job.pk).update(estado=EstadoImportacion.PENDIENTE)
+        with mock.patch('callcenter.views_import.iniciar_worker_en_proceso') as iniciar:
+            self.assertEqual(self.get(self.other, 'import_job_status').status_code, 404)
+        iniciar.assert_not_called()
+
+
+class KeywordMatcherTests(TestCase):
+    def setUp(self):
+        self.matcher = KeywordMatcher({
+            'sentimiento': {'negativo': ['no', 'no me gusta'], 'positivo': ['me gusta']},
+            'tecnico': {'velocidad': ['mbps', 'vs']},
+        })
+
+    def test_phrases_match_only_whole_words(self):
+        self.assertEqual(self.matcher.buscar('Nosotros volvs'), {'sentimiento': {}, 'tecnico': {}})
+        self.assertEqual(self.matcher.buscar('no, gracias')['sentimiento'], {'negativo': {'no'}})
+
+    def test_digits_do_not_block_a_match(self):
+        self.assertEqual(self.matcher.buscar('Plan de 100Mbps')['tecnico'], {'velocidad': {'mbps'}})
+
+    def test_longest_phrase_also_counts_contained_phrases(self):
+        self.assertEqual(self.matcher.buscar('No me gusta el plan')['sentimiento'], {
+            'negativo': {'no', 'no me gusta'},
+            'positivo': {'me gusta'},
+        })
+
+    def test_batch_matches_each_text(self):
+        resultados = self.matcher.buscar_lote(['me gusta', 'nada'])
+        self.assertEqual(resultados[0]['sentimiento'], {'positivo': {'me gusta'}})
+        self.assertEqual(resultados[1]['sentimiento'], {})
+
+
+class LeadPhoneLookupTests(TestCase):
+    def test_backfill_fills_normalized_columns_of_existing_leads(self):
+        lead = make_lead(telefono='099 123 4567')
+        # Filas anteriores a las columnas normalizadas
+        Lead.objects.filter(pk=lead.pk).update(telefono_e164='', telefono_clave='')
+        self.assertIsNone(buscar_lead_por_telefono('+593991234567'))
+
+        scanned, updated = backfill_phone_columns(
+            Lead.objects.filter(telefono_e164=''), 'telefono', 'telefono_e164', 'telefono_clave'
+        )
+
+        self.assertEqual((scanned, updated), (1, 1))
+        self.assertEqual(buscar_lead_por_telefono('+593991234567'), lead)
+        self.assertEqual(buscar_lead_por_telefono('991234567'), lead)
+
+    def test_phone_without_digits_does_not_match_blank_keys(self):
+        lead = make_lead()
+        Lead.objects.filter(pk=lead.pk).update(telefono_e164='', telefono_clave='')
+        self.assertIsNone(buscar_lead_por_telefono('desconocido'))
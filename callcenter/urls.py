@@ -25,6 +25,8 @@ urlpatterns = [
     path('leads/<int:lead_id>/', views.lead_detail, name='lead_detail'),
     path('leads/<int:lead_id>/update/', views_update.update_lead, name='update_lead'),
     path('leads/import/', views_import.import_leads, name='import_leads'),
+    path('leads/import/<int:job_id>/', views_import.import_job_status, name='import_job_status'),
+    path('leads/import/<int:job_id>/errores/', views_import.import_job_errors, name='import_job_errors'),
     
     # Productos
     path('productos/', views.productos_list, name='productos_list'),
@@ -11,9 +11,10 @@ import pytz
 
 from .models import (
     Operador, Producto, Lead, Conversacion, LlamadaIA, Venta,
-    ClasificacionLead, EstadoLead, TipoServicio
+    ClasificacionLead, EstadoLead, TipoServicio, EstadoImportacion
 )
 from .ai_services import CallAI
+from .import_jobs import importaciones_visibles
 from django.views.decorators.http import require_POST
 from django.views.decorators.http import require_GET
 
@@ -180,9 +181,15 @@ def leads_list(request):
     # Obtener operadores para el filtro
     operadores = Operador.objects.all()
     
+    # Importaciones en curso del usuario (la página muestra su avance)
+    importaciones_activas = importaciones_visibles(request.user).filter(
+        estado__in=[EstadoImportacion.PENDIENTE, EstadoImportacion.PROCESANDO]
+    ).order_by('created_at').values_list('id', flat=True)
+    
     context = {
         'leads': leads,
         'operadores': operadores,
+        'importaciones_activas': list(importaciones_activas),
         'clasificacion_actual': clasificacion,
         'estado_actual': estado,
         'operador_actual': operador,
@@ -6,6 +6,7 @@ from django.http import JsonResponse
 from django.views.decorators.http import require_POST
 from django.views.decorators.csrf import csrf_exempt
 from django.contrib.auth.decorators import login_required
+from subscriptions.phone import normalize_phone, phone_key
 from .models import Lead, Conversacion, LlamadaIA
 from django.utils import timezone
 import json
@@ -67,6 +68,15 @@ def api_send_whatsapp(request, lead_id):
         }, status=500)
 
 
+def buscar_lead_por_telefono(telefono):
+    """Lead con ese teléfono (igualdad sobre las columnas normalizadas indexadas), o None"""
+    lead = Lead.objects.filter(telefono_e164=normalize_phone(telefono) or telefono).first()
+    # Sin dígitos la clave es '' y coincidiría con cualquier lead sin teléfono normalizado
+    if not lead and (key := phone_key(telefono)):
+        lead = Lead.objects.filter(telefono_clave=key).first()
+    return lead
+
+
 @csrf_exempt
 @require_POST
 def api_whatsapp_webhook(request):
@@ -88,10 +98,8 @@ def api_whatsapp_webhook(request):
                 'error': 'Datos incompletos'
             }, status=400)
         
-        # Buscar lead por teléfono
-        try:
-            lead = Lead.objects.get(telefono=telefono)
-        except Lead.DoesNotExist:
+        lead = buscar_lead_por_telefono(telefono)
+        if not lead:
             # Crear nuevo lead si no existe
             lead = Lead.objects.create(
                 telefono=telefono,
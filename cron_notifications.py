@@ -1,7 +1,7 @@
 #!/usr/bin/env python
 """
 Script para ejecutar notificaciones automáticas en Railway
-Se ejecuta como cron job
+Se ejecuta como cron job cuando no hay un proceso `notification_scheduler`
 """
 
 import os
@@ -15,34 +15,19 @@ sys.path.append(str(BASE_DIR))
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'tvservices.settings')
 django.setup()
 
-import subprocess
+from django.core.management import call_command
 from datetime import datetime
 
 def run_notifications():
-    """Ejecuta todas las notificaciones diarias"""
+    """Ejecuta todas las notificaciones diarias en una sola pasada"""
     print(f"🕘 {datetime.now().strftime('%Y-%m-%d %H:%M:%S')} - Iniciando notificaciones automáticas")
     
-    # Lista de días a notificar
-    days_to_notify = [0, 1, 3, 7]
-    
-    for days in days_to_notify:
-        try:
-            print(f"📱 Enviando notificaciones día {days}...")
-            
-            result = subprocess.run([
-                'python3', 'manage.py', 'send_expiration_notifications', 
-                '--days', str(days)
-            ], capture_output=True, text=True, timeout=300)
-            
-            if result.returncode == 0:
-                print(f"✅ Notificaciones día {days} enviadas exitosamente")
-                if result.stdout:
-                    print(f"📊 Resultado: {result.stdout.strip()}")
-            else:
-                print(f"❌ Error enviando notificaciones día {days}: {result.stderr}")
-                
-        except Exception as e:
-            print(f"❌ Error inesperado día {days}: {str(e)}")
+    try:
+        # Misma tarea que notification_scheduler, con su lock: si otra réplica
+        # (o el programador) ya ejecutó esta franja, no se repite
+        call_command('notification_scheduler', run='expiration_reminders')
+    except Exception as e:
+        print(f"❌ Error inesperado enviando notificaciones: {str(e)}")
     
     print("✅ Proceso de notificaciones completado")
 
@@ -1,10 +1,13 @@
 from django.contrib import admin
-from django.utils.html import format_html
+from django.utils import timezone
+from django.utils.html import format_html, format_html_join
+from django.utils.safestring import mark_safe
 from django.urls import reverse
 from django.utils.translation import gettext_lazy as _
 from .models import (
     Service, Subscription, Cliente, 
-    CategoriaServicio, Payment, NotificationLog
+    CategoriaServicio, Payment, NotificationLog, InboundMessage, ScheduledJob,
+    NotificationRun, OutboundLane, MessageTemplate
 )
 
 
@@ -195,12 +198,14 @@ class NotificationLogAdmin(admin.ModelAdmin):
     )
     search_fields = (
         'subscription__cliente__nombres', 'subscription__cliente__apellidos',
-        'subscription__service__nombre_mostrar', 'phone_number', 'message_content'
+        'subscription__service__nombre_mostrar', 'phone_number', 'message_content',
+        'provider_message_id'
     )
     readonly_fields = (
         'created_at', 'sent_at', 'delivered_at', 'api_response', 
         'cliente_name', 'service_name'
     )
+    raw_id_fields = ('grouped_with',)
     date_hierarchy = 'created_at'
     
     fieldsets = (
@@ -208,14 +213,14 @@ class NotificationLogAdmin(admin.ModelAdmin):
             'fields': ('subscription', 'notification_type', 'status', 'days_notice')
         }),
         ('Detalles del Envío', {
-            'fields': ('phone_number', 'message_content')
+            'fields': ('phone_number', 'message_content', 'grouped_with')
         }),
         ('Timestamps', {
-            'fields': ('created_at', 'sent_at', 'delivered_at'),
+            'fields': ('created_at', 'scheduled_for', 'sent_at', 'delivered_at'),
             'classes': ('collapse',)
         }),
         ('Metadatos', {
-            'fields': ('api_response', 'error_message', 'retry_count', 'created_by'),
+            'fields': ('api_response', 'provider_message_id', 'error_message', 'retry_count', 'created_by'),
             'classes': ('collapse',)
         }),
     )
@@ -257,6 +262,123 @@ class NotificationLogAdmin(admin.ModelAdmin):
         return request.user.is_superuser
 
 
+class InboundMessageAdmin(admin.ModelAdmin):
+    """Configuración del admin para la cola de webhooks entrantes"""
+    list_display = ('id', 'kind', 'status', 'received_at', 'processed_at', 'attempts', 'lag_display')
+    list_filter = ('kind', 'status', 'received_at')
+    readonly_fields = (
+        'payload', 'kind', 'status', 'received_at', 'processed_at', 'attempts',
+        'result', 'error_message', 'locked_by', 'locked_until'
+    )
+    date_hierarchy = 'received_at'
+    
+    def lag_display(self, obj):
+        """Retraso entre recepción y procesamiento"""
+        return f'{obj.lag_seconds:.1f}s'
+    lag_display.short_description = 'Retraso'
+    
+    def has_add_permission(self, request):
+        """Los mensajes solo llegan por el webhook"""
+        return False
+
+
+class ScheduledJobAdmin(admin.ModelAdmin):
+    """Estado de las tareas de notification_scheduler"""
+    list_display = ('name', 'last_status', 'last_scheduled_for', 'last_started_at', 'last_finished_at', 'locked_by')
+    list_filter = ('last_status',)
+    readonly_fields = (
+        'name', 'locked_by', 'locked_until', 'last_scheduled_for', 'last_started_at',
+        'last_finished_at', 'last_status', 'last_result', 'last_error'
+    )
+    
+    def has_add_permission(self, request):
+        """Las tareas se registran al ejecutarse"""
+        return False
+
+
+class NotificationRunAdmin(admin.ModelAdmin):
+    """Corridas de avisos encoladas por el endpoint de cron"""
+    list_display = ('id', 'status', 'source', 'total', 'created_at', 'started_at', 'finished_at')
+    list_filter = ('status', 'source')
+    readonly_fields = (
+        'status', 'source', 'days', 'run_date', 'created_at', 'started_at', 'finished_at', 'total',
+        'progress', 'cursor_cliente_id', 'cursor_subscription_id', 'cursor_counters', 'checkpoint_at',
+        'summary', 'error_message', 'locked_by', 'locked_until'
+    )
+    
+    def has_add_permission(self, request):
+        """Las corridas se encolan desde el endpoint de cron"""
+        return False
+
+
+class OutboundLaneAdmin(admin.ModelAdmin):
+    """Actividad y latencia de cola de los carriles de envío"""
+    list_display = ('name', 'last_active_at', 'sent', 'average_wait_seconds', 'last_p95_seconds')
+    readonly_fields = ('name', 'last_active_at', 'sent', 'wait_seconds_total', 'last_p95_seconds')
+    
+    def has_add_permission(self, request):
+        """Los carriles se registran al enviar"""
+        return False
+
+
+class MessageTemplateAdmin(admin.ModelAdmin):
+    """Textos de los mensajes de WhatsApp; los cambios llegan a los envíos sin deploy"""
+    list_display = ('notification_type', 'service', 'urgency', 'is_active', 'updated_at')
+    list_editable = ('is_active',)
+    list_filter = ('notification_type', 'urgency', 'is_active', 'service')
+    search_fields = ('body',)
+    readonly_fields = ('variables', 'preview', 'updated_at')
+    fields = ('notification_type', 'service', 'urgency', 'is_active', 'body', 'variables', 'preview', 'updated_at')
+    
+    def get_changeform_initial_data(self, request):
+        """Partir del texto por defecto del tipo elegido (?notification_type=...)"""
+        from .message_templates import DEFAULT_TEMPLATES, KIND_EXPIRATION
+        initial = super().get_changeform_initial_data(request)
+        kind = initial.get('notification_type') or KIND_EXPIRATION
+        initial.setdefault('notification_type', kind)
+        initial.setdefault('body', DEFAULT_TEMPLATES.get(kind, '').strip())
+        return initial
+    
+    def variables(self, obj):
+        """Variables disponibles según el tipo de mensaje"""
+        from .message_templates import TEMPLATE_VARIABLES
+        kind = obj.notification_type if obj and obj.pk else None
+        kinds = [kind] if kind else list(TEMPLATE_VARIABLES)
+        return format_html_join(mark_safe('<br>'), '<b>{}</b>: {}', (
+            (name, ', '.join('{{ %s }}' % variable for variable in TEMPLATE_VARIABLES[name]))
+            for name in kinds
+        ))
+    variables.short_description = 'Variables'
+    
+    def preview(self, obj):
+        """Mensaje renderizado con datos de ejemplo"""
+        from django.template import Context, TemplateSyntaxError
+        from .message_templates import (
+            KIND_EXPIRATION_COMBINED, KIND_RENEWAL, combined_context, compile_template, expiration_context,
+        )
+        if not obj or not obj.pk:
+            return '-'
+        row = {
+            'service_id': obj.service_id, 'end_date': timezone.localdate(), 'price': 15000,
+            'cliente__nombres': 'Ana', 'cliente__apellidos': 'Pérez',
+            'service__nombre_mostrar': obj.service.nombre_mostrar if obj.service_id else 'Netflix',
+        }
+        if obj.notification_type == KIND_EXPIRATION_COMBINED:
+            context = combined_context([(row, 0), (dict(row, service__nombre_mostrar='Disney+'), 3)])
+        elif obj.notification_type == KIND_RENEWAL:
+            context = {'cliente_name': 'Ana Pérez', 'service_name': row['service__nombre_mostrar'],
+                       'new_expiration': row['end_date'].strftime('%d/%m/%Y')}
+        else:
+            days = {'today': 0, 'tomorrow': 1}.get(obj.urgency, 3)
+            context = expiration_context(row, days)
+        try:
+            message = compile_template(obj.body).render(Context(context)).strip()
+        except TemplateSyntaxError as e:
+            message = f'Plantilla inválida: {e}'
+        return format_html('<pre style="white-space: pre-wrap">{}</pre>', message)
+    preview.short_description = 'Vista previa'
+
+
 # Registrar los modelos con sus respectivas configuraciones
 admin.site.register(Service, ServiceAdmin)
 admin.site.register(Subscription, SubscriptionAdmin)
@@ -264,3 +386,8 @@ admin.site.register(Cliente, ClienteAdmin)
 admin.site.register(CategoriaServicio, CategoriaServicioAdmin)
 admin.site.register(Payment, PaymentAdmin)
 admin.site.register(NotificationLog, NotificationLogAdmin)
+admin.site.register(InboundMessage, InboundMessageAdmin)
+admin.site.register(ScheduledJob, ScheduledJobAdmin)
+admin.site.register(NotificationRun, NotificationRunAdmin)
+admin.site.register(OutboundLane, OutboundLaneAdmin)
+admin.site.register(MessageTemplate, MessageTemplateAdmin)
@@ -0,0 +1,126 @@
+"""
+Circuit breaker para la API de WaSender.
+
+Cuando WaSender no responde, cada envío esperaría el timeout completo. El
+circuito se abre tras varios errores transitorios seguidos (timeouts, errores
+de conexión, 5xx) o una tasa de error alta en las últimas llamadas; mientras
+está abierto los envíos fallan de inmediato y se reprograman. Pasado
+`reset_timeout` deja pasar una sola petición de prueba (medio abierto): si
+tiene éxito el circuito se cierra, si falla vuelve a abrirse.
+"""
+
+import threading
+import time
+from collections import deque
+from typing import Any, Dict
+
+
+class CircuitBreaker:
+    """Circuit breaker thread-safe (cerrado → abierto → medio abierto → cerrado)"""
+
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, name: str = 'wasender', failure_threshold: int = 5, error_rate: float = 0.5,
+                 window_size: int = 20, reset_timeout: float = 30.0):
+        """
+        Args:
+            name: Nombre para logs y health check
+            failure_threshold: Errores seguidos que abren el circuito
+            error_rate: Fracción de errores en la ventana que abre el circuito
+            window_size: Últimas llamadas consideradas para la tasa de error
+                (la tasa solo se evalúa con la ventana llena)
+            reset_timeout: Segundos abierto antes de la petición de prueba
+        """
+        self.name = name
+        self.failure_threshold = max(1, int(failure_threshold))
+        self.error_rate = error_rate
+        self.window_size = max(1, int(window_size))
+        self.reset_timeout = reset_timeout
+        self._state = self.CLOSED
+        self._consecutive_failures = 0
+        self._window = deque(maxlen=self.window_size)
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """
+        Indica si se puede hacer la llamada; en medio abierto solo deja pasar una
+
+        Quien recibe True debe informar el resultado con record_success o
+        record_failure.
+        """
+        with self._lock:
+            if self._state == self.CLOSED:
+                return True
+            if self._state == self.OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self._state = self.HALF_OPEN
+                self._probe_in_flight = False
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def is_open(self) -> bool:
+        """True mientras el circuito esté abierto y aún no toque la petición de prueba"""
+        with self._lock:
+            return self._state == self.OPEN and time.monotonic() - self._opened_at < self.reset_timeout
+
+    def retry_in(self) -> float:
+        """Segundos que faltan para la petición de prueba (0 si no está abierto)"""
+        with self._lock:
+            if self._state != self.OPEN:
+                return 0.0
+            return max(0.0, self.reset_timeout - (time.monotonic() - self._opened_at))
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._consecutive_failures = 0
+            self._window.append(True)
+            if self._state == self.HALF_OPEN:
+                # La prueba funcionó: cerrar con la ventana limpia
+                self._state = self.CLOSED
+                self._probe_in_flight = False
+                self._window.clear()
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._consecutive_failures += 1
+            self._window.append(False)
+            if self._state == self.HALF_OPEN:
+                self._open()
+                return
+            window_full = len(self._window) == self.window_size
+            failure_rate = self._window.count(False) / len(self._window)
+            if (self._consecutive_failures >= self.failure_threshold
+                    or (window_full and failure_rate >= self.error_rate)):
+                self._open()
+
+    def trip(self) -> None:
+        """Abre el circuito sin esperar al umbral (p. ej. API key rechazada)"""
+        with self._lock:
+            self._consecutive_failures += 1
+            self._window.append(False)
+            self._open()
+
+    def _open(self) -> None:
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._probe_in_flight = False
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado actual para el health check"""
+        retry_in = self.retry_in()
+        with self._lock:
+            calls = len(self._window)
+            return {
+                'state': self._state,
+                'consecutive_failures': self._consecutive_failures,
+                'error_rate': round(self._window.count(False) / calls, 2) if calls else 0.0,
+                'recent_calls': calls,
+                'retry_in_seconds': round(retry_in, 1),
+            }
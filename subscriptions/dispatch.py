@@ -0,0 +1,248 @@
+"""
+Despacho priorizado de mensajes salientes de WhatsApp.
+
+Las respuestas del bot, los recordatorios manuales y los envíos masivos usan
+el mismo presupuesto de mensajes por segundo de WaSender. `LaneDispatcher`
+separa el tráfico en carriles (interactive > manual > bulk): cada carril
+tiene su token bucket y recibe una parte del ritmo total proporcional a su
+peso entre los carriles activos. Si solo hay envíos masivos usan todo el
+ritmo; cuando llega una conversación, el carril interactivo se queda con la
+mayor parte hasta que pasa LANE_ACTIVE_SECONDS sin tráfico.
+
+Los carriles corren en procesos distintos (web, inbound, worker, scheduler):
+cada LANE_SYNC_SECONDS un hilo del despachador publica en `OutboundLane` los
+carriles activos de su proceso y sus contadores, y lee los de los demás.
+También mide la latencia de cola de cada carril (desde que el mensaje quedó
+listo para enviarse hasta que obtuvo turno).
+"""
+
+import logging
+import threading
+import time
+from collections import deque
+from datetime import timedelta
+from typing import Any, Dict, Optional
+
+from django.conf import settings
+from django.db import connection
+from django.db.models import F
+from django.utils import timezone
+
+from .throttling import TokenBucket
+
+logger = logging.getLogger(__name__)
+
+LANE_INTERACTIVE = 'interactive'
+LANE_MANUAL = 'manual'
+LANE_BULK = 'bulk'
+
+# En orden de prioridad
+LANES = (LANE_INTERACTIVE, LANE_MANUAL, LANE_BULK)
+
+DEFAULT_LANE_WEIGHTS = {LANE_INTERACTIVE: 6, LANE_MANUAL: 3, LANE_BULK: 1}
+
+
+def _percentile(values, percent: float) -> float:
+    """Percentil por rango más cercano"""
+    if not values:
+        return 0.0
+    values = sorted(values)
+    index = max(0, min(len(values) - 1, int(round(percent / 100 * len(values))) - 1))
+    return values[index]
+
+
+class LaneDispatcher:
+    """Reparto thread-safe de un ritmo de envío entre carriles con peso"""
+
+    def __init__(self, rate: float, burst: int = 1, weights: Optional[Dict[str, int]] = None,
+                 active_seconds: float = 30.0, sync_seconds: float = 5.0, window_size: int = 200):
+        """
+        Args:
+            rate: Mensajes por segundo entre todos los carriles
+            burst: Ráfaga máxima de cada carril
+            weights: Peso de cada carril (default: DEFAULT_LANE_WEIGHTS)
+            active_seconds: Segundos sin tráfico tras los que un carril deja de contar
+            sync_seconds: Cada cuántos segundos publicar y leer los carriles activos
+                de otros procesos en OutboundLane (0 = solo este proceso)
+            window_size: Últimas latencias consideradas para p50/p95
+        """
+        if rate <= 0:
+            raise ValueError('rate debe ser mayor que 0')
+        self.rate = float(rate)
+        self.burst = burst
+        self.weights = {lane: max(1, int((weights or DEFAULT_LANE_WEIGHTS).get(lane, 1))) for lane in LANES}
+        self.active_seconds = active_seconds
+        self.sync_seconds = sync_seconds
+        self._buckets = {lane: TokenBucket(rate, burst) for lane in LANES}
+        self._last_seen = {lane: 0.0 for lane in LANES}
+        self._remote_active = set()
+        self._waiting = {lane: 0 for lane in LANES}
+        self._sent = {lane: 0 for lane in LANES}
+        self._latencies = {lane: deque(maxlen=window_size) for lane in LANES}
+        # Contadores aún no publicados en OutboundLane
+        self._unsynced = {}
+        self._sync_thread = None
+        self._lock = threading.Lock()
+
+    def configure(self, rate: float, burst: Optional[int] = None) -> None:
+        """
+        Cambia el ritmo total y la ráfaga de todos los carriles
+
+        Lo usan los comandos con --rate/--burst: el despachador sigue siendo el
+        único límite de ritmo del proceso.
+        """
+        if rate <= 0:
+            raise ValueError('rate debe ser mayor que 0')
+        burst = burst or self.burst
+        with self._lock:
+            self.rate = float(rate)
+            self.burst = burst
+            # Los envíos que ya esperan turno terminan con el bucket anterior
+            self._buckets = {lane: TokenBucket(rate, burst) for lane in LANES}
+
+    def _active_lanes(self, now: float) -> set:
+        active = {lane for lane, seen in self._last_seen.items() if now - seen < self.active_seconds}
+        active.update(lane for lane, waiting in self._waiting.items() if waiting)
+        return active | self._remote_active
+
+    def share(self, lane: str) -> float:
+        """Fracción del ritmo total que le corresponde hoy a `lane`"""
+        with self._lock:
+            active = self._active_lanes(time.monotonic()) | {lane}
+        return self.weights[lane] / sum(self.weights[name] for name in active)
+
+    def acquire(self, lane: str, queued_at=None) -> float:
+        """
+        Bloquea hasta que `lane` tenga turno
+
+        Args:
+            lane: Carril del mensaje (LANES)
+            queued_at: Desde cuándo espera el mensaje (datetime); si falta, la
+                latencia medida es solo la espera por el turno
+
+        Returns:
+            Latencia de cola en segundos
+        """
+        if lane not in self._buckets:
+            raise ValueError(f'Carril desconocido: {lane!r}')
+        started = time.monotonic()
+        with self._lock:
+            self._last_seen[lane] = started
+            self._waiting[lane] += 1
+            self._unsynced.setdefault(lane, {'sent': 0, 'wait': 0.0})
+        self._start_sync()
+        bucket = self._buckets[lane]
+        try:
+            while True:
+                # El reparto se recalcula en cada espera: cambia cuando otro carril se activa o se apaga
+                bucket.set_rate(self.rate * self.share(lane))
+                wait = bucket.try_acquire()
+                if wait == 0:
+                    break
+                time.sleep(min(wait, 1.0))
+        finally:
+            with self._lock:
+                self._waiting[lane] -= 1
+        latency = time.monotonic() - started
+        if queued_at is not None:
+            latency = max(latency, (timezone.now() - queued_at).total_seconds())
+        with self._lock:
+            self._last_seen[lane] = time.monotonic()
+            self._sent[lane] += 1
+            self._latencies[lane].append(latency)
+            # La sincronización pudo vaciar los contadores mientras se esperaba el turno
+            unsynced = self._unsynced.setdefault(lane, {'sent': 0, 'wait': 0.0})
+            unsynced['sent'] += 1
+            unsynced['wait'] += latency
+        return latency
+
+    def _start_sync(self) -> None:
+        if self.sync_seconds <= 0 or self._sync_thread is not None:
+            return
+        with self._lock:
+            if self._sync_thread is None:
+                self._sync_thread = threading.Thread(target=self._sync_loop, name='lane-sync', daemon=True)
+                self._sync_thread.start()
+
+    def _sync_loop(self) -> None:
+        while True:
+            time.sleep(self.sync_seconds)
+            try:
+                self.sync()
+            except Exception as e:
+                logger.warning(f'No se pudieron sincronizar los carriles de envío: {e}')
+            finally:
+                # Conexión propia de este hilo: no retenerla entre sincronizaciones
+                connection.close()
+
+    def sync(self) -> None:
+        """Publica los carriles activos de este proceso y lee los de los demás"""
+        from .models import OutboundLane
+
+        now = timezone.now()
+        with self._lock:
+            unsynced, self._unsynced = self._unsynced, {}
+            # Un carril que sigue esperando turno también está activo aunque no haya enviado
+            for lane, waiting in self._waiting.items():
+                if waiting:
+                    unsynced.setdefault(lane, {'sent': 0, 'wait': 0.0})
+            snapshot = {lane: _percentile(self._latencies[lane], 95) for lane in unsynced}
+        for lane, counters in unsynced.items():
+            OutboundLane.objects.get_or_create(name=lane)
+            OutboundLane.objects.filter(name=lane).update(
+                last_active_at=now,
+                sent=F('sent') + counters['sent'],
+                wait_seconds_total=F('wait_seconds_total') + counters['wait'],
+                last_p95_seconds=snapshot[lane],
+            )
+        remote = set(
+            OutboundLane.objects.filter(last_active_at__gte=now - timedelta(seconds=self.active_seconds))
+            .values_list('name', flat=True)
+        )
+        with self._lock:
+            self._remote_active = remote & set(LANES)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Reparto y latencia de cola de cada carril en este proceso, para el health check"""
+        now = time.monotonic()
+        with self._lock:
+            active = self._active_lanes(now)
+            total_weight = sum(self.weights[lane] for lane in active) or 1
+            return {
+                lane: {
+                    'weight': self.weights[lane],
+                    'active': lane in active,
+                    'rate': round(self.rate * self.weights[lane] / total_weight, 3) if lane in active else self.rate,
+                    'waiting': self._waiting[lane],
+                    'sent': self._sent[lane],
+                    'latency_p50_seconds': round(_percentile(self._latencies[lane], 50), 3),
+                    'latency_p95_seconds': round(_percentile(self._latencies[lane], 95), 3),
+                }
+                for lane in LANES
+            }
+
+
+_dispatcher = None
+_dispatcher_lock = threading.Lock()
+
+
+def get_dispatcher() -> LaneDispatcher:
+    """
+    Despachador compartido por todo el proceso
+
+    Se configura con OUTBOUND_RATE_PER_SECOND, OUTBOUND_BURST, LANE_WEIGHTS,
+    LANE_ACTIVE_SECONDS y LANE_SYNC_SECONDS de NOTIFICATION_SETTINGS.
+    """
+    global _dispatcher
+    if _dispatcher is None:
+        with _dispatcher_lock:
+            if _dispatcher is None:
+                notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+                _dispatcher = LaneDispatcher(
+                    rate=notification_settings.get('OUTBOUND_RATE_PER_SECOND', 0.2),
+                    burst=notification_settings.get('OUTBOUND_BURST', 1),
+                    weights=notification_settings.get('LANE_WEIGHTS', DEFAULT_LANE_WEIGHTS),
+                    active_seconds=notification_settings.get('LANE_ACTIVE_SECONDS', 30),
+                    sync_seconds=notification_settings.get('LANE_SYNC_SECONDS', 5),
+                )
+    return _dispatcher
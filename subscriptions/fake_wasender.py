@@ -0,0 +1,168 @@
+"""
+Servidor HTTP local que imita la API de WaSender.
+
+Permite medir el throughput de las notificaciones sin gastar créditos de
+WhatsApp: responde `POST /api/send-message` como WaSender (`{'success': True,
+'data': {'msgId': ..., 'status': 'in_progress'}}`) con una latencia simulada y,
+de forma configurable, errores 500 y respuestas 429 (por fracción de
+peticiones o al superar un límite de mensajes por segundo).
+
+Uso en proceso (ver `benchmark_notifications`):
+
+    with FakeWaSenderServer(latency=0.2, error_rate=0.05) as server:
+        settings.WASENDER_API_URL = server.url
+
+o como proceso aparte con `python manage.py run_fake_wasender`.
+"""
+
+import itertools
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Iterable, Optional
+
+from .throttling import TokenBucket
+
+SEND_MESSAGE_PATH = '/api/send-message'
+
+
+class FakeWaSenderHandler(BaseHTTPRequestHandler):
+    """Atiende send-message según la configuración del servidor"""
+
+    server_version = 'FakeWaSender/1.0'
+
+    def do_POST(self):
+        server = self.server
+        length = int(self.headers.get('Content-Length', 0) or 0)
+        body = self.rfile.read(length)
+
+        if self.path.split('?', 1)[0] != SEND_MESSAGE_PATH:
+            self._reply(404, {'success': False, 'message': 'Not found'})
+            return
+        authorization = self.headers.get('Authorization', '')
+        if not authorization.startswith('Bearer '):
+            self._reply(401, {'success': False, 'message': 'Unauthenticated'})
+            return
+        if authorization[len('Bearer '):] in server.disconnected_keys:
+            self._reply(403, {'success': False, 'message': 'Session is not connected'})
+            return
+        try:
+            payload = json.loads(body or b'{}')
+        except ValueError:
+            self._reply(400, {'success': False, 'message': 'Invalid JSON'})
+            return
+        if not payload.get('to') or not payload.get('text'):
+            self._reply(422, {'success': False, 'message': 'The to and text fields are required'})
+            return
+
+        server.wait_latency()
+        status, response = server.next_response()
+        self._reply(status, response)
+
+    def _reply(self, status: int, response: Dict[str, Any]) -> None:
+        self.server.count(status)
+        body = json.dumps(response).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        # Sin una línea por petición en la consola
+        pass
+
+
+class FakeWaSenderServer(ThreadingHTTPServer):
+    """
+    Servidor falso de WaSender que corre en un hilo de fondo
+
+    Args:
+        host: Interfaz donde escuchar
+        port: Puerto (0 = elegir uno libre)
+        latency: Segundos que tarda cada respuesta
+        jitter: Variación aleatoria de la latencia (fracción, 0.2 = ±20%)
+        error_rate: Fracción de peticiones que responden 500
+        throttle_rate: Fracción de peticiones que responden 429
+        max_per_second: Límite de mensajes por segundo; por encima responde 429
+            (None = sin límite)
+        disconnected_keys: API keys cuya sesión simula estar desconectada (403)
+    """
+
+    daemon_threads = True
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.1, jitter: float = 0.2,
+                 error_rate: float = 0.0, throttle_rate: float = 0.0, max_per_second: Optional[float] = None,
+                 disconnected_keys: Iterable[str] = ()):
+        super().__init__((host, port), FakeWaSenderHandler)
+        self.latency = max(0.0, latency)
+        self.jitter = max(0.0, jitter)
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.limiter = TokenBucket(max_per_second, max(1, int(max_per_second))) if max_per_second else None
+        self.disconnected_keys = set(disconnected_keys)
+        self._message_ids = itertools.count(1)
+        self._stats = {'requests': 0, 'sent': 0, 'errors': 0, 'throttled': 0, 'rejected': 0}
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        """URL base para WASENDER_API_URL"""
+        host, port = self.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def wait_latency(self) -> None:
+        """Simula el tiempo de respuesta de WaSender"""
+        if self.latency:
+            time.sleep(self.latency * (1 + self.jitter * (2 * random.random() - 1)))
+
+    def next_response(self):
+        """Decide la respuesta de un envío: 429, 500 o éxito con un msgId nuevo"""
+        if self.limiter is not None and self.limiter.try_acquire() > 0:
+            return 429, {'success': False, 'message': 'Too many requests'}
+        roll = random.random()
+        if roll < self.throttle_rate:
+            return 429, {'success': False, 'message': 'Too many requests'}
+        if roll < self.throttle_rate + self.error_rate:
+            return 500, {'success': False, 'message': 'Internal server error'}
+        return 200, {'success': True, 'data': {'msgId': next(self._message_ids), 'status': 'in_progress'}}
+
+    def count(self, status: int) -> None:
+        with self._lock:
+            self._stats['requests'] += 1
+            if status == 200:
+                self._stats['sent'] += 1
+            elif status == 429:
+                self._stats['throttled'] += 1
+            elif status >= 500:
+                self._stats['errors'] += 1
+            else:
+                self._stats['rejected'] += 1
+
+    def stats(self) -> Dict[str, int]:
+        """Contadores de peticiones atendidas por tipo de respuesta"""
+        with self._lock:
+            return dict(self._stats)
+
+    def start(self) -> 'FakeWaSenderServer':
+        """Atiende peticiones en un hilo de fondo"""
+        self._thread = threading.Thread(target=self.serve_forever, name='fake-wasender', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self.shutdown()
+        self.server_close()
+        if self._thread is not None:
+            self._thread.join()
+
+    def __enter__(self) -> 'FakeWaSenderServer':
+        return self.start()
+
+    def __exit__(self, *exc_info) -> None:
+        self.stop()
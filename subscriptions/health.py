@@ -43,4 +43,45 @@ def health_check(request):
         results['checks']['stripe'] = f'error: {str(e)}'
         results['status'] = 'error'
     
+    # Sesiones de WaSender: circuit breaker de cada una (estado en este proceso)
+    try:
+        from .sessions import get_session_pool
+        circuit = get_session_pool().snapshot()
+        results['wasender_circuit'] = circuit
+        results['checks']['wasender'] = 'ok' if circuit['state'] == 'closed' else f"circuit_{circuit['state']}"
+    except Exception as e:
+        logger.error(f"Error consultando las sesiones de WaSender: {str(e)}")
+        results['checks']['wasender'] = 'error'
+    
+    # Carriles de envío: reparto y latencia de cola en este proceso, y acumulado de todos los procesos
+    try:
+        from .dispatch import get_dispatcher
+        from .models import OutboundLane
+        results['outbound_lanes'] = {
+            'process': get_dispatcher().snapshot(),
+            'totals': {
+                lane.name: {
+                    'sent': lane.sent,
+                    'average_wait_seconds': round(lane.average_wait_seconds, 3),
+                    'last_p95_seconds': round(lane.last_p95_seconds, 3),
+                    'last_active_at': lane.last_active_at,
+                }
+                for lane in OutboundLane.objects.all()
+            },
+        }
+    except Exception as e:
+        logger.error(f"Error consultando los carriles de envío: {str(e)}")
+        results['checks']['outbound_lanes'] = 'error'
+    
+    # Cola de webhooks entrantes: profundidad y retraso del mensaje más antiguo
+    try:
+        from .inbound import queue_stats
+        inbound = queue_stats()
+        max_lag = getattr(settings, 'NOTIFICATION_SETTINGS', {}).get('INBOUND_MAX_LAG_SECONDS', 120)
+        results['inbound_queue'] = inbound
+        results['checks']['inbound_queue'] = 'ok' if inbound['oldest_pending_seconds'] <= max_lag else 'lagging'
+    except Exception as e:
+        logger.error(f"Error consultando la cola de mensajes entrantes: {str(e)}")
+        results['checks']['inbound_queue'] = 'error'
+    
     return JsonResponse(results)
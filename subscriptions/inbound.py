@@ -0,0 +1,379 @@
+"""
+Procesamiento de mensajes entrantes de WhatsApp (webhooks de WaSender).
+
+`handle_wasender_webhook` solo guarda el payload crudo como `InboundMessage`
+y responde 200. Los workers de `process_inbound_messages` toman lotes de la
+cola con el mismo lease del outbox, buscan o crean el `Cliente`, ejecutan
+`WhatsAppBotIA` y envían la respuesta.
+
+Los recibos de entrega/lectura se encolan igual pero como tipo RECEIPT: se
+aplican por lotes grandes, cruzando `NotificationLog.provider_message_id` con
+una sola consulta y un `UPDATE ... WHERE id IN (...)` por estado.
+"""
+
+import logging
+from datetime import timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Min, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .dispatch import LANE_INTERACTIVE
+from .outbox import lease_rows
+from .phone import normalize_phone, phone_key
+from .throttling import backoff_delay
+
+logger = logging.getLogger(__name__)
+
+
+def get_max_attempts() -> int:
+    """Intentos antes de dar un mensaje entrante por fallido (INBOUND_MAX_ATTEMPTS)"""
+    notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+    return notification_settings.get('INBOUND_MAX_ATTEMPTS', 3)
+
+
+def extract_message(payload: Dict[str, Any]) -> Tuple[str, str]:
+    """
+    Extrae teléfono y texto de un payload de WaSender (tolerante a distintos formatos)
+
+    Returns:
+        Tupla (teléfono sin normalizar, texto)
+    """
+    text = ''
+    phone = ''
+
+    # Campos comunes
+    for key in ('text', 'message', 'body', 'text_body'):
+        if key in payload and payload.get(key):
+            text = payload.get(key)
+            break
+
+    # Estructuras como messages: [{ 'text': { 'body': '...' } }]
+    if not text and isinstance(payload.get('messages'), list) and payload['messages']:
+        m = payload['messages'][0]
+        if isinstance(m.get('text'), dict):
+            text = m['text'].get('body', '')
+        else:
+            text = m.get('text') or m.get('body') or ''
+
+    # Números posibles
+    for key in ('from', 'from_number', 'wa_id', 'sender', 'phone', 'msisdn'):
+        if key in payload and payload.get(key):
+            phone = str(payload.get(key))
+            break
+
+    return phone, text if isinstance(text, str) else str(text)
+
+
+# Eventos de WaSender que informan cambios de estado de mensajes enviados
+RECEIPT_EVENTS = ('messages.update', 'message.update', 'message-receipt.update', 'message.status')
+
+# Códigos de estado de WhatsApp (3 = entregado, 4 = leído, 5 = reproducido) y sus nombres
+RECEIPT_STATUS_CODES = {3: 'delivered', 4: 'read', 5: 'read'}
+RECEIPT_STATUS_NAMES = {
+    'delivered': 'delivered', 'delivery_ack': 'delivered',
+    'read': 'read', 'played': 'read',
+}
+
+# Segundos de espera antes de reintentar un recibo que aún no coincide con ningún
+# NotificationLog (el id del proveedor se guarda al vaciar el lote de resultados)
+RECEIPT_RETRY_SECONDS = 60
+
+
+def _receipt_status(value) -> Optional[str]:
+    """Convierte el estado de un recibo ('read', 4, '3', ...) a 'delivered'/'read'"""
+    if isinstance(value, str) and value.isdigit():
+        value = int(value)
+    if isinstance(value, int):
+        return RECEIPT_STATUS_CODES.get(value)
+    if isinstance(value, str):
+        return RECEIPT_STATUS_NAMES.get(value.lower())
+    return None
+
+
+def extract_receipts(payload: Dict[str, Any]) -> List[Tuple[List[str], str]]:
+    """
+    Extrae los recibos de entrega/lectura de un payload de WaSender
+
+    Returns:
+        Lista de (ids candidatos del mensaje, 'delivered' | 'read'); vacía si
+        el payload no es un recibo
+    """
+    data = payload.get('data')
+    if payload.get('event') in RECEIPT_EVENTS:
+        items = data if isinstance(data, list) else [data if isinstance(data, dict) else payload]
+    elif payload.get('status') is not None and (payload.get('msgId') or payload.get('messageId')):
+        items = [payload]
+    else:
+        return []
+
+    receipts = []
+    for item in items:
+        if not isinstance(item, dict):
+            continue
+        key = item.get('key') if isinstance(item.get('key'), dict) else {}
+        update = item.get('update') if isinstance(item.get('update'), dict) else {}
+        ids = [
+            str(value) for value in (item.get('msgId'), item.get('messageId'), item.get('id'), key.get('id'))
+            if value not in (None, '')
+        ]
+        status = _receipt_status(update.get('status', item.get('status')))
+        if ids and status:
+            receipts.append((ids, status))
+    return receipts
+
+
+def get_inbound_kind(payload: Dict[str, Any]) -> str:
+    """Tipo de InboundMessage para un payload (recibo o mensaje)"""
+    from .models import InboundMessage
+
+    if extract_receipts(payload):
+        return InboundMessage.InboundKind.RECEIPT
+    return InboundMessage.InboundKind.MESSAGE
+
+
+def apply_receipts(inbound_messages, chunk_size: int = 500) -> Dict[str, int]:
+    """
+    Aplica un lote de recibos a NotificationLog con UPDATEs agrupados
+
+    Una consulta resuelve todos los ids del proveedor y, por estado, un
+    `UPDATE ... WHERE id IN (...)` cada `chunk_size` registros. Nunca se
+    retrocede de estado (un recibo de entrega no pisa uno de lectura).
+    Los recibos sin coincidencia se reintentan tras RECEIPT_RETRY_SECONDS
+    hasta agotar INBOUND_MAX_ATTEMPTS.
+
+    Returns:
+        Dict con delivered, read (filas actualizadas) y unmatched (recibos)
+    """
+    from .models import NotificationLog
+
+    parsed = [(message, extract_receipts(message.payload or {})) for message in inbound_messages]
+    provider_ids = {provider_id for _, receipts in parsed for ids, _ in receipts for provider_id in ids}
+    # Un recordatorio agrupado por cliente tiene varios registros con el mismo id del proveedor
+    log_ids = {}
+    if provider_ids:
+        for provider_id, log_id in (
+            NotificationLog.objects.filter(provider_message_id__in=provider_ids)
+            .values_list('provider_message_id', 'id')
+        ):
+            log_ids.setdefault(provider_id, []).append(log_id)
+
+    # Estado final por registro: 'read' gana sobre 'delivered'
+    targets = {}
+    stats = {'delivered': 0, 'read': 0, 'unmatched': 0}
+    for message, receipts in parsed:
+        matched = unmatched = 0
+        for ids, status in receipts:
+            matched_ids = next((log_ids[provider_id] for provider_id in ids if provider_id in log_ids), None)
+            if matched_ids is None:
+                unmatched += 1
+                continue
+            matched += 1
+            for log_id in matched_ids:
+                if targets.get(log_id) != 'read':
+                    targets[log_id] = status
+        stats['unmatched'] += unmatched
+        if unmatched and not matched and message.attempts + 1 < get_max_attempts():
+            defer(message, 'Recibo sin NotificationLog coincidente', RECEIPT_RETRY_SECONDS)
+        else:
+            mark_processed(message, {'matched': matched, 'unmatched': unmatched})
+
+    now = timezone.now()
+    Status = NotificationLog.NotificationStatus
+    delivered_ids = [log_id for log_id, status in targets.items() if status == 'delivered']
+    read_ids = [log_id for log_id, status in targets.items() if status == 'read']
+    for offset in range(0, len(delivered_ids), chunk_size):
+        stats['delivered'] += NotificationLog.objects.filter(
+            id__in=delivered_ids[offset:offset + chunk_size], status=Status.SENT
+        ).update(status=Status.DELIVERED, delivered_at=now)
+    for offset in range(0, len(read_ids), chunk_size):
+        stats['read'] += NotificationLog.objects.filter(
+            id__in=read_ids[offset:offset + chunk_size], status__in=[Status.SENT, Status.DELIVERED]
+        ).update(status=Status.READ, delivered_at=Coalesce('delivered_at', Value(now)))
+    return stats
+
+
+def find_or_create_cliente(clean_phone: str):
+    """
+    Busca el Cliente por teléfono normalizado (igualdad indexada) o crea uno temporal
+
+    Args:
+        clean_phone: Teléfono en formato E.164 (puede ser vacío)
+    """
+    from django.contrib.auth import get_user_model
+    from .models import Cliente
+
+    cliente = None
+    if clean_phone:
+        cliente = Cliente.objects.filter(telefono_e164=clean_phone).first()
+        if not cliente and (key := phone_key(clean_phone)):
+            cliente = Cliente.objects.filter(telefono_clave=key).first()
+
+    if not cliente:
+        # Crear cliente temporal asignado al primer superuser o primer usuario
+        User = get_user_model()
+        admin = User.objects.filter(is_superuser=True).first() or User.objects.first()
+        cliente = Cliente.objects.create(
+            creado_por=admin,
+            nombres='WhatsApp',
+            apellidos='Usuario',
+            telefono=clean_phone
+        )
+    return cliente
+
+
+class LeadProxy:
+    """Objeto ligero con la interfaz de Lead que usa WhatsAppBotIA, a partir de un Cliente"""
+
+    def __init__(self, cliente):
+        self.nombre = cliente.nombres or cliente.nombre_completo
+        # Campos que usa la IA; mantener None si no existen
+        self.producto_interes = None
+        self.tipo_servicio_interes = None
+        self.presupuesto_estimado = None
+        self.zona = cliente.direccion or None
+        self.direccion = cliente.direccion or None
+        self.num_conversaciones = 0
+
+    def get_tipo_servicio_interes_display(self):
+        return self.tipo_servicio_interes or ''
+
+
+def analyze_batch(inbound_messages) -> List[Dict[str, Any]]:
+    """Análisis de texto del bot (intenciones, sentimiento, etc.) de todo un lote de una vez"""
+    from callcenter.ai_services import analizar_lote
+
+    return analizar_lote(
+        extract_message(inbound_message.payload or {})[1] or '' for inbound_message in inbound_messages
+    )
+
+
+def process_inbound_message(inbound_message, analisis: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Ejecuta el bot para un mensaje entrante y envía la respuesta
+
+    Args:
+        inbound_message: InboundMessage tomado por el worker
+        analisis: Análisis del texto ya calculado con analyze_batch
+
+    Returns:
+        Dict con el resultado de la IA y del envío (se guarda en `result`)
+
+    Raises:
+        Exception: si falla la búsqueda del cliente o la IA (el mensaje se reintenta)
+    """
+    from callcenter.ai_services import WhatsAppBotIA
+    from .services import WhatsAppService
+
+    phone, text = extract_message(inbound_message.payload or {})
+    clean_phone = normalize_phone(phone) or ''
+
+    cliente = find_or_create_cliente(clean_phone)
+    ia_result = WhatsAppBotIA().procesar_mensaje(LeadProxy(cliente), text or '', analisis)
+
+    respuesta_text = ia_result.get('respuesta') if isinstance(ia_result, dict) else str(ia_result)
+    send_result = WhatsAppService().send_message(
+        clean_phone, respuesta_text, lane=LANE_INTERACTIVE, queued_at=inbound_message.received_at
+    )
+    logger.info(f'Mensaje entrante #{inbound_message.pk} procesado. Envío a {clean_phone}: {send_result}')
+
+    return {
+        'cliente_id': cliente.pk,
+        'sent': send_result.get('success', False),
+        'send_error': send_result.get('error'),
+        'ia_result': ia_result,
+    }
+
+
+def mark_processed(inbound_message, result: Dict[str, Any]) -> None:
+    """Registra en memoria el procesamiento exitoso (se persiste con flush_results)"""
+    from .models import InboundMessage
+
+    inbound_message.status = InboundMessage.InboundStatus.PROCESSED
+    inbound_message.processed_at = timezone.now()
+    inbound_message.attempts += 1
+    inbound_message.result = result
+    inbound_message.error_message = None
+    inbound_message.locked_by = ''
+    inbound_message.locked_until = None
+
+
+def mark_failed(inbound_message, error_message: str) -> None:
+    """
+    Registra en memoria un intento fallido
+
+    Mientras queden intentos el mensaje sigue PENDING y se reintenta con la
+    misma espera exponencial que el outbox (RETRY_BASE_SECONDS,
+    RETRY_MAX_SECONDS), para que un mensaje que siempre falla no ocupe a los
+    workers; al agotarlos queda FAILED.
+    """
+    from .models import InboundMessage
+    from .services import NotificationService
+
+    if inbound_message.attempts + 1 < get_max_attempts():
+        policy = NotificationService.get_retry_policy()
+        delay = backoff_delay(inbound_message.attempts, policy['base_seconds'], policy['max_seconds'])
+        defer(inbound_message, error_message, delay)
+        return
+    inbound_message.attempts += 1
+    inbound_message.error_message = error_message
+    inbound_message.locked_by = ''
+    inbound_message.locked_until = None
+    inbound_message.status = InboundMessage.InboundStatus.FAILED
+    inbound_message.processed_at = timezone.now()
+
+
+def defer(inbound_message, error_message: str, delay_seconds: float) -> None:
+    """Devuelve el mensaje a la cola para reintentarlo dentro de `delay_seconds`"""
+    inbound_message.attempts += 1
+    inbound_message.error_message = error_message
+    inbound_message.locked_by = ''
+    # Con el lease vencido en el futuro ningún worker lo toma antes de tiempo
+    inbound_message.locked_until = timezone.now() + timedelta(seconds=delay_seconds)
+
+
+def lease_inbound_messages(worker_id: str, batch_size: int = 20, lease_seconds: Optional[int] = None,
+                           kind: Optional[str] = None):
+    """Toma un lote de mensajes entrantes PENDING (opcionalmente de un tipo), en orden de llegada"""
+    from .models import InboundMessage
+
+    queryset = InboundMessage.objects.filter(status=InboundMessage.InboundStatus.PENDING)
+    if kind:
+        queryset = queryset.filter(kind=kind)
+    return list(
+        lease_rows(queryset, worker_id, batch_size, lease_seconds, order_by=('received_at', 'id'))
+    )
+
+
+def flush_results(inbound_messages) -> None:
+    """Persiste los resultados de un lote con un solo bulk_update"""
+    from .models import InboundMessage
+
+    if inbound_messages:
+        InboundMessage.objects.bulk_update(inbound_messages, InboundMessage.RESULT_FIELDS)
+
+
+def queue_stats() -> Dict[str, Any]:
+    """
+    Profundidad y retraso de la cola de mensajes entrantes
+
+    Returns:
+        Dict con pending, failed, oldest_pending_seconds (retraso del mensaje
+        más antiguo sin procesar) y processed_last_hour
+    """
+    from .models import InboundMessage
+
+    now = timezone.now()
+    pending = InboundMessage.objects.filter(status=InboundMessage.InboundStatus.PENDING)
+    oldest = pending.aggregate(oldest=Min('received_at'))['oldest']
+    return {
+        'pending': pending.count(),
+        'failed': InboundMessage.objects.filter(status=InboundMessage.InboundStatus.FAILED).count(),
+        'oldest_pending_seconds': round((now - oldest).total_seconds(), 1) if oldest else 0.0,
+        'processed_last_hour': InboundMessage.objects.filter(
+            status=InboundMessage.InboundStatus.PROCESSED,
+            processed_at__gte=now - timedelta(hours=1),
+        ).count(),
+    }
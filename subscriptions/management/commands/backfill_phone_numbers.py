@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand, CommandError
+from callcenter.models import Lead
+from subscriptions.models import Cliente, NotificationLog
+from subscriptions.phone import backfill_phone_columns
+import time
+
+
+class Command(BaseCommand):
+    help = ('Rellena las columnas de teléfono normalizado (E.164 y últimos 9 dígitos) '
+            'de Cliente, Lead y NotificationLog, por lotes. Las migraciones ya las rellenan '
+            'al agregarlas; sirve para recalcularlas (--all) si cambian las reglas de normalización')
+
+    # (modelo, campo origen, campo E.164, campo clave)
+    TARGETS = [
+        (Cliente, 'telefono', 'telefono_e164', 'telefono_clave'),
+        (Lead, 'telefono', 'telefono_e164', 'telefono_clave'),
+        (NotificationLog, 'phone_number', 'phone_e164', 'phone_key'),
+    ]
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Filas leídas y actualizadas por lote (default: 1000)'
+        )
+        parser.add_argument(
+            '--all',
+            action='store_true',
+            help='Recalcular también las filas que ya tienen el teléfono normalizado'
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        if batch_size < 1:
+            raise CommandError('--batch-size debe ser >= 1')
+
+        for model, source, e164_field, key_field in self.TARGETS:
+            started = time.monotonic()
+            scanned, updated = self._backfill(model, source, e164_field, key_field, batch_size, options['all'])
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'✓ {model._meta.verbose_name_plural}: {updated} actualizados '
+                    f'de {scanned} revisados ({time.monotonic() - started:.1f}s)'
+                )
+            )
+
+    def _backfill(self, model, source, e164_field, key_field, batch_size, recompute):
+        """Sin --all solo revisa las filas que aún no tienen el teléfono normalizado"""
+        queryset = model.objects.all()
+        if not recompute:
+            queryset = queryset.filter(**{e164_field: ''})
+        return backfill_phone_columns(queryset, source, e164_field, key_field, batch_size)
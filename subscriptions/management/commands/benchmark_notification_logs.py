@@ -0,0 +1,99 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from datetime import date, timedelta
+from subscriptions.models import Cliente, Service, Subscription
+from subscriptions.services import notification_service
+import time
+
+
+class Command(BaseCommand):
+    help = ('Compara consultas y tiempo de persistir N NotificationLog uno a uno '
+            '(create + save) frente a bulk_create + bulk_update. No deja datos en la base.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=10000,
+            help='Número de notificaciones a simular (default: 10000)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Tamaño de lote del modo batch (default: LOG_BATCH_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        batch_size = options['batch_size'] or notification_service.get_batch_size()
+        if count < 1 or batch_size < 1:
+            raise CommandError('--count y --batch-size deben ser >= 1')
+
+        self.stdout.write(f'📊 Simulando {count} notificaciones (lote de {batch_size})...\n')
+
+        # Todo ocurre dentro de una transacción que se revierte al final
+        with transaction.atomic():
+            subscription = self._create_fixture()
+            days = (subscription.end_date - date.today()).days
+
+            before = self._measure(lambda: self._persist_one_by_one(subscription, days, count))
+            after = self._measure(lambda: self._persist_in_batches(subscription, days, count, batch_size))
+
+            transaction.set_rollback(True)
+
+        self.stdout.write('='*50)
+        self.stdout.write(f'{"Modo":<22}{"Consultas":>12}{"Tiempo":>12}')
+        self.stdout.write('='*50)
+        self.stdout.write(f'{"Uno a uno":<22}{before[0]:>12}{before[1]:>11.2f}s')
+        self.stdout.write(f'{"bulk_create/update":<22}{after[0]:>12}{after[1]:>11.2f}s')
+        self.stdout.write('-'*50)
+        self.stdout.write(
+            self.style.SUCCESS(
+                f'Consultas por notificación: {before[0] / count:.2f} → {after[0] / count:.4f}'
+            )
+        )
+
+    def _measure(self, func):
+        """Cuenta las consultas ejecutadas (sin el límite de connection.queries) y el tiempo"""
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            started = time.monotonic()
+            func()
+            elapsed = time.monotonic() - started
+        return queries[0], elapsed
+
+    def _create_fixture(self):
+        user = User.objects.create(username=f'benchmark-{time.time_ns()}')
+        cliente = Cliente.objects.create(
+            creado_por=user, nombres='Benchmark', apellidos='Cliente', telefono='+593999999999'
+        )
+        service = Service.objects.create(
+            nombre=f'benchmark-{time.time_ns()}', nombre_mostrar='Benchmark', precio_base=10
+        )
+        return Subscription.objects.create(
+            cliente=cliente, service=service, price=10, end_date=date.today() + timedelta(days=1)
+        )
+
+    def _persist_one_by_one(self, subscription, days, count):
+        """Camino anterior: NotificationLog.objects.create + mark_as_sent() con save() completo"""
+        for _ in range(count):
+            notification_log = notification_service.create_expiration_log(subscription, days)
+            notification_log.mark_as_sent({'success': True})
+
+    def _persist_in_batches(self, subscription, days, count, batch_size):
+        """Camino por lotes: bulk_create de los PENDING y bulk_update de los resultados"""
+        for offset in range(0, count, batch_size):
+            notification_logs = [
+                notification_service.build_expiration_log(subscription, days)
+                for _ in range(min(batch_size, count - offset))
+            ]
+            notification_service.create_logs(notification_logs, batch_size)
+            for notification_log in notification_logs:
+                notification_log.mark_as_sent({'success': True}, commit=False)
+            notification_service.flush_results(notification_logs, batch_size)
@@ -0,0 +1,242 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.test.utils import override_settings
+from datetime import date, timedelta
+from subscriptions.dispatch import LANE_BULK, LaneDispatcher
+from subscriptions.fake_wasender import FakeWaSenderServer
+from subscriptions.models import Cliente, Service, Subscription
+from subscriptions.phone import normalize_phone, phone_key
+from subscriptions.services import NotificationService
+import threading
+import time
+
+
+class Command(BaseCommand):
+    help = ('Mide el envío de notificaciones de vencimiento de punta a punta contra un WaSender '
+            'falso local: mensajes/segundo, latencia p50/p95 y consultas por mensaje. '
+            'No deja datos en la base.')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--count',
+            type=int,
+            default=500,
+            help='Suscripciones por vencer a simular (default: 500)'
+        )
+        parser.add_argument(
+            '--services-per-client',
+            type=int,
+            default=1,
+            help='Suscripciones por vencer de cada cliente; con más de una se agrupan (default: 1)'
+        )
+        parser.add_argument(
+            '--days',
+            type=int,
+            action='append',
+            help='Horizontes de aviso entre los que repartir los vencimientos; repetible '
+                 '(default: EXPIRATION_DAYS_NOTICE)'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Número de envíos simultáneos (default: SEND_CONCURRENCY)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            help='Mensajes por segundo del despachador de envíos (default: OUTBOUND_RATE_PER_SECOND)'
+        )
+        parser.add_argument(
+            '--burst',
+            type=int,
+            help='Ráfaga máxima de cada carril (default: OUTBOUND_BURST)'
+        )
+        parser.add_argument(
+            '--no-limit',
+            action='store_true',
+            help='Enviar sin despachador ni límite de ritmo (mide el techo del emisor)'
+        )
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.2,
+            help='Latencia del WaSender falso en segundos (default: 0.2)'
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0.2,
+            help='Variación aleatoria de la latencia, como fracción (default: 0.2)'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Fracción de envíos que responden 500 (default: 0)'
+        )
+        parser.add_argument(
+            '--throttle-rate',
+            type=float,
+            default=0.0,
+            help='Fracción de envíos que responden 429 (default: 0)'
+        )
+        parser.add_argument(
+            '--server-max-per-second',
+            type=float,
+            help='Límite de mensajes por segundo del WaSender falso; por encima responde 429'
+        )
+
+    def handle(self, *args, **options):
+        count = options['count']
+        service = NotificationService()
+        send_options = service.get_send_options()
+        concurrency = options['concurrency'] or send_options['concurrency']
+        rate = options['rate'] or send_options['rate']
+        burst = options['burst'] or send_options['burst']
+        per_client = options['services_per_client']
+        if count < 1 or per_client < 1 or concurrency < 1 or rate <= 0 or burst < 1:
+            raise CommandError('--count, --services-per-client, --concurrency y --burst deben ser >= 1 '
+                               'y --rate mayor que 0')
+        if not 0 <= options['error_rate'] + options['throttle_rate'] <= 1:
+            raise CommandError('--error-rate + --throttle-rate debe estar entre 0 y 1')
+
+        days_list = sorted(set(options['days'])) if options['days'] else service.get_notice_days()
+        self.stdout.write(
+            f'📊 {count} notificaciones | Concurrencia: {concurrency} | '
+            f'Ritmo: {"sin límite" if options["no_limit"] else f"{rate:g} msg/s (ráfaga {burst})"}'
+        )
+        self.stdout.write(
+            f'🧪 WaSender falso: latencia {options["latency"]:g}s ±{options["jitter"]:.0%} | '
+            f'500: {options["error_rate"]:.0%} | 429: {options["throttle_rate"]:.0%}\n'
+        )
+
+        server = FakeWaSenderServer(
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            max_per_second=options['server_max_per_second'],
+        )
+        with server, override_settings(WASENDER_API_URL=server.url, WASENDER_API_KEY='benchmark'):
+            # Todo ocurre dentro de una transacción que se revierte al final
+            with transaction.atomic():
+                today = date.today()
+                bench_service = self._create_fixture(count, per_client, days_list, today)
+                # El servicio se crea dentro del override para que apunte al servidor falso
+                service = NotificationService()
+                # Despachador propio (único límite de ritmo), sin sincronizar carriles con otros procesos
+                service.whatsapp.dispatcher = (
+                    None if options['no_limit'] else LaneDispatcher(rate, burst, sync_seconds=0)
+                )
+                latencies = self._time_sends(service)
+
+                subscriptions = service.get_expiring_subscriptions(days_list, today).filter(service=bench_service)
+                queries, stats = self._measure(lambda: service.send_expiration_batch(
+                    ((subscription, (subscription.end_date - today).days) for subscription in subscriptions),
+                    concurrency=concurrency,
+                    today=today,
+                ))
+
+                transaction.set_rollback(True)
+        lanes = service.whatsapp.dispatcher.snapshot() if service.whatsapp.dispatcher else None
+        self._report(stats, queries, sorted(latencies), server.stats(), service.whatsapp.sessions.snapshot(), lanes)
+
+    def _create_fixture(self, count, per_client, days_list, today):
+        """Clientes con teléfono y `per_client` suscripciones cada uno, repartidas entre los horizontes"""
+        user = User.objects.create(username=f'benchmark-{time.time_ns()}')
+        bench_service = Service.objects.create(
+            nombre=f'benchmark-{time.time_ns()}', nombre_mostrar='Benchmark', precio_base=10
+        )
+        clientes = []
+        for i in range(-(-count // per_client)):
+            telefono = f'09{i:08d}'
+            clientes.append(Cliente(
+                creado_por=user, nombres=f'Benchmark {i}', apellidos='Cliente', telefono=telefono,
+                telefono_e164=normalize_phone(telefono) or '', telefono_clave=phone_key(telefono),
+            ))
+        clientes = Cliente.objects.bulk_create(clientes, batch_size=1000)
+        Subscription.objects.bulk_create([
+            Subscription(
+                cliente=clientes[i // per_client], service=bench_service, price=10, start_date=today,
+                end_date=today + timedelta(days=days_list[i % len(days_list)]),
+            )
+            for i in range(count)
+        ], batch_size=1000)
+        return bench_service
+
+    def _time_sends(self, service):
+        """
+        Envuelve la petición HTTP de send_message para medir la latencia de cada
+        llamada a WaSender, sin la espera por turno en el despachador (esa se
+        informa aparte como latencia de cola)
+        """
+        latencies = []
+        lock = threading.Lock()
+        post_message = service.whatsapp._post_message
+
+        def timed_post(*args, **kwargs):
+            started = time.monotonic()
+            try:
+                return post_message(*args, **kwargs)
+            finally:
+                with lock:
+                    latencies.append(time.monotonic() - started)
+
+        service.whatsapp._post_message = timed_post
+        return latencies
+
+    def _measure(self, func):
+        """Cuenta las consultas del hilo que escribe en la base (los hilos del pool solo hacen HTTP)"""
+        queries = [0]
+
+        def count_queries(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        with connection.execute_wrapper(count_queries):
+            result = func()
+        return queries[0], result
+
+    @staticmethod
+    def _percentile(values, percent):
+        """Percentil por rango más cercano de una lista ordenada"""
+        if not values:
+            return 0.0
+        index = max(0, min(len(values) - 1, int(round(percent / 100 * len(values))) - 1))
+        return values[index]
+
+    def _report(self, stats, queries, latencies, server_stats, circuit, lanes):
+        total = stats['total'] or 1
+        self.stdout.write('='*50)
+        self.stdout.write('BENCHMARK DE NOTIFICACIONES')
+        self.stdout.write('='*50)
+        self.stdout.write(f'Notificaciones: {stats["total"]} ({stats["sent"]} enviadas, '
+                          f'{stats["failed"]} errores, {stats["skipped"]} omitidas)')
+        self.stdout.write(f'Mensajes de WhatsApp: {stats["messages"]}')
+        self.stdout.write(f'Duración: {stats["elapsed"]:.2f}s')
+        self.stdout.write(
+            f'Throughput: {stats["messages"] / stats["elapsed"] if stats["elapsed"] else 0:.2f} msg/s '
+            f'({stats["throughput"]:.2f} notificaciones/s)'
+        )
+        self.stdout.write(
+            f'Latencia de envío: p50 {self._percentile(latencies, 50) * 1000:.0f}ms | '
+            f'p95 {self._percentile(latencies, 95) * 1000:.0f}ms | '
+            f'máx {(latencies[-1] if latencies else 0) * 1000:.0f}ms'
+        )
+        if lanes:
+            bulk = lanes[LANE_BULK]
+            self.stdout.write(
+                f'Latencia de cola (carril {LANE_BULK}): p50 {bulk["latency_p50_seconds"] * 1000:.0f}ms | '
+                f'p95 {bulk["latency_p95_seconds"] * 1000:.0f}ms'
+            )
+        self.stdout.write(f'Consultas: {queries} ({queries / total:.3f} por notificación)')
+        self.stdout.write('-'*50)
+        self.stdout.write(
+            f'WaSender falso: {server_stats["requests"]} peticiones | {server_stats["sent"]} 200 | '
+            f'{server_stats["errors"]} 500 | {server_stats["throttled"]} 429'
+        )
+        self.stdout.write(f'Circuito: {circuit["state"]}')
+        for name, session in circuit['sessions'].items():
+            self.stdout.write(f'   • {name}: {session["state"]} (tasa de error {session["error_rate"]:.0%})')
+        self.stdout.write(self.style.SUCCESS('\n✓ Datos del benchmark revertidos'))
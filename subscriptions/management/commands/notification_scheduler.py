@@ -0,0 +1,143 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from subscriptions import runs, scheduler
+from subscriptions.models import NotificationRun, ScheduledJob
+from subscriptions.outbox import make_worker_id
+import logging
+import signal
+import threading
+
+logger = logging.getLogger('subscriptions.management')
+
+class Command(BaseCommand):
+    help = ('Ejecuta en este proceso las tareas programadas de notificaciones (SCHEDULER_JOBS), '
+            'con un lock en la base para que solo una réplica ejecute cada franja, y las corridas '
+            'encoladas por el endpoint de cron')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--tick',
+            type=float,
+            default=30.0,
+            help='Cada cuántos segundos revisar las tareas vencidas (default: 30)'
+        )
+        parser.add_argument(
+            '--run',
+            choices=sorted(scheduler.JOBS),
+            help='Ejecutar ahora esta tarea (con el mismo lock) y terminar'
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='Mostrar las tareas programadas y su última ejecución'
+        )
+
+    def handle(self, *args, **options):
+        try:
+            jobs = scheduler.get_scheduled_jobs()
+        except ValueError as e:
+            raise CommandError(str(e))
+        if options['tick'] <= 0:
+            raise CommandError('--tick debe ser mayor que 0')
+
+        if options['list']:
+            self._list_jobs(jobs)
+            return
+
+        owner = make_worker_id('scheduler')
+        if options['run']:
+            now = timezone.now().replace(second=0, microsecond=0)
+            self._run(options['run'], now, owner)
+            return
+
+        self.stop_event = threading.Event()
+        # Railway detiene los procesos con SIGTERM: terminar la tarea en curso y salir
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop_event.set())
+
+        self.stdout.write(self.style.SUCCESS(f'🤖 Programador de notificaciones iniciado ({owner})'))
+        for name, schedule in jobs.items():
+            self.stdout.write(f'   • {schedule.expression:<16} {name}')
+
+        # Franjas que vencieron mientras el proceso estaba detenido (ver SCHEDULER_MISFIRE_SECONDS)
+        last_checks = scheduler.get_catch_up_since(jobs, timezone.now())
+        try:
+            # Una corrida diaria que quedó a medias (proceso caído o fallida) se retoma desde su cursor
+            self._resume_interrupted(owner)
+            while not self.stop_event.is_set():
+                now = timezone.now()
+                for name, schedule in jobs.items():
+                    ticks = schedule.due_ticks(last_checks[name], now)
+                    if ticks:
+                        # Si el proceso estuvo ocupado varias franjas, se ejecuta solo la última
+                        self._run(name, ticks[-1], owner)
+                    last_checks[name] = now
+                self._run_queued(owner)
+                self.stop_event.wait(options['tick'])
+        except KeyboardInterrupt:
+            pass
+        finally:
+            connection.close()
+        self.stdout.write(self.style.WARNING('\n🛑 Programador de notificaciones detenido'))
+
+    def _run(self, name, scheduled_for, owner):
+        """Ejecuta una franja de la tarea y muestra el resultado"""
+        local = timezone.localtime(scheduled_for)
+        self.stdout.write(f'🕘 {local:%d/%m/%Y %H:%M} - {name}')
+        outcome = scheduler.run_job(name, scheduled_for, owner)
+        if outcome is None:
+            self.stdout.write(f'⏭️ {name}: ya la ejecuta o ejecutó otra réplica')
+        elif 'error' in outcome:
+            self.stdout.write(self.style.ERROR(f'✗ {name}: {outcome["error"]}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ {name}: {self._summarize(outcome["result"])}'))
+
+    def _run_queued(self, owner):
+        """
+        Ejecuta una por vez las corridas que encoló el endpoint de cron y las de
+        hoy cuyo proceso murió (se retoman desde su checkpoint)
+        """
+        while not self.stop_event.is_set():
+            run = runs.lease_run(owner)
+            if run is None:
+                return
+            self._execute_run(run)
+
+    def _resume_interrupted(self, owner):
+        """Retoma la corrida de hoy que quedó a medias, también si terminó FAILED"""
+        run = runs.lease_interrupted_run(owner)
+        if run is not None:
+            self._execute_run(run)
+
+    def _execute_run(self, run):
+        resumed = ' retomada desde su checkpoint' if run.started_at else ''
+        self.stdout.write(f'📨 Corrida #{run.pk} ({run.source}){resumed}')
+        summary = runs.execute_run(run)
+        if run.status == NotificationRun.RunStatus.FAILED:
+            self.stdout.write(self.style.ERROR(f'✗ Corrida #{run.pk}: {run.error_message}'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'✓ Corrida #{run.pk}: {self._summarize(summary)}'))
+
+    @staticmethod
+    def _summarize(result):
+        """Resumen de una línea de los contadores del resultado"""
+        if not isinstance(result, dict):
+            return 'completada'
+        counters = [
+            f'{key}={value}' for key, value in result.items()
+            if isinstance(value, int) and not isinstance(value, bool)
+        ]
+        return ', '.join(counters) or 'completada'
+
+    def _list_jobs(self, jobs):
+        states = {job.name: job for job in ScheduledJob.objects.filter(name__in=list(jobs))}
+        self.stdout.write(f'{"Tarea":<24}{"Cron":<18}{"Último estado":<16}Última franja')
+        self.stdout.write('-'*76)
+        for name, schedule in jobs.items():
+            state = states.get(name)
+            last = (
+                f'{timezone.localtime(state.last_scheduled_for):%d/%m/%Y %H:%M}'
+                if state and state.last_scheduled_for else '-'
+            )
+            status = state.get_last_status_display() if state and state.last_status else 'sin ejecutar'
+            self.stdout.write(f'{name:<24}{schedule.expression:<18}{status:<16}{last}')
@@ -0,0 +1,188 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from subscriptions import inbound
+from subscriptions.models import InboundMessage
+from subscriptions.outbox import get_lease_seconds, make_worker_id
+from subscriptions.sessions import get_session_pool
+import logging
+import threading
+import time
+
+logger = logging.getLogger('subscriptions.management')
+
+class Command(BaseCommand):
+    help = ('Procesa la cola de webhooks entrantes de WaSender (InboundMessage): ejecuta el bot, '
+            'envía la respuesta y reporta profundidad y retraso de la cola')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=4,
+            help='Número de workers (hilos) en este proceso (default: 4)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=10,
+            help='Mensajes tomados por lease (default: 10)'
+        )
+        parser.add_argument(
+            '--receipt-batch-size',
+            type=int,
+            default=500,
+            help='Recibos de entrega/lectura aplicados por lote (default: 500)'
+        )
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            help='Duración del lease de cada lote (default: OUTBOX_LEASE_SECONDS)'
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=1.0,
+            help='Segundos de espera cuando la cola está vacía (default: 1)'
+        )
+        parser.add_argument(
+            '--stats-interval',
+            type=float,
+            default=60.0,
+            help='Cada cuántos segundos mostrar profundidad y retraso de la cola (default: 60)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Terminar cuando la cola quede vacía en lugar de seguir esperando'
+        )
+
+    def handle(self, *args, **options):
+        workers = options['workers']
+        if workers < 1 or options['batch_size'] < 1 or options['receipt_batch_size'] < 1:
+            raise CommandError('--workers, --batch-size y --receipt-batch-size deben ser >= 1')
+
+        self.lease_seconds = options['lease_seconds'] or get_lease_seconds()
+        self.batch_size = options['batch_size']
+        self.receipt_batch_size = options['receipt_batch_size']
+        self.idle_sleep = options['idle_sleep']
+        self.once = options['once']
+        self.stop_event = threading.Event()
+        self.stats_lock = threading.Lock()
+        self.stats = {'processed': 0, 'failed': 0, 'lag_total': 0.0, 'lag_max': 0.0,
+                      'delivered': 0, 'read': 0, 'unmatched': 0}
+
+        if not len(get_session_pool()):
+            # Los mensajes se procesan igual (el bot registra la conversación) pero la respuesta no sale
+            logger.warning('No hay sesiones de WaSender configuradas; las respuestas del bot no se enviarán')
+            self.stdout.write(self.style.WARNING(
+                '⚠️ No hay sesiones de WaSender configuradas: los mensajes se procesan sin enviar respuesta'
+            ))
+
+        self._report_queue()
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=self._worker_loop, args=(f'in{i}',), daemon=True)
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+
+        last_report = time.monotonic()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+                if time.monotonic() - last_report >= options['stats_interval']:
+                    self._report_queue()
+                    last_report = time.monotonic()
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\n🛑 Deteniendo workers (terminando lotes en curso)...'))
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        elapsed = time.monotonic() - started
+        processed = self.stats['processed']
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write('RESUMEN DE MENSAJES ENTRANTES')
+        self.stdout.write('='*50)
+        self.stdout.write(f'Mensajes procesados: {processed}')
+        self.stdout.write(f'Errores: {self.stats["failed"]}')
+        self.stdout.write(
+            f'Recibos aplicados: {self.stats["delivered"]} entregados, {self.stats["read"]} leídos '
+            f'({self.stats["unmatched"]} sin notificación coincidente)'
+        )
+        if processed:
+            self.stdout.write(
+                f'Retraso recepción → respuesta: promedio {self.stats["lag_total"] / processed:.2f}s, '
+                f'máximo {self.stats["lag_max"]:.2f}s'
+            )
+        self.stdout.write(f'Duración: {elapsed:.1f}s')
+        self._report_queue()
+
+    def _report_queue(self):
+        """Muestra la profundidad de la cola y el retraso del mensaje más antiguo"""
+        stats = inbound.queue_stats()
+        self.stdout.write(
+            f'📥 Cola entrante: {stats["pending"]} pendientes | '
+            f'retraso del más antiguo {stats["oldest_pending_seconds"]:.1f}s | '
+            f'{stats["processed_last_hour"]} procesados en la última hora | '
+            f'{stats["failed"]} fallidos'
+        )
+
+    def _worker_loop(self, name):
+        """Toma lotes de la cola y los procesa hasta que se pida detener (o se vacíe con --once)"""
+        worker_id = make_worker_id(name)
+        sessions = get_session_pool()
+        try:
+            while not self.stop_event.is_set():
+                # Primero los recibos, en lotes grandes y con UPDATEs agrupados
+                receipts = inbound.lease_inbound_messages(
+                    worker_id, self.receipt_batch_size, self.lease_seconds,
+                    kind=InboundMessage.InboundKind.RECEIPT
+                )
+                if receipts:
+                    receipt_stats = inbound.apply_receipts(receipts)
+                    inbound.flush_results(receipts)
+                    with self.stats_lock:
+                        for key, value in receipt_stats.items():
+                            self.stats[key] += value
+
+                # Con el circuito de WaSender abierto en todas las sesiones las respuestas
+                # no se podrían enviar: los mensajes esperan en la cola
+                batch = [] if sessions.is_open() else inbound.lease_inbound_messages(
+                    worker_id, self.batch_size, self.lease_seconds,
+                    kind=InboundMessage.InboundKind.MESSAGE
+                )
+                if not batch:
+                    if not receipts:
+                        if self.once:
+                            return
+                        self.stop_event.wait(self.idle_sleep)
+                    continue
+
+                analyses = inbound.analyze_batch(batch)
+                for inbound_message, analisis in zip(batch, analyses):
+                    try:
+                        inbound.mark_processed(
+                            inbound_message, inbound.process_inbound_message(inbound_message, analisis)
+                        )
+                    except Exception as e:
+                        logger.exception(f'Error procesando mensaje entrante #{inbound_message.pk}: {e}')
+                        inbound.mark_failed(inbound_message, str(e))
+                    with self.stats_lock:
+                        if inbound_message.processed_at and not inbound_message.error_message:
+                            lag = inbound_message.lag_seconds
+                            self.stats['processed'] += 1
+                            self.stats['lag_total'] += lag
+                            self.stats['lag_max'] = max(self.stats['lag_max'], lag)
+                        else:
+                            self.stats['failed'] += 1
+                # Un bulk_update por lote en lugar de un save() por mensaje
+                inbound.flush_results(batch)
+        except Exception as e:
+            logger.exception(f'Error en worker {worker_id}: {e}')
+            self.stderr.write(self.style.ERROR(f'✗ Worker {name} detenido por error: {e}'))
+        finally:
+            # Cada hilo abre su propia conexión; cerrarla al salir
+            connection.close()
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand, CommandError
+from subscriptions.fake_wasender import FakeWaSenderServer
+
+
+class Command(BaseCommand):
+    help = ('Levanta un servidor local que imita POST /api/send-message de WaSender, '
+            'para pruebas de carga sin gastar créditos de WhatsApp')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--host', default='127.0.0.1', help='Interfaz donde escuchar (default: 127.0.0.1)')
+        parser.add_argument('--port', type=int, default=8765, help='Puerto (default: 8765)')
+        parser.add_argument(
+            '--latency',
+            type=float,
+            default=0.2,
+            help='Segundos que tarda cada respuesta (default: 0.2)'
+        )
+        parser.add_argument(
+            '--jitter',
+            type=float,
+            default=0.2,
+            help='Variación aleatoria de la latencia, como fracción (default: 0.2)'
+        )
+        parser.add_argument(
+            '--error-rate',
+            type=float,
+            default=0.0,
+            help='Fracción de peticiones que responden 500 (default: 0)'
+        )
+        parser.add_argument(
+            '--throttle-rate',
+            type=float,
+            default=0.0,
+            help='Fracción de peticiones que responden 429 (default: 0)'
+        )
+        parser.add_argument(
+            '--max-per-second',
+            type=float,
+            help='Mensajes por segundo aceptados; por encima responde 429 (default: sin límite)'
+        )
+
+        parser.add_argument(
+            '--disconnected-key',
+            action='append',
+            help='API key de una sesión que responde 403 como desconectada; repetible'
+        )
+
+    def handle(self, *args, **options):
+        if not 0 <= options['error_rate'] + options['throttle_rate'] <= 1:
+            raise CommandError('--error-rate + --throttle-rate debe estar entre 0 y 1')
+
+        server = FakeWaSenderServer(
+            host=options['host'],
+            port=options['port'],
+            latency=options['latency'],
+            jitter=options['jitter'],
+            error_rate=options['error_rate'],
+            throttle_rate=options['throttle_rate'],
+            max_per_second=options['max_per_second'],
+            disconnected_keys=options['disconnected_key'] or (),
+        )
+        self.stdout.write(
+            self.style.SUCCESS(f'🧪 WaSender falso escuchando en {server.url} (WASENDER_API_URL={server.url})')
+        )
+        self.stdout.write(
+            f'Latencia: {options["latency"]:g}s ±{options["jitter"]:.0%} | '
+            f'500: {options["error_rate"]:.0%} | 429: {options["throttle_rate"]:.0%} | '
+            f'Límite: {options["max_per_second"] or "sin límite"} msg/s'
+        )
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+        stats = server.stats()
+        self.stdout.write(
+            f'\n🛑 Detenido. Peticiones: {stats["requests"]} | enviadas: {stats["sent"]} | '
+            f'500: {stats["errors"]} | 429: {stats["throttled"]} | rechazadas: {stats["rejected"]}'
+        )
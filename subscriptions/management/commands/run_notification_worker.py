@@ -0,0 +1,180 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from subscriptions.dispatch import LANE_BULK, get_dispatcher
+from subscriptions.outbox import (
+    get_batch_lease_seconds, lease_notifications, lease_retries, make_worker_id,
+    next_scheduled_at, pending_count, renew_lease
+)
+from subscriptions.services import notification_service
+import logging
+import threading
+import time
+
+logger = logging.getLogger('subscriptions.management')
+
+class Command(BaseCommand):
+    help = ('Drena el outbox de notificaciones (NotificationLog PENDING) y los reintentos vencidos '
+            '(FAILED con next_retry_at pasado) con N workers concurrentes')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=2,
+            help='Número de workers (hilos) en este proceso (default: 2)'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Registros tomados por lease (default: 50)'
+        )
+        parser.add_argument(
+            '--lease-seconds',
+            type=int,
+            help='Duración del lease de cada lote (default: OUTBOX_LEASE_SECONDS más lo que tarda el '
+                 'lote en salir al ritmo de envío)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            help='Mensajes por segundo de este proceso, repartidos entre los carriles de envío '
+                 '(default: OUTBOUND_RATE_PER_SECOND)'
+        )
+        parser.add_argument(
+            '--burst',
+            type=int,
+            help='Ráfaga máxima de cada carril (default: OUTBOUND_BURST)'
+        )
+        parser.add_argument(
+            '--idle-sleep',
+            type=float,
+            default=5.0,
+            help='Segundos de espera cuando el outbox está vacío (default: 5)'
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Terminar cuando no queden pendientes listos ni reintentos vencidos en lugar de seguir esperando '
+                 '(los programados para franjas futuras quedan en el outbox)'
+        )
+
+    def handle(self, *args, **options):
+        send_options = notification_service.get_send_options()
+        workers = options['workers']
+        rate = options['rate'] or send_options['rate']
+        burst = options['burst'] or send_options['burst']
+        if workers < 1 or options['batch_size'] < 1 or rate <= 0 or burst < 1:
+            raise CommandError('--workers, --batch-size y --burst deben ser >= 1 y --rate mayor que 0')
+
+        if not len(notification_service.whatsapp.sessions):
+            # Sin sesiones ningún envío puede salir: los registros quedan en el outbox
+            logger.error('No hay sesiones de WaSender configuradas; el worker no procesa el outbox')
+            self.stderr.write(self.style.ERROR(
+                '✗ No hay sesiones de WaSender configuradas (WASENDER_API_KEY o WASENDER_SESSIONS)'
+            ))
+            return
+
+        # El despachador del proceso es el único límite de ritmo: --rate/--burst lo reconfiguran
+        dispatcher = get_dispatcher()
+        if options['rate'] or options['burst']:
+            dispatcher.configure(rate, burst)
+        # Los lotes de todos los workers del proceso salen al mismo ritmo: el lease cubre el lote completo
+        self.lease_seconds = options['lease_seconds'] or get_batch_lease_seconds(
+            options['batch_size'], dispatcher.rate, workers
+        )
+        self.batch_size = options['batch_size']
+        self.idle_sleep = options['idle_sleep']
+        self.once = options['once']
+        self.stop_event = threading.Event()
+        self.stats_lock = threading.Lock()
+        self.stats = {'sent': 0, 'failed': 0, 'retried': 0}
+
+        self.stdout.write(
+            f'📤 Outbox: {pending_count(due_only=True)} mensajes listos | '
+            f'{workers} workers | {dispatcher.rate:g} msg/s | lease {self.lease_seconds}s'
+        )
+        next_slot = next_scheduled_at()
+        if next_slot:
+            self.stdout.write(
+                f'🗓️ {pending_count() - pending_count(due_only=True)} programados en la ventana de envío; '
+                f'próxima franja a las {timezone.localtime(next_slot):%H:%M}'
+            )
+
+        started = time.monotonic()
+        threads = [
+            threading.Thread(target=self._worker_loop, args=(f'w{i}',), daemon=True)
+            for i in range(workers)
+        ]
+        for thread in threads:
+            thread.start()
+        try:
+            while any(thread.is_alive() for thread in threads):
+                for thread in threads:
+                    thread.join(timeout=1)
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.WARNING('\n🛑 Deteniendo workers (terminando lotes en curso)...'))
+            self.stop_event.set()
+            for thread in threads:
+                thread.join()
+
+        elapsed = time.monotonic() - started
+        self.stdout.write('\n' + '='*50)
+        self.stdout.write('RESUMEN DEL WORKER')
+        self.stdout.write('='*50)
+        self.stdout.write(f'Notificaciones enviadas: {self.stats["sent"]}')
+        self.stdout.write(f'Errores: {self.stats["failed"]}')
+        self.stdout.write(f'Reintentos realizados: {self.stats["retried"]}')
+        self.stdout.write(f'Duración: {elapsed:.1f}s')
+        if elapsed > 0:
+            self.stdout.write(f'Throughput alcanzado: {self.stats["sent"] / elapsed:.2f} msg/s')
+        bulk = dispatcher.snapshot()[LANE_BULK]
+        self.stdout.write(
+            f'Latencia de cola (carril {LANE_BULK}): p50 {bulk["latency_p50_seconds"]:.1f}s | '
+            f'p95 {bulk["latency_p95_seconds"]:.1f}s'
+        )
+
+    def _worker_loop(self, name):
+        """Toma lotes del outbox y los envía hasta que se pida detener (o se vacíe con --once)"""
+        worker_id = make_worker_id(name)
+        try:
+            sessions = notification_service.whatsapp.sessions
+            while not self.stop_event.is_set():
+                if sessions.is_open():
+                    # WaSender caído en todas las sesiones: dejar los registros en el outbox hasta la petición de prueba
+                    self.stop_event.wait(max(sessions.retry_in(), 0.1))
+                    continue
+                batch = lease_notifications(worker_id, self.batch_size, self.lease_seconds)
+                retrying = not batch
+                if retrying:
+                    # Sin pendientes nuevos: atender los reintentos cuyo backoff ya venció
+                    batch = lease_retries(worker_id, self.batch_size, self.lease_seconds)
+                if not batch:
+                    if self.once:
+                        return
+                    self.stop_event.wait(self.idle_sleep)
+                    continue
+
+                attempted = []
+                for notification_log in batch:
+                    # Renovar el lease confirma que el registro sigue siendo de este worker; el
+                    # registro queda tomado hasta que el resultado del lote se guarde
+                    if not renew_lease(notification_log, worker_id, self.lease_seconds):
+                        logger.warning(f'Notificación {notification_log.id}: el lease pasó a otro worker, no se envía')
+                        continue
+                    result = notification_service.send_notification_log(notification_log, commit=False)
+                    attempted.append(notification_log)
+                    # Un recordatorio agrupado cuenta por cada suscripción que cubre
+                    covered = 1 + len(notification_log.group_members)
+                    with self.stats_lock:
+                        self.stats['sent' if result['success'] else 'failed'] += covered
+                        self.stats['retried'] += retrying * covered
+                # Un bulk_update por lote en lugar de un save() por registro
+                notification_service.flush_results(attempted, worker_id=worker_id)
+        except Exception as e:
+            logger.exception(f'Error en worker {worker_id}: {e}')
+            self.stderr.write(self.style.ERROR(f'✗ Worker {name} detenido por error: {e}'))
+        finally:
+            # Cada hilo abre su propia conexión; cerrarla al salir
+            connection.close()
@@ -2,10 +2,12 @@ from django.core.management.base import BaseCommand, CommandError
 from django.conf import settings
 from django.utils import timezone
 from datetime import date, timedelta
-from subscriptions.models import Subscription
+from subscriptions import runs
+from subscriptions.dispatch import get_dispatcher
+from subscriptions.models import NotificationRun
+from subscriptions.outbox import make_worker_id
 from subscriptions.services import notification_service
 import logging
-import time
 
 logger = logging.getLogger('subscriptions.management')
 
@@ -16,8 +18,9 @@ class Command(BaseCommand):
         parser.add_argument(
             '--days',
             type=int,
-            default=1,
-            help='Días antes del vencimiento para enviar notificaciones (default: 1)'
+            action='append',
+            help='Días antes del vencimiento a notificar; repetible '
+                 '(default: todos los de EXPIRATION_DAYS_NOTICE)'
         )
         parser.add_argument(
             '--dry-run',
@@ -29,6 +32,43 @@ class Command(BaseCommand):
             action='store_true',
             help='Forzar envío incluso si las notificaciones están deshabilitadas'
         )
+        parser.add_argument(
+            '--enqueue',
+            action='store_true',
+            help='Solo dejar las notificaciones en el outbox para run_notification_worker'
+        )
+        parser.add_argument(
+            '--spread',
+            action='store_true',
+            help='Encolar repartiendo los mensajes en franjas de la ventana de envío '
+                 '(SEND_WINDOW_START–SEND_WINDOW_END); implica --enqueue'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Retomar desde su último checkpoint la corrida de hoy que quedó interrumpida'
+        )
+        parser.add_argument(
+            '--no-retries',
+            action='store_true',
+            help='No ejecutar la etapa de reintentos de envíos fallidos'
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            help='Número de envíos simultáneos a WaSender (default: SEND_CONCURRENCY)'
+        )
+        parser.add_argument(
+            '--rate',
+            type=float,
+            help='Mensajes por segundo de este proceso, repartidos entre los carriles de envío '
+                 '(default: OUTBOUND_RATE_PER_SECOND)'
+        )
+        parser.add_argument(
+            '--burst',
+            type=int,
+            help='Ráfaga máxima de cada carril (default: OUTBOUND_BURST)'
+        )
 
     def handle(self, *args, **options):
         # Verificar si las notificaciones están habilitadas
@@ -39,113 +79,201 @@ class Command(BaseCommand):
             )
             return
 
-        days_notice = options['days']
         dry_run = options['dry_run']
+        send_options = notification_service.get_send_options()
+        concurrency = options['concurrency'] or send_options['concurrency']
+        rate = options['rate'] or send_options['rate']
+        burst = options['burst'] or send_options['burst']
+        if concurrency < 1 or rate <= 0 or burst < 1:
+            raise CommandError('--concurrency y --burst deben ser >= 1 y --rate mayor que 0')
+        if options['resume'] and (dry_run or options['enqueue'] or options['spread'] or options['days']):
+            raise CommandError('--resume no se combina con --dry-run, --enqueue, --spread ni --days')
         
-        # Calcular la fecha objetivo
-        target_date = date.today() + timedelta(days=days_notice)
+        run = None
+        owner = make_worker_id('command')
+        lease_seconds = runs.get_run_lease_seconds(rate)
+        if options['resume']:
+            run = runs.lease_interrupted_run(owner, lease_seconds)
+            if run is None:
+                busy = NotificationRun.objects.filter(
+                    status=NotificationRun.RunStatus.RUNNING, run_date=date.today(), locked_until__gte=timezone.now()
+                ).first()
+                if busy:
+                    # Puede seguir viva en otro proceso: se retoma cuando su lease vence sin checkpoints
+                    self.stdout.write(self.style.WARNING(
+                        f'La corrida #{busy.pk} sigue tomada por {busy.locked_by} hasta las '
+                        f'{timezone.localtime(busy.locked_until):%H:%M:%S}; reintentar después'
+                    ))
+                else:
+                    self.stdout.write(self.style.WARNING('No hay una corrida de hoy interrumpida que retomar'))
+                return
+            self.stdout.write(
+                f'↩️ Retomando la corrida #{run.pk}: {run.processed} de {run.total} suscripciones ya procesadas'
+            )
         
-        self.stdout.write(f'Buscando suscripciones que vencen el {target_date.strftime("%d/%m/%Y")}...')
+        # Horizontes de aviso: los de la corrida retomada, los indicados con --days o todos los configurados
+        if run is not None:
+            days_list = run.days or notification_service.get_notice_days()
+        else:
+            days_list = sorted(set(options['days'])) if options['days'] else notification_service.get_notice_days()
+        today = date.today()
+        target_dates = ', '.join(
+            f'{(today + timedelta(days=days)).strftime("%d/%m/%Y")} ({days}d)' for days in days_list
+        )
         
-        # Obtener suscripciones que vencen en la fecha objetivo
-        expiring_subscriptions = Subscription.objects.filter(
-            end_date=target_date,
-            is_active=True,
-            cliente__telefono__isnull=False,
-            cliente__telefono__gt='',
-            cliente__is_active=True
-        ).select_related('cliente', 'service')
+        self.stdout.write(f'Buscando suscripciones que vencen el {target_dates}...')
         
-        total_subscriptions = expiring_subscriptions.count()
+        if dry_run:
+            # Una sola consulta para todos los horizontes
+            expiring_subscriptions = list(notification_service.get_expiring_subscriptions(days_list, today))
+            for subscription in expiring_subscriptions:
+                self.stdout.write(
+                    f'[DRY RUN] Notificaría a {subscription.cliente.nombre_completo} '
+                    f'sobre {subscription.service.nombre_mostrar} '
+                    f'({(subscription.end_date - today).days} días)'
+                )
+            by_days = {}
+            for subscription in expiring_subscriptions:
+                horizon = by_days.setdefault((subscription.end_date - today).days,
+                                             {'total': 0, 'sent': 0, 'failed': 0, 'skipped': 0})
+                horizon['total'] += 1
+                horizon['sent'] += 1
+            messages = (len({subscription.cliente_id for subscription in expiring_subscriptions})
+                        if notification_service.get_coalesce_by_client() else len(expiring_subscriptions))
+            stats = {'total': len(expiring_subscriptions), 'sent': len(expiring_subscriptions), 'failed': 0,
+                     'skipped': 0, 'messages': messages, 'elapsed': 0.0, 'throughput': 0.0, 'by_days': by_days}
+        elif options['enqueue'] or options['spread']:
+            # Encolar en el outbox; los workers de run_notification_worker hacen el envío
+            queued = notification_service.enqueue_expiration_notifications(
+                days_list, today, spread=options['spread'], rate=rate
+            )
+            for days in days_list:
+                self.stdout.write(f'Día {days}: {queued["by_days"].get(days, 0)} notificaciones encoladas')
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'\n📥 {queued["total"]} notificaciones encoladas en el outbox '
+                    f'({queued["messages"]} mensajes)'
+                )
+            )
+            if queued['skipped']:
+                self.stdout.write(f'⏭️ {queued["skipped"]} omitidas (ya registradas hoy)')
+            schedule = queued['schedule']
+            if schedule and schedule['first']:
+                self.stdout.write(
+                    f'🗓️ {queued["messages"]} mensajes en {schedule["slot_count"]} franjas '
+                    f'({schedule["per_slot"]} por franja) de '
+                    f'{timezone.localtime(schedule["first"]):%H:%M} a {timezone.localtime(schedule["last"]):%H:%M}'
+                )
+                if schedule['overflow']:
+                    self.stdout.write(self.style.WARNING(
+                        '⚠️ El volumen supera la ventana de envío al ritmo configurado; '
+                        'las últimas franjas quedan fuera de ella'
+                    ))
+            elif schedule:
+                self.stdout.write(self.style.WARNING(
+                    '⚠️ La ventana de envío de hoy ya terminó; los mensajes se enviarán de inmediato'
+                ))
+            return
+        else:
+            # Enviar notificaciones con varias peticiones en vuelo, al ritmo del despachador del
+            # proceso (--rate/--burst lo reconfiguran). La corrida guarda un checkpoint por lote
+            # para poder retomarla con --resume
+            if options['rate'] or options['burst']:
+                get_dispatcher().configure(rate, burst)
+            self.stdout.write(
+                f'⚙️ Concurrencia: {concurrency} | Ritmo: {rate:g} msg/s | Ráfaga: {burst}'
+            )
+            if run is None:
+                run = runs.start_run(days_list, 'command', owner, lease_seconds)
+            stats = runs.execute_run(
+                run,
+                concurrency=concurrency,
+                on_result=self._report_result,
+                # Etapa de reintentos: fallos transitorios de corridas anteriores cuyo backoff ya venció
+                retries=not options['no_retries'],
+                lease_seconds=lease_seconds,
+            )
+            if run.status == NotificationRun.RunStatus.FAILED:
+                raise CommandError(
+                    f'La corrida #{run.pk} se interrumpió: {run.error_message}. '
+                    f'Se puede retomar con --resume'
+                )
+            retries = stats.get('retries')
+            if retries and retries['retried']:
+                self.stdout.write(
+                    f'🔁 Reintentos: {retries["retried"]} reenviados, '
+                    f'{retries["sent"]} exitosos, {retries["failed"]} fallidos'
+                )
         
+        total_subscriptions = stats['total']
         if total_subscriptions == 0:
             self.stdout.write(
-                self.style.SUCCESS(f'No hay suscripciones que venzan el {target_date.strftime("%d/%m/%Y")}')
+                self.style.SUCCESS(f'No hay suscripciones que venzan el {target_dates}')
             )
             return
         
-        self.stdout.write(f'Encontradas {total_subscriptions} suscripciones para notificar')
+        sent_count = stats['sent']
+        error_count = stats['failed']
+        skipped_count = stats['skipped']
         
-        # Contadores para estadísticas
-        sent_count = 0
-        error_count = 0
-        
-        # Enviar notificaciones
-        for subscription in expiring_subscriptions:
-            try:
-                if dry_run:
-                    self.stdout.write(
-                        f'[DRY RUN] Notificaría a {subscription.cliente.nombre_completo} '
-                        f'sobre {subscription.service.nombre_mostrar}'
-                    )
-                    sent_count += 1
-                else:
-                    # Enviar notificación real
-                    result = notification_service.send_expiration_notification(
-                        subscription, 
-                        days_notice
-                    )
-                    
-                    if result['success']:
-                        self.stdout.write(
-                            self.style.SUCCESS(
-                                f'✓ Notificación enviada a {subscription.cliente.nombre_completo} '
-                                f'({subscription.cliente.telefono})'
-                            )
-                        )
-                        sent_count += 1
-                        
-                        # Registrar la notificación (opcional: crear modelo NotificationLog)
-                        self._log_notification(subscription, days_notice, True)
-                        
-                        # Esperar 5 segundos para respetar rate limiting de WaSender API
-                        if not dry_run and sent_count < total_subscriptions:
-                            self.stdout.write(
-                                self.style.WARNING(
-                                    f'⏳ Esperando 5 segundos para respetar límites de API...'
-                                )
-                            )
-                            time.sleep(5)
-                        
-                    else:
-                        error_msg = result.get('error', 'Error desconocido')
-                        self.stdout.write(
-                            self.style.ERROR(
-                                f'✗ Error enviando a {subscription.cliente.nombre_completo}: {error_msg}'
-                            )
-                        )
-                        error_count += 1
-                        
-                        # Registrar el error
-                        self._log_notification(subscription, days_notice, False, error_msg)
-                        
-            except Exception as e:
-                self.stdout.write(
-                    self.style.ERROR(
-                        f'✗ Error inesperado con {subscription.cliente.nombre_completo}: {str(e)}'
-                    )
-                )
-                error_count += 1
-                logger.error(f'Error inesperado enviando notificación: {str(e)}')
-        
-        # Mostrar resumen
+        # Mostrar resumen combinado de todos los horizontes
         self.stdout.write('\n' + '='*50)
         self.stdout.write(f'RESUMEN DE NOTIFICACIONES')
         self.stdout.write('='*50)
+        for days in days_list:
+            horizon = stats['by_days'].get(days, {'total': 0, 'sent': 0, 'failed': 0, 'skipped': 0})
+            self.stdout.write(
+                f'Día {days}: {horizon["total"]} suscripciones, '
+                f'{horizon["sent"]} enviadas, {horizon["failed"]} errores, '
+                f'{horizon["skipped"]} omitidas'
+            )
+        self.stdout.write('-'*50)
         self.stdout.write(f'Total de suscripciones: {total_subscriptions}')
         self.stdout.write(f'Notificaciones enviadas: {sent_count}')
+        self.stdout.write(f'Mensajes de WhatsApp: {stats["messages"]} (agrupados por cliente)')
         self.stdout.write(f'Errores: {error_count}')
+        self.stdout.write(f'Omitidas (ya notificadas hoy): {skipped_count}')
+        if not dry_run:
+            if stats.get('resumed'):
+                self.stdout.write(f'Corrida #{run.pk} retomada: los totales incluyen lo enviado antes de la interrupción')
+            self.stdout.write(f'Duración: {stats["elapsed"]:.1f}s')
+            self.stdout.write(f'Throughput alcanzado: {stats["throughput"]:.2f} msg/s')
         
         if dry_run:
             self.stdout.write(self.style.WARNING('\n[MODO DE PRUEBA] No se enviaron mensajes reales'))
         
-        if error_count == 0:
+        if sent_count == 0 and error_count == 0:
+            self.stdout.write(self.style.SUCCESS('\nTodas las notificaciones de hoy ya estaban registradas'))
+        elif error_count == 0:
             self.stdout.write(self.style.SUCCESS('\n¡Todas las notificaciones se enviaron exitosamente!'))
         elif sent_count > 0:
             self.stdout.write(self.style.WARNING(f'\nSe enviaron {sent_count} notificaciones con {error_count} errores'))
         else:
             self.stdout.write(self.style.ERROR('\n¡No se pudo enviar ninguna notificación!'))
     
+    def _report_result(self, subscription, days_notice, result):
+        """Muestra y registra el resultado de cada envío a medida que termina"""
+        if result.get('skipped'):
+            self.stdout.write(
+                f'⏭️ {subscription.cliente.nombre_completo} ya fue notificado hoy ({days_notice} días); se omite'
+            )
+        elif result['success']:
+            self.stdout.write(
+                self.style.SUCCESS(
+                    f'✓ Notificación enviada a {subscription.cliente.nombre_completo} '
+                    f'({subscription.cliente.telefono})'
+                )
+            )
+            self._log_notification(subscription, days_notice, True)
+        else:
+            error_msg = result.get('error', 'Error desconocido')
+            self.stdout.write(
+                self.style.ERROR(
+                    f'✗ Error enviando a {subscription.cliente.nombre_completo}: {error_msg}'
+                )
+            )
+            self._log_notification(subscription, days_notice, False, error_msg)
+    
     def _log_notification(self, subscription, days_notice, success, error_msg=None):
         """
         Registra el resultado de la notificación en los logs
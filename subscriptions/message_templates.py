@@ -0,0 +1,310 @@
+"""
+Plantillas de los mensajes de WhatsApp, editables desde el admin.
+
+Cada `MessageTemplate` guarda el texto de un tipo de mensaje (recordatorio,
+recordatorio agrupado, confirmación de renovación), opcionalmente para un
+servicio y una urgencia concretos, con la sintaxis de plantillas de Django
+(`{{ cliente_name }}`, `{% for item in items %}`). Si no hay una plantilla
+activa que aplique se usa el texto de DEFAULT_TEMPLATES.
+
+Las plantillas se compilan una vez por proceso. La versión de la caché es la
+cantidad de plantillas y su última modificación: se consulta como mucho cada
+TEMPLATE_CHECK_SECONDS y, si cambió, se vuelven a compilar todas. Los
+mensajes se renderizan por lotes a partir de dicts planos (`subscription_row`),
+con una sola resolución de plantilla por combinación de servicio y urgencia.
+"""
+
+import logging
+import threading
+import time
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db.models import Count, Max
+from django.template import Context, Engine, TemplateSyntaxError
+
+logger = logging.getLogger(__name__)
+
+KIND_EXPIRATION = 'expiration_warning'
+KIND_EXPIRATION_COMBINED = 'expiration_combined'
+KIND_RENEWAL = 'renewal_confirmation'
+
+URGENCY_ANY = ''
+URGENCY_TODAY = 'today'
+URGENCY_TOMORROW = 'tomorrow'
+URGENCY_LATER = 'later'
+
+# Variables disponibles en cada tipo de plantilla (se muestran en el admin)
+TEMPLATE_VARIABLES = {
+    KIND_EXPIRATION: ('cliente_name', 'service_name', 'expiration_date', 'price', 'urgency', 'emoji', 'days'),
+    KIND_EXPIRATION_COMBINED: ('cliente_name', 'emoji', 'count', 'total',
+                               'items (service_name, expiration_date, price, urgency, days)'),
+    KIND_RENEWAL: ('cliente_name', 'service_name', 'new_expiration'),
+}
+
+DEFAULT_TEMPLATES = {
+    KIND_EXPIRATION: """
+{{ emoji }} *TV Services - Recordatorio de Vencimiento*
+
+Hola *{{ cliente_name }}*,
+
+Te recordamos que tu suscripción a *{{ service_name }}* vence {{ urgency }}.
+
+📋 *Detalles:*
+• Servicio: {{ service_name }}
+• Fecha de vencimiento: {{ expiration_date }}
+• Valor de renovación: ${{ price }}
+
+💡 *Para renovar tu suscripción:*
+1. Contacta con nosotros
+2. Realiza el pago correspondiente
+3. ¡Sigue disfrutando sin interrupciones!
+
+📞 ¿Necesitas ayuda? Responde a este mensaje.
+
+*TV Services* - Tu entretenimiento sin límites
+""",
+    KIND_EXPIRATION_COMBINED: """
+{{ emoji }} *TV Services - Recordatorio de Vencimiento*
+
+Hola *{{ cliente_name }}*,
+
+Te recordamos que {{ count }} de tus suscripciones están por vencer.
+
+📋 *Detalles:*
+{% for item in items %}• *{{ item.service_name }}*: vence {{ item.urgency }} ({{ item.expiration_date }}) - ${{ item.price }}
+{% endfor %}
+💰 Total a renovar: ${{ total }}
+
+💡 *Para renovar tus suscripciones:*
+1. Contacta con nosotros
+2. Realiza el pago correspondiente
+3. ¡Sigue disfrutando sin interrupciones!
+
+📞 ¿Necesitas ayuda? Responde a este mensaje.
+
+*TV Services* - Tu entretenimiento sin límites
+""",
+    KIND_RENEWAL: """
+✅ *TV Services - Renovación Confirmada*
+
+¡Hola *{{ cliente_name }}*!
+
+Tu suscripción a *{{ service_name }}* ha sido renovada exitosamente.
+
+📋 *Nueva información:*
+• Servicio: {{ service_name }}
+• Nueva fecha de vencimiento: {{ new_expiration }}
+• Estado: Activa ✅
+
+¡Gracias por confiar en nosotros! Sigue disfrutando de tu entretenimiento favorito.
+
+*TV Services* - Tu entretenimiento sin límites
+""",
+}
+
+# Los mensajes son texto plano: sin escape HTML (el Context también debe crearse con
+# autoescape=False, ver render_many)
+engine = Engine(autoescape=False)
+
+
+def compile_template(body: str):
+    """Compila el cuerpo de una plantilla (lanza TemplateSyntaxError si es inválido)"""
+    return engine.from_string(body)
+
+
+def get_urgency(days: int) -> Tuple[str, str]:
+    """Texto y emoji de urgencia según los días hasta el vencimiento"""
+    if days == 1:
+        return "¡MAÑANA!", "⚠️"
+    if days == 0:
+        return "¡HOY!", "🚨"
+    return f"en {days} días", "📅"
+
+
+def get_urgency_key(days: int) -> str:
+    """Urgencia de MessageTemplate que corresponde a `days`"""
+    if days == 0:
+        return URGENCY_TODAY
+    if days == 1:
+        return URGENCY_TOMORROW
+    return URGENCY_LATER
+
+
+def subscription_row(subscription) -> Dict[str, Any]:
+    """Campos de una Subscription (ya cargada con cliente y servicio) que usan los mensajes"""
+    return {
+        'id': subscription.id,
+        'service_id': subscription.service_id,
+        'end_date': subscription.end_date,
+        'price': subscription.price,
+        'cliente__nombres': subscription.cliente.nombres,
+        'cliente__apellidos': subscription.cliente.apellidos,
+        'service__nombre_mostrar': subscription.service.nombre_mostrar,
+    }
+
+
+def _cliente_name(row: Dict[str, Any]) -> str:
+    return f"{row['cliente__nombres']} {row['cliente__apellidos']}".strip()
+
+
+def _item_context(row: Dict[str, Any], days: int) -> Dict[str, Any]:
+    return {
+        'service_name': row['service__nombre_mostrar'],
+        'expiration_date': row['end_date'].strftime('%d/%m/%Y'),
+        'price': f"{row['price']:,.0f}",
+        'urgency': get_urgency(days)[0],
+        'days': days,
+    }
+
+
+def expiration_context(row: Dict[str, Any], days: int) -> Dict[str, Any]:
+    """Variables del recordatorio de una suscripción"""
+    context = _item_context(row, days)
+    context['cliente_name'] = _cliente_name(row)
+    context['emoji'] = get_urgency(days)[1]
+    return context
+
+
+def combined_context(items: List[Tuple[Dict[str, Any], int]]) -> Dict[str, Any]:
+    """Variables del recordatorio agrupado de las suscripciones de un cliente"""
+    return {
+        'cliente_name': _cliente_name(items[0][0]),
+        'emoji': get_urgency(min(days for _, days in items))[1],
+        'count': len(items),
+        'items': [_item_context(row, days) for row, days in items],
+        'total': f"{sum(row['price'] for row, _ in items):,.0f}",
+    }
+
+
+class MessageRenderer:
+    """Caché por proceso de las plantillas compiladas, invalidada por versión"""
+
+    def __init__(self, check_seconds: float = 30.0):
+        """
+        Args:
+            check_seconds: Cada cuántos segundos, como mucho, consultar si las
+                plantillas de la base cambiaron
+        """
+        self.check_seconds = check_seconds
+        self.version = None
+        self._checked_at = None
+        self._templates = {}
+        self._resolved = {}
+        self._defaults = {kind: compile_template(body.strip()) for kind, body in DEFAULT_TEMPLATES.items()}
+        self._lock = threading.Lock()
+
+    def invalidate(self) -> None:
+        """Fuerza la consulta de la versión en el próximo render"""
+        with self._lock:
+            self._checked_at = None
+
+    def refresh(self) -> None:
+        """Vuelve a compilar las plantillas si su versión en la base cambió"""
+        from .models import MessageTemplate
+
+        now = time.monotonic()
+        if self._checked_at is not None and now - self._checked_at < self.check_seconds:
+            return
+        state = MessageTemplate.objects.aggregate(count=Count('id'), updated=Max('updated_at'))
+        version = (state['count'], state['updated'])
+        with self._lock:
+            self._checked_at = now
+            if version == self.version:
+                return
+        templates = {}
+        rows = MessageTemplate.objects.filter(is_active=True).values(
+            'id', 'notification_type', 'service_id', 'urgency', 'body'
+        )
+        for row in rows:
+            try:
+                compiled = compile_template(row['body'].strip())
+            except TemplateSyntaxError as e:
+                logger.error(f"Plantilla de mensaje #{row['id']} inválida, se usa la anterior en prioridad: {e}")
+                continue
+            templates[(row['notification_type'], row['service_id'], row['urgency'])] = compiled
+        with self._lock:
+            self._templates = templates
+            self._resolved = {}
+            self.version = version
+
+    def resolve(self, kind: str, service_id: Optional[int] = None, urgency: str = URGENCY_ANY):
+        """
+        Plantilla compilada más específica para el tipo, servicio y urgencia
+
+        Orden: servicio y urgencia, solo servicio, solo urgencia, genérica de la
+        base y por último la de DEFAULT_TEMPLATES.
+        """
+        key = (kind, service_id, urgency)
+        resolved = self._resolved.get(key)
+        if resolved is None:
+            candidates = [(kind, service_id, urgency), (kind, service_id, URGENCY_ANY),
+                          (kind, None, urgency), (kind, None, URGENCY_ANY)]
+            resolved = next(
+                (self._templates[candidate] for candidate in candidates if candidate in self._templates),
+                self._defaults[kind],
+            )
+            self._resolved[key] = resolved
+        return resolved
+
+    def render_many(self, kind: str, items: Iterable[Tuple[Optional[int], str, Dict[str, Any]]]) -> List[str]:
+        """
+        Renderiza un lote de mensajes del mismo tipo con una sola consulta de versión
+
+        Args:
+            kind: Tipo de mensaje (KIND_*)
+            items: Tuplas (service_id, urgencia, variables) de cada mensaje
+
+        Returns:
+            Mensajes en el mismo orden
+        """
+        self.refresh()
+        return [
+            self.resolve(kind, service_id, urgency).render(Context(context, autoescape=False)).strip()
+            for service_id, urgency, context in items
+        ]
+
+    def render_expiration_groups(self, groups: Iterable[List[Tuple[Dict[str, Any], int]]]) -> List[str]:
+        """
+        Un recordatorio por grupo de pares (fila, días) de un mismo cliente:
+        individual si tiene una suscripción y agrupado si tiene varias
+        """
+        single, combined = [], []
+        for index, items in enumerate(groups):
+            if len(items) == 1:
+                row, days = items[0]
+                single.append((index, (row['service_id'], get_urgency_key(days), expiration_context(row, days))))
+            else:
+                urgency = get_urgency_key(min(days for _, days in items))
+                combined.append((index, (None, urgency, combined_context(items))))
+        messages = [None] * (len(single) + len(combined))
+        for kind, batch in ((KIND_EXPIRATION, single), (KIND_EXPIRATION_COMBINED, combined)):
+            if batch:
+                rendered = self.render_many(kind, (item for _, item in batch))
+                for (index, _), message in zip(batch, rendered):
+                    messages[index] = message
+        return messages
+
+    def render_renewal(self, row: Dict[str, Any]) -> str:
+        """Confirmación de renovación de una suscripción"""
+        context = {
+            'cliente_name': _cliente_name(row),
+            'service_name': row['service__nombre_mostrar'],
+            'new_expiration': row['end_date'].strftime('%d/%m/%Y'),
+        }
+        return self.render_many(KIND_RENEWAL, [(row['service_id'], URGENCY_ANY, context)])[0]
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_message_renderer() -> MessageRenderer:
+    """Renderer compartido por todo el proceso (TEMPLATE_CHECK_SECONDS de NOTIFICATION_SETTINGS)"""
+    global _renderer
+    if _renderer is None:
+        with _renderer_lock:
+            if _renderer is None:
+                notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+                _renderer = MessageRenderer(notification_settings.get('TEMPLATE_CHECK_SECONDS', 30))
+    return _renderer
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0004_notificationlog'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='locked_by',
+            field=models.CharField(blank=True, default='', help_text='Worker que tiene el registro PENDING en proceso de envío', max_length=100, verbose_name='Tomado por'),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='locked_until',
+            field=models.DateTimeField(blank=True, help_text='Pasada esta fecha otro worker puede volver a tomar el registro', null=True, verbose_name='Lease hasta'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0005_notificationlog_lease'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='dedup_key',
+            field=models.CharField(blank=True, help_text='Vacía para envíos manuales, que pueden repetirse', max_length=100, null=True, unique=True, verbose_name='Clave de deduplicación'),
+        ),
+    ]
@@ -0,0 +1,43 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:45
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0006_notificationlog_dedup_key'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='cliente',
+            name='telefono_clave',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, help_text='Últimos 9 dígitos, para coincidir con o sin código de país', max_length=9, verbose_name='Clave de teléfono'),
+        ),
+        migrations.AddField(
+            model_name='cliente',
+            name='telefono_e164',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=16, verbose_name='Teléfono E.164'),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='phone_e164',
+            field=models.CharField(blank=True, default='', editable=False, max_length=16, verbose_name='Teléfono E.164'),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='phone_key',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Últimos 9 dígitos del número', max_length=9, verbose_name='Clave de teléfono'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['phone_e164', 'sent_at'], name='subscriptio_phone_e_86eca2_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['phone_key', 'sent_at'], name='subscriptio_phone_k_22ca71_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0007_telefono_e164'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InboundMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('payload', models.JSONField(default=dict, help_text='Cuerpo del webhook tal como llegó', verbose_name='Payload')),
+                ('status', models.CharField(choices=[('pending', 'Pendiente'), ('processed', 'Procesado'), ('failed', 'Fallido')], default='pending', max_length=20, verbose_name='Estado')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de recepción')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Fecha de procesamiento')),
+                ('attempts', models.IntegerField(default=0, verbose_name='Intentos')),
+                ('result', models.JSONField(blank=True, help_text='Respuesta del bot y del envío a WaSender', null=True, verbose_name='Resultado')),
+                ('error_message', models.TextField(blank=True, null=True, verbose_name='Mensaje de error')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Tomado por')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Lease hasta')),
+            ],
+            options={
+                'verbose_name': 'Mensaje entrante',
+                'verbose_name_plural': 'Mensajes entrantes',
+                'ordering': ['-received_at'],
+                'indexes': [models.Index(fields=['status', 'received_at'], name='subscriptio_status_75814a_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,57 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:50
+
+from django.db import migrations, models
+
+
+def _provider_message_id(api_response):
+    # Misma lógica que NotificationLog.extract_provider_message_id
+    if not isinstance(api_response, dict):
+        return ''
+    data = api_response.get('data') if isinstance(api_response.get('data'), dict) else api_response
+    for key in ('msgId', 'messageId', 'id'):
+        if data.get(key) not in (None, ''):
+            return str(data[key])
+    return ''
+
+
+def fill_provider_message_id(apps, schema_editor):
+    """Copia el id del mensaje de api_response a la nueva columna, por lotes"""
+    NotificationLog = apps.get_model('subscriptions', 'NotificationLog')
+    queryset = NotificationLog.objects.filter(api_response__isnull=False, provider_message_id='')
+    last_id = 0
+    while True:
+        rows = list(queryset.filter(id__gt=last_id).order_by('id').only('id', 'api_response')[:1000])
+        if not rows:
+            break
+        last_id = rows[-1].id
+        changed = []
+        for row in rows:
+            row.provider_message_id = _provider_message_id(row.api_response)
+            if row.provider_message_id:
+                changed.append(row)
+        NotificationLog.objects.bulk_update(changed, ['provider_message_id'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0008_inboundmessage'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='inboundmessage',
+            name='kind',
+            field=models.CharField(choices=[('message', 'Mensaje'), ('receipt', 'Recibo de entrega/lectura')], default='message', max_length=20, verbose_name='Tipo'),
+        ),
+        migrations.AddField(
+            model_name='notificationlog',
+            name='provider_message_id',
+            field=models.CharField(blank=True, db_index=True, default='', max_length=100, verbose_name='Id del mensaje en el proveedor'),
+        ),
+        migrations.AddIndex(
+            model_name='inboundmessage',
+            index=models.Index(fields=['kind', 'status', 'received_at'], name='subscriptio_kind_e7b00c_idx'),
+        ),
+        migrations.RunPython(fill_provider_message_id, migrations.RunPython.noop),
+    ]
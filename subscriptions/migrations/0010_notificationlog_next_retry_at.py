@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:51
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0009_notificationlog_provider_message_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='next_retry_at',
+            field=models.DateTimeField(blank=True, help_text='Vacío si el error es permanente o se agotaron los reintentos', null=True, verbose_name='Próximo reintento'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['status', 'next_retry_at'], name='subscriptio_status_af2007_idx'),
+        ),
+    ]
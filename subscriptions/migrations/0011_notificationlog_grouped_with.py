@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-18 10:59
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0010_notificationlog_next_retry_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='grouped_with',
+            field=models.ForeignKey(blank=True, help_text='Registro del mensaje agrupado; vacío si este registro es el que se envía', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='grouped_logs', to='subscriptions.notificationlog', verbose_name='Enviado junto con'),
+        ),
+    ]
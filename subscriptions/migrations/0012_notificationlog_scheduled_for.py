@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:01
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0011_notificationlog_grouped_with'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationlog',
+            name='scheduled_for',
+            field=models.DateTimeField(blank=True, help_text='Vacío para enviar apenas haya un worker libre', null=True, verbose_name='Programado para'),
+        ),
+        migrations.AddIndex(
+            model_name='notificationlog',
+            index=models.Index(fields=['status', 'scheduled_for'], name='subscriptio_status_f9b03e_idx'),
+        ),
+    ]
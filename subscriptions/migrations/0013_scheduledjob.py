@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:05
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0012_notificationlog_scheduled_for'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ScheduledJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Tarea')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Ejecutada por')),
+                ('locked_until', models.DateTimeField(blank=True, help_text='Pasada esta fecha otra réplica puede tomar la tarea', null=True, verbose_name='Lock hasta')),
+                ('last_scheduled_for', models.DateTimeField(blank=True, null=True, verbose_name='Última franja programada')),
+                ('last_started_at', models.DateTimeField(blank=True, null=True, verbose_name='Último inicio')),
+                ('last_finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Último fin')),
+                ('last_status', models.CharField(blank=True, choices=[('running', 'En ejecución'), ('success', 'Completada'), ('failed', 'Fallida')], default='', max_length=20, verbose_name='Último estado')),
+                ('last_result', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Último resultado')),
+                ('last_error', models.TextField(blank=True, default='', verbose_name='Último error')),
+            ],
+            options={
+                'verbose_name': 'Tarea programada',
+                'verbose_name_plural': 'Tareas programadas',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:08
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0013_scheduledjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='NotificationRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('status', models.CharField(choices=[('queued', 'En cola'), ('running', 'En ejecución'), ('completed', 'Completada'), ('failed', 'Fallida')], default='queued', max_length=20, verbose_name='Estado')),
+                ('source', models.CharField(default='cron', max_length=50, verbose_name='Origen')),
+                ('days', models.JSONField(blank=True, help_text='Vacío para todos los de EXPIRATION_DAYS_NOTICE', null=True, verbose_name='Días de aviso')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Fecha de creación')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='Inicio')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='Fin')),
+                ('total', models.IntegerField(default=0, verbose_name='Suscripciones a notificar')),
+                ('progress', models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Procesadas, enviadas, fallidas y omitidas por horizonte', verbose_name='Progreso')),
+                ('summary', models.JSONField(blank=True, encoder=django.core.serializers.json.DjangoJSONEncoder, null=True, verbose_name='Resumen final')),
+                ('error_message', models.TextField(blank=True, default='', verbose_name='Mensaje de error')),
+                ('locked_by', models.CharField(blank=True, default='', max_length=100, verbose_name='Tomada por')),
+                ('locked_until', models.DateTimeField(blank=True, null=True, verbose_name='Lease hasta')),
+            ],
+            options={
+                'verbose_name': 'Corrida de notificaciones',
+                'verbose_name_plural': 'Corridas de notificaciones',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='subscriptio_status_2f5b44_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:12
+
+import django.core.serializers.json
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0014_notificationrun'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='notificationrun',
+            name='checkpoint_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Último checkpoint'),
+        ),
+        migrations.AddField(
+            model_name='notificationrun',
+            name='cursor_cliente_id',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Cursor: cliente'),
+        ),
+        migrations.AddField(
+            model_name='notificationrun',
+            name='cursor_counters',
+            field=models.JSONField(blank=True, default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder, help_text='Progreso por horizonte y mensajes enviados hasta el cursor', verbose_name='Contadores del checkpoint'),
+        ),
+        migrations.AddField(
+            model_name='notificationrun',
+            name='cursor_subscription_id',
+            field=models.IntegerField(blank=True, null=True, verbose_name='Cursor: suscripción'),
+        ),
+        migrations.AddField(
+            model_name='notificationrun',
+            name='run_date',
+            field=models.DateField(blank=True, help_text='Día de referencia de los vencimientos; solo se retoma ese mismo día', null=True, verbose_name='Fecha de envío'),
+        ),
+    ]
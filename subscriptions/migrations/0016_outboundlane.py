@@ -0,0 +1,29 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0015_notificationrun_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboundLane',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=20, unique=True, verbose_name='Carril')),
+                ('last_active_at', models.DateTimeField(blank=True, null=True, verbose_name='Última actividad')),
+                ('sent', models.BigIntegerField(default=0, verbose_name='Mensajes despachados')),
+                ('wait_seconds_total', models.FloatField(default=0, verbose_name='Latencia de cola acumulada (s)')),
+                ('last_p95_seconds', models.FloatField(default=0, verbose_name='Latencia p95 reciente (s)')),
+            ],
+            options={
+                'verbose_name': 'Carril de envío',
+                'verbose_name_plural': 'Carriles de envío',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:22
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0016_outboundlane'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MessageTemplate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('notification_type', models.CharField(choices=[('expiration_warning', 'Aviso de vencimiento'), ('expiration_combined', 'Aviso de vencimiento agrupado'), ('renewal_confirmation', 'Confirmación de renovación')], max_length=30, verbose_name='Tipo de mensaje')),
+                ('urgency', models.CharField(blank=True, choices=[('', 'Cualquiera'), ('today', 'Vence hoy'), ('tomorrow', 'Vence mañana'), ('later', 'Vence en más días')], default='', max_length=10, verbose_name='Urgencia')),
+                ('body', models.TextField(help_text='Sintaxis de plantillas de Django, p. ej. {{ cliente_name }}', verbose_name='Texto')),
+                ('is_active', models.BooleanField(default=True, verbose_name='Activa')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Última modificación')),
+                ('service', models.ForeignKey(blank=True, help_text='Vacío = todos los servicios (los avisos agrupados no usan servicio)', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='message_templates', to='subscriptions.service', verbose_name='Servicio')),
+            ],
+            options={
+                'verbose_name': 'Plantilla de mensaje',
+                'verbose_name_plural': 'Plantillas de mensajes',
+                'ordering': ['notification_type', 'service', 'urgency'],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 11:44
+
+from django.db import migrations, models
+
+
+def remove_duplicate_templates(apps, schema_editor):
+    """Deja una plantilla por tipo, servicio y urgencia: la modificada más recientemente"""
+    MessageTemplate = apps.get_model('subscriptions', 'MessageTemplate')
+    seen = set()
+    duplicates = []
+    for template in MessageTemplate.objects.order_by('-updated_at', '-id'):
+        key = (template.notification_type, template.service_id, template.urgency)
+        if key in seen:
+            duplicates.append(template.id)
+        seen.add(key)
+    MessageTemplate.objects.filter(id__in=duplicates).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0017_messagetemplate'),
+    ]
+
+    operations = [
+        migrations.RunPython(remove_duplicate_templates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='messagetemplate',
+            constraint=models.UniqueConstraint(condition=models.Q(('service__isnull', False)), fields=('notification_type', 'service', 'urgency'), name='unique_message_template_per_service', violation_error_message='Ya existe una plantilla de este tipo para este servicio y urgencia.'),
+        ),
+        migrations.AddConstraint(
+            model_name='messagetemplate',
+            constraint=models.UniqueConstraint(condition=models.Q(('service__isnull', True)), fields=('notification_type', 'urgency'), name='unique_message_template_generic', violation_error_message='Ya existe una plantilla de este tipo para todos los servicios y esta urgencia.'),
+        ),
+    ]
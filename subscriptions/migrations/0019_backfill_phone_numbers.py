@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-18 12:10
+
+from django.db import migrations
+
+from subscriptions.phone import backfill_phone_columns
+
+
+def backfill_phone_numbers(apps, schema_editor):
+    """
+    Rellena las columnas normalizadas agregadas en 0007: sin ellas las búsquedas
+    por igualdad de los webhooks no encuentran a los clientes existentes
+    """
+    Cliente = apps.get_model('subscriptions', 'Cliente')
+    NotificationLog = apps.get_model('subscriptions', 'NotificationLog')
+    backfill_phone_columns(Cliente.objects.filter(telefono_e164=''), 'telefono', 'telefono_e164', 'telefono_clave')
+    backfill_phone_columns(NotificationLog.objects.filter(phone_e164=''), 'phone_number', 'phone_e164', 'phone_key')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('subscriptions', '0018_messagetemplate_unique'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_phone_numbers, migrations.RunPython.noop),
+    ]
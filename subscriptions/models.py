@@ -4,10 +4,14 @@ from django.contrib.auth.models import User, Group, Permission
 from django.utils import timezone
 from django.utils.translation import gettext_lazy as _
 from django.core.validators import RegexValidator
-from django.db.models.signals import post_save
+from django.core.serializers.json import DjangoJSONEncoder
+from django.core.exceptions import ValidationError
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from datetime import timedelta
 
+from .phone import normalize_phone, phone_key
+
 class Cliente(models.Model):
     """
     Modelo para gestionar clientes en el sistema.
@@ -42,6 +46,25 @@ class Cliente(models.Model):
         help_text='Número de teléfono del cliente con código de país'
     )
     
+    # Teléfono normalizado (se calcula en save()) para búsquedas indexadas por igualdad
+    telefono_e164 = models.CharField(
+        max_length=16,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name='Teléfono E.164'
+    )
+    telefono_clave = models.CharField(
+        max_length=9,
+        blank=True,
+        default='',
+        db_index=True,
+        editable=False,
+        verbose_name='Clave de teléfono',
+        help_text='Últimos 9 dígitos, para coincidir con o sin código de país'
+    )
+    
     direccion = models.TextField(blank=True, null=True, verbose_name='Dirección')
     fecha_nacimiento = models.DateField(blank=True, null=True, verbose_name='Fecha de nacimiento')
     
@@ -86,6 +109,12 @@ class Cliente(models.Model):
         # Asegurar que el correo electrónico esté en minúsculas
         if self.email:
             self.email = self.email.lower()
+        # Mantener sincronizadas las columnas normalizadas del teléfono
+        self.telefono_e164 = normalize_phone(self.telefono) or ''
+        self.telefono_clave = phone_key(self.telefono)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and 'telefono' in update_fields:
+            kwargs['update_fields'] = set(update_fields) | {'telefono_e164', 'telefono_clave'}
         super().save(*args, **kwargs)
 
 
@@ -652,6 +681,23 @@ class NotificationLog(models.Model):
         verbose_name='Número de teléfono'
     )
     
+    # Número normalizado para cruzar recibos y respuestas entrantes por igualdad
+    phone_e164 = models.CharField(
+        max_length=16,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Teléfono E.164'
+    )
+    phone_key = models.CharField(
+        max_length=9,
+        blank=True,
+        default='',
+        editable=False,
+        verbose_name='Clave de teléfono',
+        help_text='Últimos 9 dígitos del número'
+    )
+    
     message_content = models.TextField(
         verbose_name='Contenido del mensaje'
     )
@@ -688,6 +734,15 @@ class NotificationLog(models.Model):
         verbose_name='Respuesta de la API'
     )
     
+    # Id del mensaje en WaSender (de api_response) para cruzar recibos de entrega/lectura
+    provider_message_id = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        db_index=True,
+        verbose_name='Id del mensaje en el proveedor'
+    )
+    
     error_message = models.TextField(
         null=True,
         blank=True,
@@ -700,6 +755,13 @@ class NotificationLog(models.Model):
         verbose_name='Intentos de reenvío'
     )
     
+    next_retry_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Próximo reintento',
+        help_text='Vacío si el error es permanente o se agotaron los reintentos'
+    )
+    
     created_by = models.ForeignKey(
         User,
         on_delete=models.SET_NULL,
@@ -708,6 +770,52 @@ class NotificationLog(models.Model):
         verbose_name='Creado por'
     )
     
+    # Idempotencia: una sola notificación automática por (suscripción, tipo, días de aviso, fecha de envío)
+    dedup_key = models.CharField(
+        max_length=100,
+        unique=True,
+        null=True,
+        blank=True,
+        verbose_name='Clave de deduplicación',
+        help_text='Vacía para envíos manuales, que pueden repetirse'
+    )
+    
+    # Ventana de envío: franja a partir de la cual el outbox entrega el registro
+    scheduled_for = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Programado para',
+        help_text='Vacío para enviar apenas haya un worker libre'
+    )
+    
+    # Recordatorio agrupado: las suscripciones de un mismo cliente que vencen a la vez
+    # salen en un solo mensaje; sus registros apuntan al que representa ese envío
+    grouped_with = models.ForeignKey(
+        'self',
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='grouped_logs',
+        verbose_name='Enviado junto con',
+        help_text='Registro del mensaje agrupado; vacío si este registro es el que se envía'
+    )
+    
+    # Outbox: lease del worker que está enviando este registro
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Tomado por',
+        help_text='Worker que tiene el registro PENDING en proceso de envío'
+    )
+    
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Lease hasta',
+        help_text='Pasada esta fecha otro worker puede volver a tomar el registro'
+    )
+    
     class Meta:
         verbose_name = 'Registro de Notificación'
         verbose_name_plural = 'Registros de Notificaciones'
@@ -715,25 +823,88 @@ class NotificationLog(models.Model):
         indexes = [
             models.Index(fields=['subscription', 'notification_type']),
             models.Index(fields=['status', 'created_at']),
+            models.Index(fields=['status', 'next_retry_at']),
+            models.Index(fields=['status', 'scheduled_for']),
             models.Index(fields=['phone_number', 'sent_at']),
+            models.Index(fields=['phone_e164', 'sent_at']),
+            models.Index(fields=['phone_key', 'sent_at']),
         ]
     
     def __str__(self):
         return f"{self.get_notification_type_display()} - {self.subscription.cliente.nombre_completo} ({self.get_status_display()})"
     
-    def mark_as_sent(self, api_response=None):
-        """Marca la notificación como enviada"""
+    def save(self, *args, **kwargs):
+        # Las columnas normalizadas se derivan de phone_number (bulk_create las
+        # recibe ya calculadas desde NotificationService.build_expiration_log)
+        if self.phone_number and not self.phone_e164:
+            self.phone_e164 = normalize_phone(self.phone_number) or ''
+            self.phone_key = phone_key(self.phone_number)
+        super().save(*args, **kwargs)
+    
+    @staticmethod
+    def make_dedup_key(subscription_id, notification_type, days_notice, send_date):
+        """Clave única de una notificación automática para una fecha de envío"""
+        return f'{subscription_id}:{notification_type}:{days_notice}:{send_date:%Y-%m-%d}'
+    
+    @staticmethod
+    def extract_provider_message_id(api_response):
+        """Id del mensaje en WaSender dentro de la respuesta de send-message ('' si no viene)"""
+        if not isinstance(api_response, dict):
+            return ''
+        data = api_response.get('data') if isinstance(api_response.get('data'), dict) else api_response
+        for key in ('msgId', 'messageId', 'id'):
+            if data.get(key) not in (None, ''):
+                return str(data[key])
+        return ''
+    
+    # Campos que cambian al registrar el resultado de un envío (para bulk_update)
+    SENT_FIELDS = ['status', 'sent_at', 'api_response', 'provider_message_id', 'error_message', 'retry_count',
+                   'next_retry_at']
+    FAILED_FIELDS = ['status', 'error_message', 'retry_count', 'next_retry_at', 'locked_by', 'locked_until']
+    # Campos que los registros agrupados copian del registro que se envía
+    GROUP_FIELDS = ['status', 'sent_at', 'api_response', 'provider_message_id', 'error_message',
+                    'retry_count', 'next_retry_at']
+    
+    def mark_as_sent(self, api_response=None, commit=True):
+        """Marca la notificación como enviada (commit=False solo la modifica en memoria)"""
         self.status = self.NotificationStatus.SENT
         self.sent_at = timezone.now()
+        self.next_retry_at = None
+        # Un reintento exitoso no conserva el error del intento anterior
+        self.error_message = None
         if api_response:
             self.api_response = api_response
-        self.save()
+            self.provider_message_id = self.extract_provider_message_id(api_response)
+        if commit:
+            self.save()
     
-    def mark_as_failed(self, error_message):
-        """Marca la notificación como fallida"""
+    def mark_as_failed(self, error_message, commit=True, retry_at=None):
+        """
+        Marca la notificación como fallida (commit=False solo la modifica en memoria)
+        
+        Con `retry_at` queda programada para la etapa de reintentos; se libera
+        el lease para que cualquier worker pueda tomarla a esa hora.
+        """
         self.status = self.NotificationStatus.FAILED
         self.error_message = error_message
-        self.save()
+        self.next_retry_at = retry_at
+        self.locked_by = ''
+        self.locked_until = None
+        if commit:
+            self.save()
+    
+    def sync_group_members(self):
+        """
+        Copia el resultado del envío a los registros agrupados cargados en `group_members`
+        
+        Returns:
+            Registros agrupados actualizados (en memoria)
+        """
+        members = getattr(self, 'group_members', [])
+        for member in members:
+            for field in self.GROUP_FIELDS:
+                setattr(member, field, getattr(self, field))
+        return members
     
     def mark_as_delivered(self):
         """Marca la notificación como entregada"""
@@ -750,3 +921,496 @@ class NotificationLog(models.Model):
     def service_name(self):
         """Nombre del servicio asociado"""
         return self.subscription.service.nombre_mostrar
+
+
+class InboundMessage(models.Model):
+    """
+    Cola de webhooks entrantes de WaSender.
+    
+    El webhook solo guarda el payload crudo y responde de inmediato; los workers
+    de `process_inbound_messages` ejecutan el bot y envían la respuesta.
+    """
+    
+    class InboundKind(models.TextChoices):
+        MESSAGE = 'message', 'Mensaje'
+        RECEIPT = 'receipt', 'Recibo de entrega/lectura'
+    
+    class InboundStatus(models.TextChoices):
+        PENDING = 'pending', 'Pendiente'
+        PROCESSED = 'processed', 'Procesado'
+        FAILED = 'failed', 'Fallido'
+    
+    kind = models.CharField(
+        max_length=20,
+        choices=InboundKind.choices,
+        default=InboundKind.MESSAGE,
+        verbose_name='Tipo'
+    )
+    
+    payload = models.JSONField(
+        default=dict,
+        verbose_name='Payload',
+        help_text='Cuerpo del webhook tal como llegó'
+    )
+    
+    status = models.CharField(
+        max_length=20,
+        choices=InboundStatus.choices,
+        default=InboundStatus.PENDING,
+        verbose_name='Estado'
+    )
+    
+    received_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Fecha de recepción'
+    )
+    
+    processed_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Fecha de procesamiento'
+    )
+    
+    attempts = models.IntegerField(
+        default=0,
+        verbose_name='Intentos'
+    )
+    
+    result = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name='Resultado',
+        help_text='Respuesta del bot y del envío a WaSender'
+    )
+    
+    error_message = models.TextField(
+        null=True,
+        blank=True,
+        verbose_name='Mensaje de error'
+    )
+    
+    # Lease del worker que está procesando el mensaje (ver outbox.lease_rows)
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Tomado por'
+    )
+    
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Lease hasta'
+    )
+    
+    class Meta:
+        verbose_name = 'Mensaje entrante'
+        verbose_name_plural = 'Mensajes entrantes'
+        ordering = ['-received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+            models.Index(fields=['kind', 'status', 'received_at']),
+        ]
+    
+    def __str__(self):
+        return f"Mensaje entrante #{self.pk} ({self.get_status_display()})"
+    
+    # Campos que cambian al registrar el resultado del procesamiento (para bulk_update)
+    RESULT_FIELDS = ['status', 'processed_at', 'attempts', 'result', 'error_message', 'locked_by', 'locked_until']
+    
+    @property
+    def lag_seconds(self):
+        """Segundos entre la recepción y el procesamiento (o hasta ahora si sigue pendiente)"""
+        end = self.processed_at or timezone.now()
+        return (end - self.received_at).total_seconds()
+
+
+class ScheduledJob(models.Model):
+    """
+    Estado y lock de líder de cada tarea de `notification_scheduler`.
+    
+    Antes de ejecutar una tarea, la réplica que la toma escribe su id y la
+    franja programada con un UPDATE condicional: solo una réplica gana cada
+    franja y ninguna la repite aunque termine antes de que otra la revise.
+    """
+    
+    class JobStatus(models.TextChoices):
+        RUNNING = 'running', 'En ejecución'
+        SUCCESS = 'success', 'Completada'
+        FAILED = 'failed', 'Fallida'
+    
+    name = models.CharField(
+        max_length=100,
+        unique=True,
+        verbose_name='Tarea'
+    )
+    
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Ejecutada por'
+    )
+    
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Lock hasta',
+        help_text='Pasada esta fecha otra réplica puede tomar la tarea'
+    )
+    
+    last_scheduled_for = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Última franja programada'
+    )
+    
+    last_started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Último inicio'
+    )
+    
+    last_finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Último fin'
+    )
+    
+    last_status = models.CharField(
+        max_length=20,
+        choices=JobStatus.choices,
+        blank=True,
+        default='',
+        verbose_name='Último estado'
+    )
+    
+    last_result = models.JSONField(
+        null=True,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        verbose_name='Último resultado'
+    )
+    
+    last_error = models.TextField(
+        blank=True,
+        default='',
+        verbose_name='Último error'
+    )
+    
+    class Meta:
+        verbose_name = 'Tarea programada'
+        verbose_name_plural = 'Tareas programadas'
+        ordering = ['name']
+    
+    def __str__(self):
+        return f"{self.name} ({self.get_last_status_display() or 'sin ejecutar'})"
+
+
+class NotificationRun(models.Model):
+    """
+    Corrida de avisos de vencimiento pedida por el endpoint de cron.
+    
+    El endpoint solo crea la corrida y responde; `notification_scheduler` la
+    toma de la cola (lease como el outbox) y va guardando el progreso por
+    horizonte para que el endpoint de estado lo reporte.
+    
+    `send_expiration_notifications` también registra su corrida. Tras cada
+    lote persistido se guarda un checkpoint (cursor keyset, contadores y
+    renovación del lease), y una corrida interrumpida se retoma desde él
+    (`--resume` o, para las del cron, el propio programador).
+    """
+    
+    class RunStatus(models.TextChoices):
+        QUEUED = 'queued', 'En cola'
+        RUNNING = 'running', 'En ejecución'
+        COMPLETED = 'completed', 'Completada'
+        FAILED = 'failed', 'Fallida'
+    
+    status = models.CharField(
+        max_length=20,
+        choices=RunStatus.choices,
+        default=RunStatus.QUEUED,
+        verbose_name='Estado'
+    )
+    
+    source = models.CharField(
+        max_length=50,
+        default='cron',
+        verbose_name='Origen'
+    )
+    
+    days = models.JSONField(
+        null=True,
+        blank=True,
+        verbose_name='Días de aviso',
+        help_text='Vacío para todos los de EXPIRATION_DAYS_NOTICE'
+    )
+    
+    run_date = models.DateField(
+        null=True,
+        blank=True,
+        verbose_name='Fecha de envío',
+        help_text='Día de referencia de los vencimientos; solo se retoma ese mismo día'
+    )
+    
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Fecha de creación'
+    )
+    
+    started_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Inicio'
+    )
+    
+    finished_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Fin'
+    )
+    
+    total = models.IntegerField(
+        default=0,
+        verbose_name='Suscripciones a notificar'
+    )
+    
+    progress = models.JSONField(
+        default=dict,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        verbose_name='Progreso',
+        help_text='Procesadas, enviadas, fallidas y omitidas por horizonte'
+    )
+    
+    # Checkpoint: última suscripción cuyo resultado ya está persistido, en el
+    # orden (cliente_id, id) de NotificationService.iter_expiring_subscriptions,
+    # y los contadores a esa altura
+    cursor_cliente_id = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Cursor: cliente'
+    )
+    
+    cursor_subscription_id = models.IntegerField(
+        null=True,
+        blank=True,
+        verbose_name='Cursor: suscripción'
+    )
+    
+    cursor_counters = models.JSONField(
+        default=dict,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        verbose_name='Contadores del checkpoint',
+        help_text='Progreso por horizonte y mensajes enviados hasta el cursor'
+    )
+    
+    checkpoint_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Último checkpoint'
+    )
+    
+    summary = models.JSONField(
+        null=True,
+        blank=True,
+        encoder=DjangoJSONEncoder,
+        verbose_name='Resumen final'
+    )
+    
+    error_message = models.TextField(
+        blank=True,
+        default='',
+        verbose_name='Mensaje de error'
+    )
+    
+    # Lease del proceso que ejecuta la corrida (ver outbox.lease_rows)
+    locked_by = models.CharField(
+        max_length=100,
+        blank=True,
+        default='',
+        verbose_name='Tomada por'
+    )
+    
+    locked_until = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Lease hasta'
+    )
+    
+    class Meta:
+        verbose_name = 'Corrida de notificaciones'
+        verbose_name_plural = 'Corridas de notificaciones'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+    
+    def __str__(self):
+        return f"Corrida #{self.pk} ({self.get_status_display()})"
+    
+    @property
+    def processed(self):
+        """Suscripciones ya procesadas (enviadas, fallidas u omitidas)"""
+        return sum(horizon.get('processed', 0) for horizon in (self.progress or {}).values())
+    
+    @property
+    def cursor(self):
+        """Cursor (cliente_id, subscription_id) del último checkpoint, o None"""
+        if self.cursor_subscription_id is None:
+            return None
+        return (self.cursor_cliente_id, self.cursor_subscription_id)
+
+
+class OutboundLane(models.Model):
+    """
+    Carril de envío saliente (ver dispatch.LaneDispatcher).
+    
+    Cada proceso publica aquí los carriles en los que está enviando para que
+    los demás ajusten su parte del ritmo de WaSender, junto con el acumulado
+    de mensajes y de latencia de cola.
+    """
+    
+    name = models.CharField(
+        max_length=20,
+        unique=True,
+        verbose_name='Carril'
+    )
+    
+    last_active_at = models.DateTimeField(
+        null=True,
+        blank=True,
+        verbose_name='Última actividad'
+    )
+    
+    sent = models.BigIntegerField(
+        default=0,
+        verbose_name='Mensajes despachados'
+    )
+    
+    wait_seconds_total = models.FloatField(
+        default=0,
+        verbose_name='Latencia de cola acumulada (s)'
+    )
+    
+    last_p95_seconds = models.FloatField(
+        default=0,
+        verbose_name='Latencia p95 reciente (s)'
+    )
+    
+    class Meta:
+        verbose_name = 'Carril de envío'
+        verbose_name_plural = 'Carriles de envío'
+        ordering = ['name']
+    
+    def __str__(self):
+        return self.name
+    
+    @property
+    def average_wait_seconds(self):
+        """Latencia de cola promedio desde que existe el carril"""
+        return self.wait_seconds_total / self.sent if self.sent else 0.0
+
+
+class MessageTemplate(models.Model):
+    """
+    Texto editable de un mensaje de WhatsApp (ver message_templates).
+    
+    Se elige la plantilla activa más específica para el servicio y la urgencia
+    del mensaje; sin ninguna se usa el texto por defecto del código.
+    """
+    
+    class Kind(models.TextChoices):
+        EXPIRATION_WARNING = 'expiration_warning', 'Aviso de vencimiento'
+        EXPIRATION_COMBINED = 'expiration_combined', 'Aviso de vencimiento agrupado'
+        RENEWAL_CONFIRMATION = 'renewal_confirmation', 'Confirmación de renovación'
+    
+    class Urgency(models.TextChoices):
+        ANY = '', 'Cualquiera'
+        TODAY = 'today', 'Vence hoy'
+        TOMORROW = 'tomorrow', 'Vence mañana'
+        LATER = 'later', 'Vence en más días'
+    
+    notification_type = models.CharField(
+        max_length=30,
+        choices=Kind.choices,
+        verbose_name='Tipo de mensaje'
+    )
+    
+    service = models.ForeignKey(
+        Service,
+        on_delete=models.CASCADE,
+        null=True,
+        blank=True,
+        related_name='message_templates',
+        verbose_name='Servicio',
+        help_text='Vacío = todos los servicios (los avisos agrupados no usan servicio)'
+    )
+    
+    urgency = models.CharField(
+        max_length=10,
+        choices=Urgency.choices,
+        default=Urgency.ANY,
+        blank=True,
+        verbose_name='Urgencia'
+    )
+    
+    body = models.TextField(
+        verbose_name='Texto',
+        help_text='Sintaxis de plantillas de Django, p. ej. {{ cliente_name }}'
+    )
+    
+    is_active = models.BooleanField(
+        default=True,
+        verbose_name='Activa'
+    )
+    
+    updated_at = models.DateTimeField(
+        auto_now=True,
+        verbose_name='Última modificación'
+    )
+    
+    class Meta:
+        verbose_name = 'Plantilla de mensaje'
+        verbose_name_plural = 'Plantillas de mensajes'
+        ordering = ['notification_type', 'service', 'urgency']
+        # Una plantilla por tipo, servicio y urgencia (las genéricas tienen service NULL,
+        # que no cuenta como repetido en un UNIQUE: se restringen aparte)
+        constraints = [
+            models.UniqueConstraint(
+                fields=['notification_type', 'service', 'urgency'],
+                condition=models.Q(service__isnull=False),
+                name='unique_message_template_per_service',
+                violation_error_message='Ya existe una plantilla de este tipo para este servicio y urgencia.',
+            ),
+            models.UniqueConstraint(
+                fields=['notification_type', 'urgency'],
+                condition=models.Q(service__isnull=True),
+                name='unique_message_template_generic',
+                violation_error_message='Ya existe una plantilla de este tipo para todos los servicios y esta urgencia.',
+            ),
+        ]
+    
+    def __str__(self):
+        scope = [str(self.service) if self.service_id else 'todos los servicios']
+        if self.urgency:
+            scope.append(self.get_urgency_display().lower())
+        return f"{self.get_notification_type_display()} ({', '.join(scope)})"
+    
+    def clean(self):
+        from django.template import TemplateSyntaxError
+        from .message_templates import compile_template
+        
+        try:
+            compile_template(self.body)
+        except TemplateSyntaxError as e:
+            raise ValidationError({'body': f'Plantilla inválida: {e}'})
+
+
+@receiver([post_save, post_delete], sender=MessageTemplate)
+def invalidar_plantillas(sender, **kwargs):
+    """Los cambios hechos en este proceso se ven en el próximo mensaje, sin esperar TEMPLATE_CHECK_SECONDS"""
+    from .message_templates import get_message_renderer
+    get_message_renderer().invalidate()
@@ -0,0 +1,217 @@
+"""
+Outbox de notificaciones de WhatsApp.
+
+Los `NotificationLog` en estado PENDING son la cola de salida. Cada worker toma
+("lease") un lote con `SELECT ... FOR UPDATE SKIP LOCKED`, lo marca con su
+identificador y una fecha de expiración, y lo envía fuera de la transacción.
+Varias réplicas pueden drenar la cola en paralelo sin enviar dos veces el mismo
+registro; si un worker muere, su lease vence y otro worker retoma los registros.
+
+Los registros con `scheduled_for` (ventana de envío, ver scheduling.py) no se
+entregan hasta que llega su franja.
+
+Los recordatorios agrupados por cliente solo ponen en la cola el registro que
+representa el mensaje; los de las demás suscripciones (`grouped_with`) viajan
+con él en `group_members` y copian su resultado.
+"""
+
+import logging
+import os
+import socket
+import threading
+from datetime import timedelta
+from typing import List
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def get_lease_seconds() -> int:
+    """Duración del lease configurada en NOTIFICATION_SETTINGS['OUTBOX_LEASE_SECONDS']"""
+    notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+    return notification_settings.get('OUTBOX_LEASE_SECONDS', 300)
+
+
+def get_batch_lease_seconds(batch_size: int, rate: float = None, workers: int = 1) -> int:
+    """
+    Lease de un lote que se envía a `rate` mensajes/segundo
+
+    Cubre OUTBOX_LEASE_SECONDS más lo que tarda el lote en salir cuando
+    `workers` lotes del mismo proceso comparten ese ritmo; así el lease no
+    vence a mitad del lote y otro worker no vuelve a enviar sus registros.
+
+    Args:
+        batch_size: Registros del lote
+        rate: Ritmo de envío (default: el del despachador del proceso)
+        workers: Lotes que se envían a la vez con el mismo ritmo
+    """
+    if rate is None:
+        from .dispatch import get_dispatcher
+        rate = get_dispatcher().rate
+    return int(get_lease_seconds() + batch_size * max(1, workers) / rate)
+
+
+def make_worker_id(name: str = '') -> str:
+    """Identificador único del worker: host, proceso e hilo"""
+    worker_id = f'{socket.gethostname()}:{os.getpid()}:{threading.get_ident()}'
+    return f'{worker_id}:{name}' if name else worker_id
+
+
+def lease_rows(queryset, worker_id: str, batch_size: int = 50, lease_seconds: int = None,
+               order_by=('created_at', 'id')):
+    """
+    Toma hasta `batch_size` filas libres de `queryset` para `worker_id`
+
+    El modelo debe tener los campos `locked_by` y `locked_until`. Lo usan el
+    outbox de notificaciones y la cola de mensajes entrantes.
+
+    Args:
+        queryset: Filas candidatas (p. ej. las PENDING de la cola)
+        worker_id: Identificador del worker (ver make_worker_id)
+        batch_size: Máximo de filas a tomar
+        lease_seconds: Duración del lease (default: OUTBOX_LEASE_SECONDS)
+        order_by: Orden de consumo de la cola
+
+    Returns:
+        QuerySet (sin evaluar) con las filas tomadas por este worker
+    """
+    now = timezone.now()
+    lease_seconds = lease_seconds or get_lease_seconds()
+    available = Q(locked_until__isnull=True) | Q(locked_until__lt=now)
+
+    with transaction.atomic():
+        ids = list(
+            queryset.select_for_update(skip_locked=True)
+            .filter(available)
+            .order_by(*order_by)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return queryset.none()
+        # La condición se repite en el UPDATE para que sea seguro también en
+        # motores sin bloqueo de filas (SQLite en desarrollo)
+        queryset.model.objects.filter(available, id__in=ids).update(
+            locked_by=worker_id,
+            locked_until=now + timedelta(seconds=lease_seconds),
+        )
+
+    return queryset.model.objects.filter(id__in=ids, locked_by=worker_id).order_by(*order_by)
+
+
+def lease_notifications(worker_id: str, batch_size: int = 50, lease_seconds: int = None) -> List:
+    """
+    Toma un lote de notificaciones PENDING libres para `worker_id`
+
+    Args:
+        worker_id: Identificador del worker (ver make_worker_id)
+        batch_size: Máximo de registros a tomar
+        lease_seconds: Duración del lease (default: OUTBOX_LEASE_SECONDS)
+
+    Returns:
+        Lista de NotificationLog tomados por este worker
+    """
+    from .models import NotificationLog
+
+    leased = lease_rows(
+        NotificationLog.objects.filter(status=NotificationLog.NotificationStatus.PENDING, grouped_with__isnull=True)
+        .filter(Q(scheduled_for__isnull=True) | Q(scheduled_for__lte=timezone.now())),
+        worker_id, batch_size, lease_seconds,
+    )
+    return attach_group_members(list(leased.select_related('subscription__cliente')))
+
+
+def lease_retries(worker_id: str, batch_size: int = 50, lease_seconds: int = None) -> List:
+    """
+    Toma un lote de notificaciones FAILED cuyo próximo reintento ya venció
+
+    Usa el índice (status, next_retry_at); los errores permanentes y los que
+    agotaron sus reintentos tienen next_retry_at vacío y nunca se toman.
+    """
+    from .models import NotificationLog
+
+    leased = lease_rows(
+        NotificationLog.objects.filter(
+            status=NotificationLog.NotificationStatus.FAILED,
+            next_retry_at__lte=timezone.now(),
+            grouped_with__isnull=True,
+        ),
+        worker_id, batch_size, lease_seconds, order_by=('next_retry_at', 'id'),
+    )
+    return attach_group_members(list(leased.select_related('subscription__cliente')))
+
+
+def attach_group_members(notification_logs: List) -> List:
+    """
+    Carga en `group_members` los registros agrupados de cada registro tomado
+
+    Una sola consulta para todo el lote; el resultado del envío se copia a
+    ellos con NotificationLog.sync_group_members.
+    """
+    from .models import NotificationLog
+
+    by_lead = {notification_log.id: notification_log for notification_log in notification_logs}
+    for notification_log in notification_logs:
+        notification_log.group_members = []
+    if by_lead:
+        members = NotificationLog.objects.filter(grouped_with_id__in=list(by_lead)).order_by('id')
+        for member in members:
+            by_lead[member.grouped_with_id].group_members.append(member)
+    return notification_logs
+
+
+def renew_lease(notification_log, worker_id: str, lease_seconds: int = None) -> bool:
+    """
+    Renueva el lease de un registro justo antes de enviarlo
+
+    Returns:
+        False si el registro ya no es de `worker_id` (su lease venció y lo tomó
+        otro worker): no debe enviarse
+    """
+    from .models import NotificationLog
+
+    lease_seconds = lease_seconds or get_lease_seconds()
+    return NotificationLog.objects.filter(pk=notification_log.pk, locked_by=worker_id).update(
+        locked_until=timezone.now() + timedelta(seconds=lease_seconds),
+    ) > 0
+
+
+def release_notifications(worker_id: str, ids) -> int:
+    """Libera los leases de `worker_id` para que otro worker los tome"""
+    from .models import NotificationLog
+
+    return NotificationLog.objects.filter(id__in=ids, locked_by=worker_id).update(
+        locked_by='',
+        locked_until=None,
+    )
+
+
+def pending_count(due_only: bool = False) -> int:
+    """
+    Número de mensajes pendientes en el outbox (un recordatorio agrupado cuenta una vez)
+
+    Args:
+        due_only: Contar solo los que ya pueden enviarse (sin franja o con la franja vencida)
+    """
+    from .models import NotificationLog
+
+    pending = NotificationLog.objects.filter(
+        status=NotificationLog.NotificationStatus.PENDING, grouped_with__isnull=True
+    )
+    if due_only:
+        pending = pending.filter(Q(scheduled_for__isnull=True) | Q(scheduled_for__lte=timezone.now()))
+    return pending.count()
+
+
+def next_scheduled_at():
+    """Franja del próximo mensaje programado que aún no vence (None si no hay)"""
+    from .models import NotificationLog
+
+    return NotificationLog.objects.filter(
+        status=NotificationLog.NotificationStatus.PENDING,
+        grouped_with__isnull=True,
+        scheduled_for__gt=timezone.now(),
+    ).order_by('scheduled_for').values_list('scheduled_for', flat=True).first()
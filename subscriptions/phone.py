@@ -0,0 +1,130 @@
+"""
+Normalización de números de teléfono.
+
+Único punto donde se interpretan los formatos de teléfono que llegan desde
+formularios, importaciones de leads y webhooks de WhatsApp. Los modelos guardan
+el resultado en columnas indexadas (`telefono_e164` y `telefono_clave`) para
+que las búsquedas de mensajes entrantes sean una igualdad y no un `icontains`.
+
+Formatos soportados (mismos criterios que usaba `WhatsAppService`):
+- Ecuador: 09XXXXXXXX, 9XXXXXXXX (móvil local), 0XXXXXXXX (fijo) o 593...
+- Colombia: 3XXXXXXXXX / 6XXXXXXXXX o 57...; 7 dígitos se asumen de Bogotá
+"""
+
+import logging
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Dígitos finales usados como clave cuando el número llega sin código de país
+PHONE_KEY_LENGTH = 9
+
+
+def phone_digits(phone) -> str:
+    """Solo los dígitos del número (sin espacios, guiones, paréntesis ni '+')"""
+    return ''.join(filter(str.isdigit, str(phone or '')))
+
+
+def normalize_phone(phone) -> Optional[str]:
+    """
+    Normaliza un número de teléfono a formato E.164
+
+    Args:
+        phone: Número en cualquier formato de entrada
+
+    Returns:
+        Número como '+593968196046', o None si es inválido
+    """
+    clean = phone_digits(phone)
+    if not clean:
+        return None
+
+    # Ecuador: móviles y fijos locales empiezan con 0 (ej: 0968196046)
+    if len(clean) == 10 and clean.startswith('0'):
+        clean = '593' + clean[1:]  # 0968196046 -> 593968196046
+
+    # Ecuador: móvil sin el 0 inicial (ej: 968196046)
+    elif len(clean) == 9 and clean.startswith('9'):
+        clean = '593' + clean
+
+    # Colombia: números móviles empiezan con 3 o 6
+    elif len(clean) == 10 and clean.startswith(('3', '6')):
+        clean = '57' + clean  # 3001234567 -> 573001234567
+
+    # Número fijo colombiano sin código de área
+    elif len(clean) == 7:
+        clean = '571' + clean  # Asumir Bogotá
+
+    # Si ya tiene código de país, validar que sea conocido
+    elif len(clean) >= 11:
+        if not ((clean.startswith('593') or clean.startswith('57')) and len(clean) == 12):
+            # Otros países o formatos no soportados: se conservan tal cual
+            logger.warning(f"Formato de número no reconocido: {phone}")
+
+    # Validar longitud final (E.164 admite hasta 15 dígitos)
+    if len(clean) < 10 or len(clean) > 15:
+        return None
+
+    return '+' + clean
+
+
+def phone_key(phone) -> str:
+    """
+    Clave de búsqueda: últimos 9 dígitos del número
+
+    Coincide aunque un lado tenga código de país y el otro no
+    (ej: '0968196046' y '+593968196046' -> '968196046').
+    """
+    return phone_digits(normalize_phone(phone) or phone)[-PHONE_KEY_LENGTH:]
+
+
+def backfill_phone_columns(queryset, source: str, e164_field: str, key_field: str,
+                           batch_size: int = 1000) -> Tuple[int, int]:
+    """
+    Rellena las columnas normalizadas de las filas de `queryset` por lotes
+
+    Recorre la tabla por rangos de id (keyset) y actualiza con bulk_update solo
+    las filas que cambian. La usan las migraciones que agregaron las columnas
+    y el comando backfill_phone_numbers.
+
+    Args:
+        queryset: Filas a revisar (del modelo o del modelo histórico de una migración)
+        source: Campo con el teléfono tal como se ingresó
+        e164_field: Campo E.164
+        key_field: Campo con los últimos 9 dígitos
+
+    Returns:
+        Tupla (filas revisadas, filas actualizadas)
+    """
+    from django.db import transaction
+
+    queryset = queryset.exclude(**{f'{source}__isnull': True}).exclude(**{source: ''})
+    scanned = updated = 0
+    last_id = 0
+    while True:
+        rows = list(
+            queryset.filter(id__gt=last_id)
+            .order_by('id')
+            .only('id', source, e164_field, key_field)[:batch_size]
+        )
+        if not rows:
+            break
+        last_id = rows[-1].id
+        scanned += len(rows)
+
+        changed = []
+        for row in rows:
+            phone = getattr(row, source)
+            e164 = normalize_phone(phone) or ''
+            key = phone_key(phone)
+            if getattr(row, e164_field) != e164 or getattr(row, key_field) != key:
+                setattr(row, e164_field, e164)
+                setattr(row, key_field, key)
+                changed.append(row)
+
+        if changed:
+            with transaction.atomic():
+                queryset.model.objects.bulk_update(changed, [e164_field, key_field], batch_size=batch_size)
+            updated += len(changed)
+
+    return scanned, updated
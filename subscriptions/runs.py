@@ -0,0 +1,279 @@
+"""
+Corridas de avisos de vencimiento con checkpoint.
+
+El endpoint de cron encola un `NotificationRun` y responde de inmediato con su
+id; `notification_scheduler` toma las corridas en cola y las ejecuta en su
+proceso, guardando el progreso por horizonte cada PROGRESS_FLUSH_SECONDS para
+que `GET /cron/notifications/<id>/` lo reporte. `send_expiration_notifications`
+registra también su corrida.
+
+Tras cada lote cuyos resultados ya están en la base se guarda un checkpoint:
+cursor keyset (cliente_id, subscription_id), contadores a esa altura y
+renovación del lease. Si el proceso muere (deploy, reinicio del contenedor),
+la corrida queda en ejecución con el lease vencido y se retoma desde el
+cursor, sin volver a contar ni recorrer lo ya procesado.
+"""
+
+import copy
+import logging
+import time
+from datetime import date, timedelta
+from typing import Any, Callable, Dict, Iterable, Optional
+
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+from .outbox import get_lease_seconds, lease_rows
+
+logger = logging.getLogger(__name__)
+
+# Cada cuántos segundos se persiste el progreso de una corrida en ejecución
+PROGRESS_FLUSH_SECONDS = 2
+
+
+def _empty_counters() -> Dict[str, int]:
+    return {'processed': 0, 'sent': 0, 'failed': 0, 'skipped': 0}
+
+
+def get_run_lease_seconds(rate: Optional[float] = None) -> int:
+    """
+    Lease de una corrida: se renueva en cada checkpoint, así que debe cubrir
+    lo que tarda un lote de LOG_BATCH_SIZE al ritmo de envío
+    (default: el del despachador del proceso)
+    """
+    from .services import NotificationService, notification_service
+
+    dispatcher = notification_service.whatsapp.dispatcher
+    rate = rate or (dispatcher.rate if dispatcher else NotificationService.get_send_options()['rate'])
+    return int(get_lease_seconds() + NotificationService.get_batch_size() / rate)
+
+
+def enqueue_run(days_list: Optional[Iterable[int]] = None, source: str = 'cron'):
+    """
+    Encola una corrida, o devuelve la que ya está en cola o en ejecución
+
+    Así un cron que reintenta la petición no duplica el trabajo.
+
+    Returns:
+        Tupla (NotificationRun, creada)
+    """
+    from .models import NotificationRun
+
+    active = NotificationRun.objects.filter(
+        status__in=[NotificationRun.RunStatus.QUEUED, NotificationRun.RunStatus.RUNNING]
+    ).order_by('created_at').first()
+    if active:
+        return active, False
+    days = sorted(set(days_list)) if days_list else None
+    return NotificationRun.objects.create(days=days, source=source), True
+
+
+def start_run(days_list: Optional[Iterable[int]], source: str, worker_id: str,
+              lease_seconds: Optional[int] = None):
+    """Registra una corrida ya tomada por `worker_id` (la ejecuta quien la crea)"""
+    from .models import NotificationRun
+
+    return NotificationRun.objects.create(
+        days=sorted(set(days_list)) if days_list else None,
+        source=source,
+        locked_by=worker_id,
+        locked_until=timezone.now() + timedelta(seconds=lease_seconds or get_run_lease_seconds()),
+    )
+
+
+def _abandon_stale_runs() -> None:
+    """Marca como fallidas las corridas interrumpidas de días anteriores: ya no se retoman"""
+    from .models import NotificationRun
+
+    NotificationRun.objects.filter(
+        status=NotificationRun.RunStatus.RUNNING,
+        run_date__lt=date.today(),
+        locked_until__lt=timezone.now(),
+    ).update(
+        status=NotificationRun.RunStatus.FAILED,
+        error_message='Interrumpida y no retomada el mismo día',
+        locked_by='',
+        locked_until=None,
+    )
+
+
+def lease_run(worker_id: str, lease_seconds: Optional[int] = None):
+    """
+    Toma la corrida más antigua en cola, o una en ejecución de hoy cuyo proceso
+    murió (se retoma desde su checkpoint)
+
+    Returns:
+        NotificationRun tomada, o None si no hay
+    """
+    from .models import NotificationRun
+
+    close_old_connections()
+    _abandon_stale_runs()
+    Status = NotificationRun.RunStatus
+    candidates = NotificationRun.objects.filter(
+        Q(status=Status.QUEUED) | Q(status=Status.RUNNING, run_date=date.today())
+    )
+    return lease_rows(candidates, worker_id, 1, lease_seconds or get_run_lease_seconds()).first()
+
+
+def lease_interrupted_run(worker_id: str, lease_seconds: Optional[int] = None):
+    """
+    Toma la corrida de hoy más reciente que quedó a medias (proceso caído o fallida)
+
+    Returns:
+        NotificationRun tomada, o None si no hay ninguna que retomar
+    """
+    from .models import NotificationRun
+
+    _abandon_stale_runs()
+    Status = NotificationRun.RunStatus
+    candidates = NotificationRun.objects.filter(
+        status__in=[Status.RUNNING, Status.FAILED], run_date=date.today()
+    )
+    return lease_rows(
+        candidates, worker_id, 1, lease_seconds or get_run_lease_seconds(), order_by=('-created_at', '-id')
+    ).first()
+
+
+def execute_run(run, concurrency: Optional[int] = None, on_result: Optional[Callable] = None,
+                retries: bool = True, lease_seconds: Optional[int] = None) -> Dict[str, Any]:
+    """
+    Ejecuta la corrida, o la retoma desde su checkpoint, y guarda progreso y resumen
+
+    Una corrida que ya había empezado conserva su fecha, su total y los
+    contadores del checkpoint, y recorre solo las suscripciones posteriores al
+    cursor. Lo enviado después del último checkpoint se omite por su clave de
+    deduplicación.
+
+    Args:
+        run: NotificationRun tomada por este proceso
+        concurrency: Envíos simultáneos (default: SEND_CONCURRENCY)
+        on_result: Callback adicional (subscription, days, result) por suscripción
+        retries: Ejecutar también la etapa de reintentos
+        lease_seconds: Renovación del lease en cada checkpoint (default: get_run_lease_seconds)
+
+    Returns:
+        Resumen acumulado de toda la corrida (`resumed` indica si se retomó)
+    """
+    from .models import NotificationRun
+    from .services import notification_service
+
+    days_list = run.days or notification_service.get_notice_days()
+    lease_seconds = lease_seconds or get_run_lease_seconds()
+    resumed = run.started_at is not None
+    if resumed:
+        cursor = run.cursor
+        run.progress = copy.deepcopy(run.cursor_counters.get('progress') or {})
+        base_messages = run.cursor_counters.get('messages', 0)
+        logger.info(f'Retomando la corrida de notificaciones #{run.pk} desde {cursor}')
+    else:
+        cursor = None
+        base_messages = 0
+        run.run_date = date.today()
+        run.started_at = timezone.now()
+        run.total = notification_service.get_expiring_subscriptions(days_list, run.run_date).count()
+        run.progress = {str(days): _empty_counters() for days in days_list}
+        run.cursor_counters = {'progress': run.progress, 'messages': 0}
+    run.status = NotificationRun.RunStatus.RUNNING
+    run.error_message = ''
+    run.finished_at = None
+    run.save(update_fields=[
+        'status', 'run_date', 'started_at', 'finished_at', 'total', 'progress', 'cursor_counters', 'error_message'
+    ])
+
+    last_flush = [time.monotonic()]
+
+    def _on_result(subscription, days, result):
+        horizon = run.progress.setdefault(str(days), _empty_counters())
+        horizon['processed'] += 1
+        if result.get('skipped'):
+            horizon['skipped'] += 1
+        else:
+            horizon['sent' if result['success'] else 'failed'] += 1
+        if on_result:
+            on_result(subscription, days, result)
+        if time.monotonic() - last_flush[0] >= PROGRESS_FLUSH_SECONDS:
+            NotificationRun.objects.filter(pk=run.pk).update(progress=run.progress)
+            last_flush[0] = time.monotonic()
+
+    def _checkpoint(chunk, stats):
+        # Los lotes traen grupos completos: el cursor es la mayor suscripción del último grupo
+        last_group = chunk[-1]
+        run.cursor_cliente_id = last_group[0][0].cliente_id
+        run.cursor_subscription_id = max(subscription.id for subscription, _ in last_group)
+        run.cursor_counters = {'progress': run.progress, 'messages': base_messages + stats['messages']}
+        run.checkpoint_at = timezone.now()
+        run.locked_until = run.checkpoint_at + timedelta(seconds=lease_seconds)
+        NotificationRun.objects.filter(pk=run.pk).update(
+            progress=run.progress,
+            cursor_cliente_id=run.cursor_cliente_id,
+            cursor_subscription_id=run.cursor_subscription_id,
+            cursor_counters=run.cursor_counters,
+            checkpoint_at=run.checkpoint_at,
+            locked_until=run.locked_until,
+        )
+        last_flush[0] = time.monotonic()
+
+    try:
+        summary = notification_service.run_daily_notifications(
+            days_list,
+            retries=retries,
+            on_result=_on_result,
+            concurrency=concurrency,
+            today=run.run_date,
+            after=cursor,
+            on_chunk=_checkpoint,
+        )
+    except Exception as e:
+        logger.exception(f'Error en la corrida de notificaciones #{run.pk}: {e}')
+        run.status = NotificationRun.RunStatus.FAILED
+        run.error_message = str(e)
+        summary = None
+    else:
+        run.status = NotificationRun.RunStatus.COMPLETED
+        summary = _merge_summary(summary, run.progress, base_messages, resumed)
+    run.summary = summary
+    run.finished_at = timezone.now()
+    run.locked_by = ''
+    run.locked_until = None
+    run.save(update_fields=[
+        'status', 'summary', 'error_message', 'progress', 'finished_at', 'locked_by', 'locked_until'
+    ])
+    return summary or {}
+
+
+def _merge_summary(stats: Dict[str, Any], progress: Dict[str, Dict[str, int]], base_messages: int,
+                   resumed: bool) -> Dict[str, Any]:
+    """Resumen de la pasada con los contadores acumulados de toda la corrida"""
+    stats['by_days'] = {
+        int(days): {'total': horizon['processed'], 'sent': horizon['sent'],
+                    'failed': horizon['failed'], 'skipped': horizon['skipped']}
+        for days, horizon in progress.items()
+    }
+    for key in ('total', 'sent', 'failed', 'skipped'):
+        stats[key] = sum(horizon[key] for horizon in stats['by_days'].values())
+    stats['messages'] += base_messages
+    stats['resumed'] = resumed
+    return stats
+
+
+def serialize_run(run) -> Dict[str, Any]:
+    """Estado de una corrida para el endpoint de estado"""
+    return {
+        'id': run.pk,
+        'status': run.status,
+        'source': run.source,
+        'days': run.days,
+        'run_date': run.run_date,
+        'created_at': run.created_at,
+        'started_at': run.started_at,
+        'finished_at': run.finished_at,
+        'total': run.total,
+        'processed': run.processed,
+        'progress': run.progress,
+        'cursor': run.cursor,
+        'checkpoint_at': run.checkpoint_at,
+        'summary': run.summary,
+        'error': run.error_message,
+    }
@@ -0,0 +1,264 @@
+"""
+Programador de tareas de notificaciones en el mismo proceso.
+
+Reemplaza a `auto_notifications.py` y `cron_notifications.py`, que lanzaban un
+`manage.py` por cada día de aviso: `notification_scheduler` arranca Django una
+vez y ejecuta las tareas en proceso, reutilizando la conexión a la base y el
+pool HTTP de WaSender.
+
+Las tareas se programan con expresiones cron de cinco campos (minuto, hora,
+día del mes, mes, día de la semana) en hora local, en
+NOTIFICATION_SETTINGS['SCHEDULER_JOBS']. Con varias réplicas, cada franja de
+cada tarea la ejecuta solo la réplica que gana el lock en `ScheduledJob`.
+
+Los avisos diarios se ejecutan como `NotificationRun` (ver runs.py): guardan
+un checkpoint por lote y, si el proceso se detiene a mitad de la corrida, el
+programador la retoma desde su cursor al volver a arrancar. Las franjas que
+vencieron mientras el proceso estaba detenido se ejecutan al arrancar si no
+pasaron más de SCHEDULER_MISFIRE_SECONDS.
+"""
+
+import logging
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+# Rango de cada campo cron: (mínimo, máximo)
+CRON_FIELDS = [(0, 59), (0, 23), (1, 31), (1, 12), (0, 7)]
+
+
+class CronSchedule:
+    """Expresión cron de cinco campos (soporta *, listas, rangos y pasos: '*/10', '1-5', '0,30')"""
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f'Expresión cron inválida (se esperan 5 campos): {expression!r}')
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = [
+            self._parse_field(part, low, high) for part, (low, high) in zip(parts, CRON_FIELDS)
+        ]
+        # 0 y 7 son domingo
+        self.weekdays = {day % 7 for day in weekdays}
+        # Como en cron: si se restringen día del mes y día de la semana, basta con que coincida uno
+        self.any_day = parts[2] == '*' or parts[4] == '*'
+
+    @staticmethod
+    def _parse_field(field: str, low: int, high: int) -> set:
+        values = set()
+        for item in field.split(','):
+            step = 1
+            if '/' in item:
+                item, step = item.split('/', 1)
+                step = int(step)
+            if item == '*':
+                start, end = low, high
+            elif '-' in item:
+                start, end = (int(value) for value in item.split('-', 1))
+            else:
+                start = end = int(item)
+            if start < low or end > high or start > end or step < 1:
+                raise ValueError(f'Campo cron fuera de rango: {field!r}')
+            values.update(range(start, end + 1, step))
+        return values
+
+    def matches(self, moment: datetime) -> bool:
+        """Si la expresión incluye el minuto de `moment` (en hora local)"""
+        moment = timezone.localtime(moment) if timezone.is_aware(moment) else moment
+        if moment.minute not in self.minutes or moment.hour not in self.hours or moment.month not in self.months:
+            return False
+        day_match = moment.day in self.days
+        weekday_match = (moment.weekday() + 1) % 7 in self.weekdays
+        if self.any_day:
+            return day_match and weekday_match
+        return day_match or weekday_match
+
+    def due_ticks(self, since: datetime, until: datetime) -> List[datetime]:
+        """Minutos programados en (since, until], truncados al minuto"""
+        tick = since.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        ticks = []
+        while tick <= until:
+            if self.matches(tick):
+                ticks.append(tick)
+            tick += timedelta(minutes=1)
+        return ticks
+
+
+# Tareas disponibles: nombre -> función sin argumentos que devuelve un resumen serializable
+
+def _execute_daily_run(days_list: Optional[List[int]], retries: bool) -> Dict[str, Any]:
+    """
+    Registra y ejecuta una corrida con checkpoints (la retoma notification_scheduler si se interrumpe)
+
+    Raises:
+        RuntimeError: si la corrida se interrumpe; queda FAILED para retomarla
+    """
+    from . import runs
+    from .models import NotificationRun
+    from .outbox import make_worker_id
+
+    owner = make_worker_id('scheduler')
+    lease_seconds = runs.get_run_lease_seconds()
+    run = runs.start_run(days_list, 'scheduler', owner, lease_seconds)
+    summary = runs.execute_run(run, retries=retries, lease_seconds=lease_seconds)
+    if run.status != NotificationRun.RunStatus.COMPLETED:
+        raise RuntimeError(f'La corrida #{run.pk} se interrumpió: {run.error_message}')
+    summary['run_id'] = run.pk
+    return summary
+
+
+def expiration_reminders() -> Dict[str, Any]:
+    """Avisos de vencimiento de todos los horizontes y reintentos vencidos"""
+    return _execute_daily_run(None, retries=True)
+
+
+def urgent_reminders() -> Dict[str, Any]:
+    """Avisos de las suscripciones que vencen hoy aún no notificadas (p. ej. creadas durante el día)"""
+    return _execute_daily_run([0], retries=False)
+
+
+def enqueue_reminders() -> Dict[str, Any]:
+    """Encola los avisos del día repartidos en la ventana de envío (los envía run_notification_worker)"""
+    from .services import notification_service
+
+    return notification_service.enqueue_expiration_notifications(spread=True)
+
+
+def retry_failed() -> Dict[str, Any]:
+    """Etapa de reintentos de envíos fallidos cuyo backoff ya venció"""
+    from .services import notification_service
+
+    return notification_service.retry_due_notifications(
+        concurrency=notification_service.get_send_options()['concurrency'],
+    )
+
+
+JOBS: Dict[str, Callable[[], Dict[str, Any]]] = {
+    'expiration_reminders': expiration_reminders,
+    'urgent_reminders': urgent_reminders,
+    'enqueue_reminders': enqueue_reminders,
+    'retry_failed': retry_failed,
+}
+
+# Misma programación que tenía auto_notifications.py, más reintentos periódicos
+DEFAULT_SCHEDULE = {
+    'expiration_reminders': '0 9 * * *',
+    'urgent_reminders': '0 18 * * *',
+    'retry_failed': '*/15 * * * *',
+}
+
+
+def get_scheduled_jobs() -> Dict[str, CronSchedule]:
+    """Tareas programadas (NOTIFICATION_SETTINGS['SCHEDULER_JOBS']) con su expresión cron"""
+    notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+    configured = notification_settings.get('SCHEDULER_JOBS', DEFAULT_SCHEDULE)
+    jobs = {}
+    for name, expression in configured.items():
+        if name not in JOBS:
+            raise ValueError(f'Tarea programada desconocida: {name!r} (disponibles: {", ".join(JOBS)})')
+        jobs[name] = CronSchedule(expression)
+    return jobs
+
+
+def get_misfire_seconds() -> int:
+    """Antigüedad máxima de una franja perdida que se ejecuta al arrancar (SCHEDULER_MISFIRE_SECONDS)"""
+    notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+    return notification_settings.get('SCHEDULER_MISFIRE_SECONDS', 3600)
+
+
+def get_catch_up_since(names, now: datetime) -> Dict[str, datetime]:
+    """
+    Desde cuándo buscar franjas vencidas de cada tarea al arrancar el programador
+
+    Parte de la última franja ejecutada (`ScheduledJob.last_scheduled_for`)
+    para no perder las que vencieron durante un reinicio, pero no más atrás
+    de SCHEDULER_MISFIRE_SECONDS. Una tarea que nunca se ejecutó empieza ahora.
+    """
+    from .models import ScheduledJob
+
+    oldest = now - timedelta(seconds=get_misfire_seconds())
+    last_ticks = dict(ScheduledJob.objects.filter(name__in=list(names)).values_list('name', 'last_scheduled_for'))
+    return {
+        name: max(last_ticks[name], oldest) if last_ticks.get(name) else now
+        for name in names
+    }
+
+
+def get_lock_seconds() -> int:
+    """Duración máxima del lock de una tarea (SCHEDULER_LOCK_SECONDS)"""
+    notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+    return notification_settings.get('SCHEDULER_LOCK_SECONDS', 6 * 3600)
+
+
+def acquire_job(name: str, scheduled_for: datetime, owner: str, lock_seconds: Optional[int] = None) -> bool:
+    """
+    Intenta tomar la franja `scheduled_for` de la tarea `name` para `owner`
+
+    El UPDATE es condicional: el lock debe estar libre (o vencido) y la franja
+    no debe haberse ejecutado ya, así que una sola réplica gana cada franja.
+    """
+    from .models import ScheduledJob
+
+    now = timezone.now()
+    ScheduledJob.objects.get_or_create(name=name)
+    taken = ScheduledJob.objects.filter(
+        Q(locked_until__isnull=True) | Q(locked_until__lt=now),
+        Q(last_scheduled_for__isnull=True) | Q(last_scheduled_for__lt=scheduled_for),
+        name=name,
+    ).update(
+        locked_by=owner,
+        locked_until=now + timedelta(seconds=lock_seconds or get_lock_seconds()),
+        last_scheduled_for=scheduled_for,
+        last_started_at=now,
+        last_status=ScheduledJob.JobStatus.RUNNING,
+        last_error='',
+    )
+    return taken == 1
+
+
+def finish_job(name: str, owner: str, result: Optional[Dict[str, Any]] = None, error: str = '') -> None:
+    """Libera el lock de la tarea y guarda el resultado de la ejecución"""
+    from .models import ScheduledJob
+
+    ScheduledJob.objects.filter(name=name, locked_by=owner).update(
+        locked_by='',
+        locked_until=None,
+        last_finished_at=timezone.now(),
+        last_status=ScheduledJob.JobStatus.FAILED if error else ScheduledJob.JobStatus.SUCCESS,
+        last_result=result,
+        last_error=error,
+    )
+
+
+def run_job(name: str, scheduled_for: datetime, owner: str) -> Optional[Dict[str, Any]]:
+    """
+    Ejecuta la tarea en este proceso si esta réplica gana su franja
+
+    Returns:
+        Dict con `result` o `error`, o None si otra réplica ya la tomó
+    """
+    # Descartar conexiones caídas o que superaron CONN_MAX_AGE entre franjas
+    close_old_connections()
+    notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+    if not notification_settings.get('ENABLE_WHATSAPP_NOTIFICATIONS', False):
+        logger.warning(f'Tarea {name} omitida: las notificaciones de WhatsApp están deshabilitadas')
+        return {'error': 'Las notificaciones de WhatsApp están deshabilitadas'}
+    if not acquire_job(name, scheduled_for, owner):
+        logger.info(f'Tarea {name} ({scheduled_for:%Y-%m-%d %H:%M}) ya tomada por otra réplica')
+        return None
+
+    logger.info(f'Ejecutando tarea {name} ({scheduled_for:%Y-%m-%d %H:%M})')
+    try:
+        result = JOBS[name]()
+    except Exception as e:
+        logger.exception(f'Error en la tarea {name}: {e}')
+        finish_job(name, owner, error=str(e))
+        return {'error': str(e)}
+    finish_job(name, owner, result=result)
+    return {'result': result}
@@ -0,0 +1,113 @@
+"""
+Ventana de envío de los recordatorios masivos.
+
+En lugar de salir todos juntos a NOTIFICATION_TIME_HOUR, los mensajes del día
+se reparten en franjas de SEND_WINDOW_SLOT_MINUTES dentro de la ventana
+SEND_WINDOW_START–SEND_WINDOW_END (hora local, TIME_ZONE). Cada franja recibe
+la misma cantidad de mensajes, sin superar lo que el ritmo de envío permite
+despachar en ella; el outbox solo entrega un registro a los workers cuando
+llega su `scheduled_for` (ver outbox.lease_notifications).
+"""
+
+import logging
+import math
+from datetime import date, datetime, time, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+from django.conf import settings
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+def get_window_settings() -> Dict[str, Any]:
+    """Inicio, fin y tamaño de franja configurados en NOTIFICATION_SETTINGS"""
+    notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+    return {
+        'start': notification_settings.get('SEND_WINDOW_START', '09:00'),
+        'end': notification_settings.get('SEND_WINDOW_END', '12:00'),
+        'slot_minutes': notification_settings.get('SEND_WINDOW_SLOT_MINUTES', 5),
+    }
+
+
+def _parse_time(value: str) -> time:
+    hours, minutes = str(value).split(':')
+    return time(int(hours), int(minutes))
+
+
+def get_send_window(send_date: Optional[date] = None) -> Tuple[datetime, datetime]:
+    """
+    Inicio y fin de la ventana de envío de un día, en la zona horaria del proyecto
+
+    Args:
+        send_date: Día de envío (default: hoy en hora local)
+    """
+    window = get_window_settings()
+    send_date = send_date or timezone.localdate()
+    start = timezone.make_aware(datetime.combine(send_date, _parse_time(window['start'])))
+    end = timezone.make_aware(datetime.combine(send_date, _parse_time(window['end'])))
+    if end <= start:
+        raise ValueError('SEND_WINDOW_END debe ser posterior a SEND_WINDOW_START')
+    return start, end
+
+
+def plan_send_slots(count: int, rate: float, send_date: Optional[date] = None,
+                    now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Reparte `count` mensajes en franjas de la ventana de envío
+
+    Si la ventana ya empezó se usa lo que queda de ella; si ya terminó, los
+    mensajes quedan sin franja (se envían de inmediato). Cuando el volumen
+    supera lo que `rate` permite despachar en la ventana, las franjas se
+    llenan a su capacidad y el plan se extiende más allá del fin (`overflow`).
+
+    Args:
+        count: Mensajes a programar
+        rate: Mensajes por segundo con que se despachará (OUTBOUND_RATE_PER_SECOND)
+        send_date: Día de envío (default: hoy)
+        now: Momento de referencia (default: ahora)
+
+    Returns:
+        Dict con `slots` (fecha de envío de cada mensaje, en orden), `per_slot`,
+        `slot_count`, `first`, `last` y `overflow`
+    """
+    now = now or timezone.now()
+    start, end = get_send_window(send_date)
+    start = max(start, now)
+    plan = {'slots': [None] * count, 'per_slot': count, 'slot_count': 1 if count else 0,
+            'first': None, 'last': None, 'overflow': False}
+    if not count or start >= end:
+        return plan
+
+    slot_seconds = get_window_settings()['slot_minutes'] * 60
+    slot_count = max(1, math.ceil((end - start).total_seconds() / slot_seconds))
+    capacity = max(1, int(slot_seconds * rate))
+    per_slot = min(math.ceil(count / slot_count), capacity)
+
+    plan['slots'] = [start + timedelta(seconds=(index // per_slot) * slot_seconds) for index in range(count)]
+    plan['per_slot'] = per_slot
+    plan['slot_count'] = math.ceil(count / per_slot)
+    plan['first'] = plan['slots'][0]
+    plan['last'] = plan['slots'][-1]
+    plan['overflow'] = plan['last'] >= end
+    if plan['overflow']:
+        logger.warning(
+            f'{count} mensajes no caben en la ventana de envío a {rate:g} msg/s; '
+            f'la última franja empieza a las {timezone.localtime(plan["last"]):%H:%M}'
+        )
+    return plan
+
+
+def assign_send_slots(notification_logs: List, rate: float, send_date: Optional[date] = None,
+                      now: Optional[datetime] = None) -> Dict[str, Any]:
+    """
+    Asigna `scheduled_for` a cada registro que se envía (y a sus agrupados)
+
+    Returns:
+        El plan de plan_send_slots, sin la lista de franjas
+    """
+    plan = plan_send_slots(len(notification_logs), rate, send_date, now)
+    for notification_log, scheduled_for in zip(notification_logs, plan.pop('slots')):
+        for row in (notification_log, *getattr(notification_log, 'group_members', [])):
+            row.scheduled_for = scheduled_for
+    return plan
@@ -1,41 +1,148 @@
-import requests
+import httpx
+import itertools
 import logging
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from django.conf import settings
-from typing import Optional, Dict, Any
+from django.db import IntegrityError, transaction
+from django.db.models import Q
+from django.utils import timezone
+from typing import Optional, Dict, Any, Callable, Iterable, List, Tuple
 from datetime import date, timedelta
 
+from .outbox import get_batch_lease_seconds, get_lease_seconds, lease_retries, make_worker_id
+from .phone import normalize_phone, phone_key
+from .circuit_breaker import CircuitBreaker
+from .dispatch import LANE_BULK, LANE_MANUAL, get_dispatcher
+from .sessions import get_session_pool
+from .throttling import backoff_delay
+
 logger = logging.getLogger(__name__)
 
+try:
+    import h2  # noqa: F401  (habilita HTTP/2 en httpx)
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
+
+_http_client = None
+_http_client_lock = threading.Lock()
+
+
+def get_http_client() -> httpx.Client:
+    """
+    Cliente HTTP keep-alive compartido por todo el proceso.
+    
+    Reutiliza las conexiones TCP+TLS a WaSender entre mensajes y entre hilos
+    (comando de notificaciones, recordatorios manuales y webhook). Usa HTTP/2
+    cuando el paquete `h2` está instalado.
+    """
+    global _http_client
+    if _http_client is None:
+        with _http_client_lock:
+            if _http_client is None:
+                pool_size = getattr(settings, 'WASENDER_HTTP_POOL_SIZE', 10)
+                _http_client = httpx.Client(
+                    http2=HTTP2_AVAILABLE,
+                    limits=httpx.Limits(
+                        max_connections=pool_size,
+                        max_keepalive_connections=pool_size,
+                    ),
+                    timeout=httpx.Timeout(
+                        getattr(settings, 'WASENDER_READ_TIMEOUT', 30),
+                        connect=getattr(settings, 'WASENDER_CONNECT_TIMEOUT', 5),
+                    ),
+                )
+    return _http_client
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name: str = 'wasender') -> CircuitBreaker:
+    """
+    Circuit breaker compartido por todo el proceso para la API de WaSender
+    (uno por sesión, ver sessions.get_session_pool)
+    
+    Se configura con WASENDER_CIRCUIT_FAILURE_THRESHOLD, WASENDER_CIRCUIT_ERROR_RATE,
+    WASENDER_CIRCUIT_WINDOW y WASENDER_CIRCUIT_RESET_SECONDS.
+    """
+    if name not in _circuit_breakers:
+        with _circuit_breakers_lock:
+            if name not in _circuit_breakers:
+                _circuit_breakers[name] = CircuitBreaker(
+                    name,
+                    failure_threshold=getattr(settings, 'WASENDER_CIRCUIT_FAILURE_THRESHOLD', 5),
+                    error_rate=getattr(settings, 'WASENDER_CIRCUIT_ERROR_RATE', 0.5),
+                    window_size=getattr(settings, 'WASENDER_CIRCUIT_WINDOW', 20),
+                    reset_timeout=getattr(settings, 'WASENDER_CIRCUIT_RESET_SECONDS', 30),
+                )
+    return _circuit_breakers[name]
+
+
+# Códigos 4xx que no indican una petición inválida sino saturación momentánea
+RETRYABLE_STATUS_CODES = (408, 425, 429)
+
+# Códigos con los que WaSender rechaza una sesión desconectada o una API key inválida
+AUTH_ERROR_STATUS_CODES = (401, 403)
+
+# Textos de la respuesta que distinguen una sesión desconectada (hay failover)
+# de una API key inválida o revocada (error de configuración)
+SESSION_DISCONNECTED_MARKERS = ('not connected', 'disconnected', 'logged out')
+
+
+def is_session_disconnected(response: httpx.Response) -> bool:
+    """True si el cuerpo de un 401/403 indica que la sesión de WhatsApp está desconectada"""
+    text = response.text.lower()
+    return any(marker in text for marker in SESSION_DISCONNECTED_MARKERS)
+
+
 class WhatsAppService:
     """Servicio para enviar notificaciones por WhatsApp usando WaSender API"""
     
     def __init__(self):
         self.api_url = getattr(settings, 'WASENDER_API_URL', 'https://wasenderapi.com')
-        self.api_key = getattr(settings, 'WASENDER_API_KEY', '')
-        self.session_id = getattr(settings, 'WASENDER_SESSION_ID', '')
         self.webhook_url = getattr(settings, 'WASENDER_WEBHOOK_URL', '')
         self.webhook_secret = getattr(settings, 'WASENDER_WEBHOOK_SECRET', '')
+        # Números de envío (WASENDER_SESSIONS), cada uno con su ritmo y su circuit breaker
+        self.sessions = get_session_pool()
+        # None = sin reparto por carriles (p. ej. benchmark sin límite)
+        self.dispatcher = get_dispatcher()
         
-    def send_message(self, phone_number: str, message: str) -> Dict[str, Any]:
+    def send_message(self, phone_number: str, message: str, lane: str = LANE_BULK,
+                     queued_at=None) -> Dict[str, Any]:
         """
         Envía un mensaje de WhatsApp a un número específico
         
+        El mensaje sale por la sesión preferida del destinatario (ver
+        sessions.SessionPool.route); si su circuito está abierto o WaSender
+        responde que está desconectada, se intenta con la siguiente. Un 401/403
+        sin ese aviso es una API key inválida: no se reintenta y se abre el
+        circuito de esa sesión.
+        
         Args:
             phone_number: Número de teléfono (con código de país, sin +)
             message: Mensaje a enviar
+            lane: Carril de prioridad (ver dispatch.LANES)
+            queued_at: Desde cuándo espera el mensaje, para medir la latencia de cola
             
         Returns:
-            Dict con la respuesta de la API
+            Dict con la respuesta de la API y la sesión usada (`session`). En los
+            errores, `retryable` indica si vale la pena reintentar (timeouts,
+            errores de conexión, 5xx, 429 y sesiones desconectadas) o si el error
+            es permanente (4xx: número o petición inválidos, API key rechazada)
         """
-        if not self.api_key:
+        if not len(self.sessions):
             logger.error("WaSender API key no configurado")
-            return {'success': False, 'error': 'API key no configurada'}
+            return {'success': False, 'error': 'API key no configurada', 'retryable': False}
         
         # Limpiar el número de teléfono y agregar + si no lo tiene
         clean_phone = self._clean_phone_number(phone_number)
         if not clean_phone:
             logger.error(f"Número de teléfono inválido: {phone_number}")
-            return {'success': False, 'error': 'Número de teléfono inválido'}
+            return {'success': False, 'error': 'Número de teléfono inválido', 'retryable': False}
         
         # Asegurar que el número tenga el formato +593XXXXXXXXX (Ecuador)
         if not clean_phone.startswith('+'):
@@ -45,10 +152,6 @@ class WhatsAppService:
         logger.info(f"Número limpio: {clean_phone}")
         
         url = f"{self.api_url}/api/send-message"
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {self.api_key}'
-        }
         
         # Payload corregido: usar 'text' en lugar de 'message'
         payload = {
@@ -56,16 +159,67 @@ class WhatsAppService:
             'text': message
         }
         
-        # NO agregar session_id por ahora para probar formato mínimo
-        # if self.session_id:
-        #     payload['session_id'] = str(self.session_id)
+        # La sesión se elige por su API key; NO agregar session_id al payload por ahora
+        # para mantener el formato mínimo
+        
+        # Turno del carril dentro del ritmo compartido; sin sesiones disponibles no se espera
+        if self.dispatcher is not None and not self.sessions.is_open():
+            self.dispatcher.acquire(lane, queued_at)
         
+        result = None
+        for session in self.sessions.route(clean_phone):
+            # Circuito abierto: pasar a la siguiente sesión en lugar de esperar el timeout
+            if not session.circuit.allow_request():
+                continue
+            if session.limiter is not None:
+                session.limiter.acquire()
+            headers = {
+                'Content-Type': 'application/json',
+                'Authorization': f'Bearer {session.api_key}'
+            }
+            result = self._post_message(url, payload, headers, clean_phone)
+            result['session'] = session.name
+            if result.get('session_error'):
+                # Sesión desconectada: el mensaje no salió, se intenta por la siguiente
+                session.circuit.record_failure()
+                logger.warning(f"Sesión de WaSender {session.name} desconectada; failover para {clean_phone}")
+                continue
+            if result.get('config_error'):
+                # API key inválida: fallaría igual en cada envío, así que no se
+                # reintenta y el circuito queda abierto hasta que se corrija
+                session.circuit.trip()
+                logger.error(
+                    f"Error de configuración: WaSender rechazó la API key de la sesión {session.name} "
+                    f"({result.get('status_code')}); revisar WASENDER_SESSIONS / WASENDER_API_KEY"
+                )
+                return result
+            # Solo los errores transitorios cuentan contra el circuito: un 4xx
+            # significa que WaSender está respondiendo
+            if result['success'] or not result.get('retryable'):
+                session.circuit.record_success()
+            else:
+                session.circuit.record_failure()
+            return result
+        
+        if result is None:
+            logger.warning(f"Todas las sesiones de WaSender tienen el circuito abierto; no se envía a {clean_phone}")
+            return {
+                'success': False,
+                'error': 'WaSender no disponible (circuito abierto)',
+                'retryable': True,
+                'circuit_open': True,
+            }
+        return result
+    
+    def _post_message(self, url: str, payload: Dict[str, Any], headers: Dict[str, str],
+                      clean_phone: str) -> Dict[str, Any]:
+        """Hace la petición a send-message y clasifica el resultado"""
         try:
             logger.info(f"Enviando WhatsApp a {clean_phone}")
             logger.info(f"URL: {url}")
             logger.info(f"Payload: {payload}")
             
-            response = requests.post(url, json=payload, headers=headers, timeout=30)
+            response = get_http_client().post(url, json=payload, headers=headers)
             
             # Log de la respuesta para debug
             logger.info(f"Status Code: {response.status_code}")
@@ -77,12 +231,27 @@ class WhatsAppService:
             logger.info(f"Mensaje enviado exitosamente a {clean_phone}")
             return {'success': True, 'data': result}
             
-        except requests.exceptions.RequestException as e:
+        except httpx.HTTPStatusError as e:
+            status_code = e.response.status_code
             logger.error(f"Error al enviar mensaje a {clean_phone}: {str(e)}")
-            return {'success': False, 'error': str(e)}
+            auth_error = status_code in AUTH_ERROR_STATUS_CODES
+            session_error = auth_error and is_session_disconnected(e.response)
+            return {
+                'success': False,
+                'error': str(e),
+                'status_code': status_code,
+                'retryable': (status_code >= 500 or status_code in RETRYABLE_STATUS_CODES
+                              or session_error),
+                'session_error': session_error,
+                'config_error': auth_error and not session_error,
+            }
+        except httpx.HTTPError as e:
+            # Timeouts y errores de conexión: transitorios
+            logger.error(f"Error al enviar mensaje a {clean_phone}: {str(e)}")
+            return {'success': False, 'error': str(e), 'retryable': True}
         except Exception as e:
             logger.error(f"Error inesperado al enviar mensaje: {str(e)}")
-            return {'success': False, 'error': str(e)}
+            return {'success': False, 'error': str(e), 'retryable': False}
     
     def _clean_phone_number(self, phone: str) -> Optional[str]:
         """
@@ -93,44 +262,14 @@ class WhatsAppService:
             phone: Número de teléfono a limpiar
             
         Returns:
-            Número limpio o None si es inválido
+            Número limpio (solo dígitos, con código de país) o None si es inválido
         """
-        if not phone:
-            return None
-        
-        # Remover espacios, guiones, paréntesis, + etc.
-        clean = ''.join(filter(str.isdigit, phone))
-        
-        # Manejar diferentes formatos según el país
-        
-        # Ecuador: números móviles empiezan con 09 (ej: 0968196046)
-        if len(clean) == 10 and clean.startswith('09'):
-            # Remover el 0 inicial y agregar código de Ecuador
-            clean = '593' + clean[1:]  # 0968196046 -> 593968196046
-        
-        # Colombia: números móviles empiezan con 3 o 6
-        elif len(clean) == 10 and clean.startswith(('3', '6')):
-            clean = '57' + clean  # 3001234567 -> 573001234567
-        
-        # Número fijo colombiano sin código de área
-        elif len(clean) == 7:
-            clean = '571' + clean  # Asumir Bogotá
-        
-        # Si ya tiene código de país, validar que sea correcto
-        elif len(clean) >= 11:
-            if clean.startswith('593') and len(clean) == 12:  # Ecuador
-                pass  # Ya está correcto
-            elif clean.startswith('57') and len(clean) == 12:  # Colombia
-                pass  # Ya está correcto
-            else:
-                # Otros países o formatos no soportados
-                logger.warning(f"Formato de número no reconocido: {phone}")
-        
-        # Validar longitud final
-        if len(clean) < 10:
-            return None
-            
-        return clean
+        normalized = normalize_phone(phone)
+        return normalized[1:] if normalized else None
+
+
+# Segundos máximos que los resultados de envío quedan en memoria antes del bulk_update
+RESULT_FLUSH_SECONDS = 5
 
 
 class NotificationService:
@@ -150,88 +289,756 @@ class NotificationService:
         Returns:
             Dict con el resultado del envío
         """
-        from .models import NotificationLog
-        
         if not subscription.cliente.telefono:
             return {'success': False, 'error': 'Cliente no tiene teléfono registrado'}
         
-        message = self._create_expiration_message(subscription, days_until_expiration)
+        # El registro nace con lease propio para que los workers del outbox no lo tomen
+        notification_log = self.create_expiration_log(
+            subscription, days_until_expiration, lease_owner=make_worker_id('inline')
+        )
+        
+        # Enviar mensaje (recordatorio puntual pedido por un agente)
+        result = self.whatsapp.send_message(
+            subscription.cliente.telefono,
+            notification_log.message_content,
+            lane=LANE_MANUAL,
+        )
+        
+        self.record_result(notification_log, result)
+        return result
+    
+    def build_expiration_log(self, subscription, days_until_expiration: int, lease_owner: str = '',
+                             lease_seconds: Optional[float] = None, send_date: Optional[date] = None,
+                             message: Optional[str] = None):
+        """
+        Construye (sin guardar) el registro PENDING de una notificación de vencimiento con su mensaje
+        
+        Args:
+            subscription: Objeto Subscription
+            days_until_expiration: Días hasta el vencimiento
+            lease_owner: Si se indica, el registro se crea ya tomado por ese worker
+                (envío en línea); si no, queda libre en el outbox
+            lease_seconds: Duración del lease (default: OUTBOX_LEASE_SECONDS)
+            send_date: Fecha de envío de las corridas automáticas; genera la clave de
+                deduplicación (None para envíos manuales, que pueden repetirse)
+            message: Mensaje ya renderizado (default: se renderiza aquí)
+        """
+        from .models import NotificationLog
         
-        # Crear registro de notificación
-        notification_log = NotificationLog.objects.create(
+        if message is None:
+            message = self._create_expiration_message(subscription, days_until_expiration)
+        locked_until = None
+        if lease_owner:
+            locked_until = timezone.now() + timedelta(seconds=lease_seconds or get_lease_seconds())
+        
+        return NotificationLog(
             subscription=subscription,
             notification_type=NotificationLog.NotificationType.EXPIRATION_WARNING,
             phone_number=subscription.cliente.telefono,
+            phone_e164=subscription.cliente.telefono_e164 or normalize_phone(subscription.cliente.telefono) or '',
+            phone_key=subscription.cliente.telefono_clave or phone_key(subscription.cliente.telefono),
             message_content=message,
             days_notice=days_until_expiration,
-            status=NotificationLog.NotificationStatus.PENDING
+            status=NotificationLog.NotificationStatus.PENDING,
+            locked_by=lease_owner,
+            locked_until=locked_until,
+            dedup_key=NotificationLog.make_dedup_key(
+                subscription.id, NotificationLog.NotificationType.EXPIRATION_WARNING,
+                days_until_expiration, send_date
+            ) if send_date else None
         )
+    
+    def create_expiration_log(self, subscription, days_until_expiration: int, lease_owner: str = ''):
+        """Crea y guarda el registro PENDING de una notificación (ver build_expiration_log)"""
+        notification_log = self.build_expiration_log(subscription, days_until_expiration, lease_owner)
+        notification_log.save()
+        return notification_log
+    
+    @staticmethod
+    def get_batch_size() -> int:
+        """Tamaño de lote para bulk_create/bulk_update de NotificationLog (LOG_BATCH_SIZE)"""
+        notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+        return notification_settings.get('LOG_BATCH_SIZE', 500)
+    
+    def get_existing_dedup_keys(self, dedup_keys: Iterable[str]) -> set:
+        """Claves de deduplicación que ya tienen registro (una sola consulta por lote)"""
+        from .models import NotificationLog
         
-        # Enviar mensaje
-        result = self.whatsapp.send_message(
-            subscription.cliente.telefono,
-            message
+        return set(
+            NotificationLog.objects.filter(dedup_key__in=list(dedup_keys)).values_list('dedup_key', flat=True)
         )
+    
+    def create_logs(self, notification_logs: List, batch_size: Optional[int] = None) -> List:
+        """
+        Inserta los registros PENDING de un lote con bulk_create
+        
+        Si otra corrida insertó alguna de las mismas claves de deduplicación entre
+        la verificación y el INSERT, el lote se reintenta fila a fila y se omiten
+        las repetidas.
+        
+        Los registros agrupados (`group_members` de un recordatorio por cliente)
+        se insertan después, ya enlazados al registro que se envía.
+        
+        Returns:
+            Registros efectivamente creados (sin contar los agrupados)
+        """
+        created = self._insert_logs(notification_logs, batch_size)
+        members = []
+        for notification_log in created:
+            for member in getattr(notification_log, 'group_members', []):
+                member.grouped_with = notification_log
+                members.append(member)
+        if members:
+            created_members = {id(member) for member in self._insert_logs(members, batch_size)}
+            for notification_log in created:
+                notification_log.group_members = [
+                    member for member in getattr(notification_log, 'group_members', [])
+                    if id(member) in created_members
+                ]
+        return created
+    
+    def _insert_logs(self, notification_logs: List, batch_size: Optional[int] = None) -> List:
+        """bulk_create con respaldo fila a fila ante claves de deduplicación repetidas"""
+        from .models import NotificationLog
+        
+        try:
+            return NotificationLog.objects.bulk_create(notification_logs, batch_size=batch_size or self.get_batch_size())
+        except IntegrityError:
+            logger.warning('Claves de notificación duplicadas en el lote; insertando fila a fila')
+        
+        created = []
+        for notification_log in notification_logs:
+            notification_log.pk = None
+            try:
+                with transaction.atomic():
+                    notification_log.save(force_insert=True)
+                created.append(notification_log)
+            except IntegrityError:
+                logger.info(f'Notificación {notification_log.dedup_key} ya registrada; se omite')
+        return created
+    
+    def flush_results(self, notification_logs: List, batch_size: Optional[int] = None,
+                      worker_id: Optional[str] = None) -> None:
+        """
+        Persiste con bulk_update el resultado de un lote de registros
+        
+        Enviados y fallidos se actualizan por separado para que cada grupo solo
+        reescriba sus columnas (status/sent_at/api_response o status/error_message).
+        Incluye los registros agrupados de cada recordatorio por cliente.
+        
+        Con `worker_id` solo se persisten los registros que siguen tomados por
+        ese worker: si el lease venció y otro worker los tomó, su resultado no
+        se pisa.
+        """
+        from .models import NotificationLog
+        
+        batch_size = batch_size or self.get_batch_size()
+        if worker_id is not None:
+            with transaction.atomic():
+                owned = set(
+                    NotificationLog.objects.select_for_update()
+                    .filter(id__in=[notification_log.id for notification_log in notification_logs],
+                            locked_by=worker_id)
+                    .values_list('id', flat=True)
+                )
+                lost = [notification_log.id for notification_log in notification_logs
+                        if notification_log.id not in owned]
+                if lost:
+                    logger.warning(
+                        f"{worker_id} perdió el lease de {len(lost)} notificaciones; no se guarda su resultado"
+                    )
+                self.flush_results(
+                    [notification_log for notification_log in notification_logs if notification_log.id in owned],
+                    batch_size,
+                )
+            return
+        notification_logs = [
+            row for notification_log in notification_logs
+            for row in (notification_log, *getattr(notification_log, 'group_members', []))
+        ]
+        sent = [log for log in notification_logs if log.status == NotificationLog.NotificationStatus.SENT]
+        failed = [log for log in notification_logs if log.status != NotificationLog.NotificationStatus.SENT]
+        if sent:
+            NotificationLog.objects.bulk_update(sent, fields=NotificationLog.SENT_FIELDS, batch_size=batch_size)
+        if failed:
+            NotificationLog.objects.bulk_update(failed, fields=NotificationLog.FAILED_FIELDS, batch_size=batch_size)
+    
+    def send_notification_log(self, notification_log, commit: bool = True) -> Dict[str, Any]:
+        """
+        Envía un registro del outbox (teléfono y mensaje ya persistidos) y registra el resultado
         
-        # Actualizar el registro según el resultado
+        Args:
+            notification_log: NotificationLog PENDING (o FAILED a reintentar) tomado por el worker
+            commit: False para solo actualizar en memoria y persistir luego con flush_results
+            
+        Returns:
+            Dict con el resultado del envío
+        """
+        is_retry = notification_log.status == notification_log.NotificationStatus.FAILED
+        try:
+            result = self.whatsapp.send_message(
+                notification_log.phone_number,
+                notification_log.message_content,
+                lane=LANE_BULK,
+                queued_at=notification_log.next_retry_at if is_retry else (
+                    notification_log.scheduled_for or notification_log.created_at
+                ),
+            )
+        except Exception as e:
+            logger.error(f"Error inesperado enviando notificación {notification_log.id}: {str(e)}")
+            result = {'success': False, 'error': str(e), 'retryable': True}
+        if is_retry and not result.get('circuit_open'):
+            # Reintento programado (ver outbox.lease_retries); diferirlo por el circuito no cuenta
+            notification_log.retry_count += 1
+        self.record_result(notification_log, result, commit=commit)
+        return result
+    
+    def record_result(self, notification_log, result: Dict[str, Any], commit: bool = True) -> None:
+        """
+        Actualiza el registro de notificación según el resultado del envío
+        
+        Con commit=False solo se modifica en memoria (ver flush_results). El
+        resultado se copia a los registros agrupados del mismo mensaje.
+        """
+        from .models import NotificationLog
+        
+        subscription = notification_log.subscription
         if result['success']:
-            notification_log.mark_as_sent(result.get('data'))
+            notification_log.mark_as_sent(result.get('data'), commit=commit)
             logger.info(f"Notificación enviada a {subscription.cliente.nombre_completo} - Suscripción {subscription.id}")
         else:
-            notification_log.mark_as_failed(result.get('error'))
+            retry_at = self.get_retry_time(notification_log, result)
+            notification_log.mark_as_failed(result.get('error'), commit=commit, retry_at=retry_at)
             logger.error(f"Error enviando notificación a {subscription.cliente.nombre_completo}: {result.get('error')}")
+            if retry_at:
+                logger.info(
+                    f"Notificación {notification_log.id or ''} programada para el reintento "
+                    f"{notification_log.retry_count + 1} a las {retry_at:%H:%M:%S}"
+                )
+        members = notification_log.sync_group_members()
+        if commit and members:
+            NotificationLog.objects.bulk_update(members, fields=NotificationLog.GROUP_FIELDS)
+    
+    @staticmethod
+    def get_retry_policy() -> Dict[str, Any]:
+        """Reintentos máximos y espera base/máxima (segundos) de NOTIFICATION_SETTINGS"""
+        notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+        return {
+            'max_attempts': notification_settings.get('RETRY_MAX_ATTEMPTS', 3),
+            'base_seconds': notification_settings.get('RETRY_BASE_SECONDS', 60),
+            'max_seconds': notification_settings.get('RETRY_MAX_SECONDS', 3600),
+        }
+    
+    def get_retry_time(self, notification_log, result: Dict[str, Any]):
+        """
+        Fecha del próximo reintento de un envío fallido
         
-        return result
+        Los envíos rechazados por el circuito abierto se difieren hasta la
+        petición de prueba sin consumir reintentos.
+        
+        Returns:
+            datetime, o None si el error es permanente o se agotaron los reintentos
+        """
+        policy = self.get_retry_policy()
+        if result.get('circuit_open'):
+            delay = self.whatsapp.sessions.retry_in() + backoff_delay(0, policy['base_seconds'], policy['max_seconds'])
+            return timezone.now() + timedelta(seconds=delay)
+        if not result.get('retryable') or notification_log.retry_count >= policy['max_attempts']:
+            return None
+        delay = backoff_delay(notification_log.retry_count, policy['base_seconds'], policy['max_seconds'])
+        return timezone.now() + timedelta(seconds=delay)
     
-    def _create_expiration_message(self, subscription, days_until_expiration: int) -> str:
+    def retry_due_notifications(self, concurrency: int = 1, batch_size: int = 50) -> Dict[str, int]:
+        """
+        Etapa de reintentos: reenvía los FAILED cuyo next_retry_at ya venció
+        
+        Toma lotes con lease (seguro con varios workers), envía con varias
+        peticiones en vuelo y persiste cada lote con bulk_update.
+        
+        Returns:
+            Dict con retried, sent y failed
+        """
+        stats = {'retried': 0, 'sent': 0, 'failed': 0}
+        worker_id = make_worker_id('retry')
+        # El lease cubre el lote completo al ritmo del despachador
+        dispatcher = self.whatsapp.dispatcher
+        lease_seconds = get_batch_lease_seconds(batch_size, dispatcher.rate) if dispatcher else None
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            while True:
+                batch = lease_retries(worker_id, batch_size, lease_seconds)
+                if not batch:
+                    break
+                results = executor.map(
+                    lambda notification_log: self.send_notification_log(notification_log, commit=False),
+                    batch
+                )
+                for result in results:
+                    stats['retried'] += 1
+                    stats['sent' if result['success'] else 'failed'] += 1
+                self.flush_results(batch, worker_id=worker_id)
+        return stats
+    
+    def send_expiration_batch(self, items: Iterable[Tuple[Any, int]], concurrency: int = 1,
+                              on_result: Optional[Callable] = None,
+                              batch_size: Optional[int] = None,
+                              today: Optional[date] = None,
+                              coalesce: Optional[bool] = None,
+                              sorted_by_cliente: bool = False,
+                              on_chunk: Optional[Callable] = None) -> Dict[str, Any]:
         """
-        Crea el mensaje de notificación personalizado
+        Envía notificaciones de vencimiento con varias peticiones en vuelo.
+        
+        Las escrituras en base de datos se hacen en el hilo que llama y por lotes:
+        un bulk_create de los registros PENDING por lote y bulk_update de los
+        resultados cada `batch_size` envíos o cada RESULT_FLUSH_SECONDS. Los hilos
+        del pool solo ejecutan la llamada HTTP a WaSender, al ritmo del carril masivo.
+        
+        Las notificaciones cuya clave de deduplicación (suscripción, tipo, días de
+        aviso, fecha de envío) ya existe se omiten, con una consulta por lote.
+        
+        Con `coalesce` las suscripciones de un mismo cliente salen en un solo
+        mensaje (ver build_expiration_group); cada suscripción conserva su registro.
+        Si los pares llegan ordenados por cliente (`sorted_by_cliente`) se agrupan
+        a medida que se leen, sin cargarlos todos en memoria.
         
         Args:
-            subscription: Objeto Subscription
-            days_until_expiration: Días hasta el vencimiento
+            items: Pares (subscription, días hasta el vencimiento)
+            concurrency: Número máximo de envíos simultáneos
+            on_result: Callback opcional (subscription, days, result) por suscripción
+            batch_size: Registros por lote (default: LOG_BATCH_SIZE)
+            today: Fecha de envío para la deduplicación (default: hoy)
+            coalesce: Agrupar por cliente (default: COALESCE_BY_CLIENT)
+            sorted_by_cliente: Los pares vienen ordenados por cliente
+            on_chunk: Callback opcional (lote de grupos, contadores) cuando los
+                resultados de un lote ya están persistidos; sirve de checkpoint
             
         Returns:
-            Mensaje formateado
+            Dict con contadores por suscripción, mensajes enviados (`messages`),
+            duración y notificaciones/segundo alcanzadas
         """
-        cliente_name = subscription.cliente.nombre_completo
-        service_name = subscription.service.nombre_mostrar
-        expiration_date = subscription.end_date.strftime('%d/%m/%Y')
-        price = subscription.price
-        
-        if days_until_expiration == 1:
-            urgency = "¡MAÑANA!"
-            emoji = "⚠️"
-        elif days_until_expiration == 0:
-            urgency = "¡HOY!"
-            emoji = "🚨"
+        def _send(phone, message):
+            return self.whatsapp.send_message(phone, message, lane=LANE_BULK)
+        
+        from .models import NotificationLog
+        
+        stats = {'total': 0, 'sent': 0, 'failed': 0, 'skipped': 0, 'messages': 0, 'by_days': {}}
+        started = time.monotonic()
+        lease_owner = make_worker_id('inline')
+        batch_size = batch_size or self.get_batch_size()
+        today = today or date.today()
+        coalesce = self.get_coalesce_by_client() if coalesce is None else coalesce
+        
+        def _count(days, key):
+            horizon = stats['by_days'].setdefault(days, {'total': 0, 'sent': 0, 'failed': 0, 'skipped': 0})
+            horizon[key] += 1
+        
+        def _skip(subscription, days):
+            stats['skipped'] += 1
+            _count(days, 'skipped')
+            if on_result:
+                on_result(subscription, days, {'success': False, 'skipped': True,
+                                               'error': 'Notificación ya registrada hoy'})
+        
+        if not coalesce:
+            groups = ([item] for item in items)
+        elif sorted_by_cliente:
+            groups = self.iter_cliente_groups(items)
         else:
-            urgency = f"en {days_until_expiration} días"
-            emoji = "📅"
+            groups = self.group_by_cliente(items)
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            for chunk in self._chunk_groups(groups, batch_size):
+                # El lease cubre también el tiempo que el lote espera turno en el despachador
+                dispatcher = self.whatsapp.dispatcher
+                lease_seconds = get_lease_seconds() + (len(chunk) / dispatcher.rate if dispatcher else 0)
+                already_sent = self.get_existing_dedup_keys(
+                    NotificationLog.make_dedup_key(
+                        subscription.id, NotificationLog.NotificationType.EXPIRATION_WARNING, days, today
+                    )
+                    for group in chunk for subscription, days in group
+                )
+                pending_groups = []
+                for group in chunk:
+                    pending = []
+                    for subscription, days in group:
+                        stats['total'] += 1
+                        _count(days, 'total')
+                        if not subscription.cliente.telefono:
+                            result = {'success': False, 'error': 'Cliente no tiene teléfono registrado'}
+                            stats['failed'] += 1
+                            _count(days, 'failed')
+                            if on_result:
+                                on_result(subscription, days, result)
+                            continue
+                        dedup_key = NotificationLog.make_dedup_key(
+                            subscription.id, NotificationLog.NotificationType.EXPIRATION_WARNING, days, today
+                        )
+                        if dedup_key in already_sent:
+                            _skip(subscription, days)
+                            continue
+                        pending.append((subscription, days))
+                    if pending:
+                        pending_groups.append(pending)
+                notification_logs = [
+                    self.build_expiration_group(pending, lease_owner, lease_seconds, send_date=today, message=message)
+                    for pending, message in zip(pending_groups, self.render_expiration_messages(pending_groups))
+                ]
+                if not notification_logs:
+                    if on_chunk:
+                        on_chunk(chunk, stats)
+                    continue
+                
+                built = [
+                    row for notification_log in notification_logs
+                    for row in (notification_log, *notification_log.group_members)
+                ]
+                notification_logs = self.create_logs(notification_logs, batch_size)
+                created = {
+                    id(row) for notification_log in notification_logs
+                    for row in (notification_log, *notification_log.group_members)
+                }
+                for row in built:
+                    if id(row) not in created:
+                        _skip(row.subscription, row.days_notice)
+                futures = {
+                    executor.submit(_send, notification_log.phone_number, notification_log.message_content): notification_log
+                    for notification_log in notification_logs
+                }
+                
+                unflushed = []
+                last_flush = time.monotonic()
+                for future in as_completed(futures):
+                    notification_log = futures[future]
+                    try:
+                        result = future.result()
+                    except Exception as e:
+                        logger.error(f"Error inesperado enviando notificación: {str(e)}")
+                        result = {'success': False, 'error': str(e)}
+                    self.record_result(notification_log, result, commit=False)
+                    unflushed.append(notification_log)
+                    key = 'sent' if result['success'] else 'failed'
+                    stats['messages'] += result['success']
+                    for row in (notification_log, *notification_log.group_members):
+                        stats[key] += 1
+                        _count(row.days_notice, key)
+                        if on_result:
+                            on_result(row.subscription, row.days_notice, result)
+                    # Con ritmos bajos, persistir también por tiempo para no perder resultados
+                    if time.monotonic() - last_flush >= RESULT_FLUSH_SECONDS:
+                        self.flush_results(unflushed, batch_size)
+                        unflushed = []
+                        last_flush = time.monotonic()
+                self.flush_results(unflushed, batch_size)
+                if on_chunk:
+                    on_chunk(chunk, stats)
         
-        message = f"""
-{emoji} *TV Services - Recordatorio de Vencimiento*
-
-Hola *{cliente_name}*,
-
-Te recordamos que tu suscripción a *{service_name}* vence {urgency}.
-
-📋 *Detalles:*
-• Servicio: {service_name}
-• Fecha de vencimiento: {expiration_date}
-• Valor de renovación: ${price:,.0f}
-
-💡 *Para renovar tu suscripción:*
-1. Contacta con nosotros
-2. Realiza el pago correspondiente
-3. ¡Sigue disfrutando sin interrupciones!
-
-📞 ¿Necesitas ayuda? Responde a este mensaje.
+        stats['elapsed'] = time.monotonic() - started
+        stats['throughput'] = stats['sent'] / stats['elapsed'] if stats['elapsed'] > 0 else 0.0
+        return stats
+    
+    @staticmethod
+    def get_coalesce_by_client() -> bool:
+        """Si los recordatorios de un mismo cliente se agrupan en un mensaje (COALESCE_BY_CLIENT)"""
+        notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+        return notification_settings.get('COALESCE_BY_CLIENT', True)
+    
+    @staticmethod
+    def group_by_cliente(items: Iterable[Tuple[Any, int]]) -> List[List[Tuple[Any, int]]]:
+        """
+        Agrupa en memoria los pares (subscription, días) por cliente
+        
+        Conserva el orden de la primera aparición de cada cliente y, dentro de
+        cada grupo, el orden de entrada (vencimiento más próximo primero).
+        """
+        groups = {}
+        for subscription, days in items:
+            groups.setdefault(subscription.cliente_id, []).append((subscription, days))
+        return list(groups.values())
+    
+    @staticmethod
+    def iter_cliente_groups(items: Iterable[Tuple[Any, int]]):
+        """
+        Como group_by_cliente, para pares ya ordenados por cliente: agrupa los
+        consecutivos sin materializar la entrada
+        
+        Dentro de cada grupo se ordena por días (vencimiento más próximo primero).
+        """
+        for _, group in itertools.groupby(items, key=lambda item: item[0].cliente_id):
+            yield sorted(group, key=lambda item: item[1])
+    
+    @staticmethod
+    def _chunk_groups(groups: Iterable[List], batch_size: int):
+        """Lotes de grupos completos con unas `batch_size` suscripciones cada uno"""
+        chunk, size = [], 0
+        for group in groups:
+            chunk.append(group)
+            size += len(group)
+            if size >= batch_size:
+                yield chunk
+                chunk, size = [], 0
+        if chunk:
+            yield chunk
+    
+    def build_expiration_group(self, items: List[Tuple[Any, int]], lease_owner: str = '',
+                               lease_seconds: Optional[float] = None, send_date: Optional[date] = None,
+                               message: Optional[str] = None):
+        """
+        Construye (sin guardar) los registros de un recordatorio para un cliente
+        
+        El primer registro es el que se envía; el resto queda en su atributo
+        `group_members` con el mismo mensaje combinado y se enlaza a él al
+        guardarse (ver create_logs). Con una sola suscripción es equivalente a
+        build_expiration_log.
+        
+        Args:
+            items: Pares (subscription, días) de un mismo cliente
+            lease_owner: Ver build_expiration_log
+            lease_seconds: Ver build_expiration_log
+            send_date: Ver build_expiration_log
+            message: Mensaje del grupo ya renderizado (ver render_expiration_messages)
+        """
+        if message is None:
+            message = self.render_expiration_messages([items])[0]
+        subscription, days = items[0]
+        notification_log = self.build_expiration_log(
+            subscription, days, lease_owner, lease_seconds, send_date, message=message
+        )
+        notification_log.group_members = [
+            self.build_expiration_log(subscription, days, send_date=send_date, message=message)
+            for subscription, days in items[1:]
+        ]
+        return notification_log
+    
+    @staticmethod
+    def render_expiration_messages(groups: List[List[Tuple[Any, int]]]) -> List[str]:
+        """
+        Renderiza de una vez los recordatorios de un lote de grupos por cliente
+        
+        Args:
+            groups: Grupos de pares (subscription, días) de un mismo cliente
+            
+        Returns:
+            Un mensaje por grupo (agrupado si el grupo tiene varias suscripciones)
+        """
+        from .message_templates import get_message_renderer, subscription_row
+        
+        return get_message_renderer().render_expiration_groups(
+            [[(subscription_row(subscription), days) for subscription, days in group] for group in groups]
+        )
+    
+    @staticmethod
+    def get_send_options() -> Dict[str, Any]:
+        """
+        Concurrencia, ritmo (msg/s) y ráfaga de envío configurados en NOTIFICATION_SETTINGS
 
-*TV Services* - Tu entretenimiento sin límites
-        """.strip()
+        El ritmo y la ráfaga son los del despachador (OUTBOUND_RATE_PER_SECOND y
+        OUTBOUND_BURST), el único límite de ritmo de los envíos.
+        """
+        notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+        return {
+            'concurrency': notification_settings.get('SEND_CONCURRENCY', 1),
+            'rate': notification_settings.get('OUTBOUND_RATE_PER_SECOND', 0.2),
+            'burst': notification_settings.get('OUTBOUND_BURST', 1),
+        }
+    
+    @staticmethod
+    def get_notice_days() -> List[int]:
+        """Horizontes de aviso configurados en NOTIFICATION_SETTINGS['EXPIRATION_DAYS_NOTICE']"""
+        notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+        return sorted(set(notification_settings.get('EXPIRATION_DAYS_NOTICE', [0, 1, 3, 7])))
+    
+    def get_expiring_subscriptions(self, days_list: Iterable[int], today: Optional[date] = None):
+        """
+        Obtiene en una sola consulta las suscripciones que vencen en cualquiera de los horizontes
         
-        return message
+        Args:
+            days_list: Días antes del vencimiento a notificar (ej: [0, 1, 3, 7])
+            today: Fecha de referencia (default: hoy)
+            
+        Returns:
+            QuerySet de Subscription con cliente y servicio ya unidos
+        """
+        from .models import Subscription
+        
+        today = today or date.today()
+        target_dates = [today + timedelta(days=days) for days in days_list]
+        
+        return Subscription.objects.filter(
+            end_date__in=target_dates,
+            is_active=True,
+            cliente__telefono__isnull=False,
+            cliente__telefono__gt='',
+            cliente__is_active=True
+        ).select_related('cliente', 'service').order_by('end_date', 'id')
+    
+    def iter_expiring_subscriptions(self, days_list: Iterable[int], today: Optional[date] = None,
+                                    after: Optional[Tuple[int, int]] = None,
+                                    page_size: Optional[int] = None):
+        """
+        Recorre las suscripciones por vencer por páginas con keyset (cliente, id)
+        
+        Cada página es una consulta `WHERE (cliente_id, id) > último` con LIMIT,
+        así que retomar desde un cursor no vuelve a leer ni contar lo ya procesado,
+        y las suscripciones de un cliente llegan juntas (ver iter_cliente_groups).
+        
+        Args:
+            days_list: Días antes del vencimiento a notificar
+            today: Fecha de referencia (default: hoy)
+            after: Cursor (cliente_id, subscription_id) de la última procesada
+            page_size: Filas por consulta (default: LOG_BATCH_SIZE)
+        """
+        queryset = self.get_expiring_subscriptions(days_list, today).order_by('cliente_id', 'id')
+        page_size = page_size or self.get_batch_size()
+        while True:
+            page = queryset
+            if after:
+                cliente_id, subscription_id = after
+                page = page.filter(Q(cliente_id__gt=cliente_id) | Q(cliente_id=cliente_id, id__gt=subscription_id))
+            page = list(page[:page_size])
+            if not page:
+                return
+            yield from page
+            after = (page[-1].cliente_id, page[-1].id)
+    
+    def run_expiration_notifications(self, days_list: Optional[Iterable[int]] = None, concurrency: int = 1,
+                                     on_result: Optional[Callable] = None,
+                                     today: Optional[date] = None,
+                                     after: Optional[Tuple[int, int]] = None,
+                                     on_chunk: Optional[Callable] = None) -> Dict[str, Any]:
+        """
+        Ejecuta en una sola pasada las notificaciones de todos los horizontes de aviso
+        
+        Args:
+            days_list: Horizontes a notificar (default: EXPIRATION_DAYS_NOTICE)
+            concurrency: Número máximo de envíos simultáneos
+            on_result: Callback opcional (subscription, days, result) por envío
+            today: Fecha de referencia (default: hoy)
+            after: Cursor (cliente_id, subscription_id) desde el que retomar
+            on_chunk: Ver send_expiration_batch
+            
+        Returns:
+            Resumen combinado con contadores totales y por horizonte (`by_days`)
+        """
+        today = today or date.today()
+        days_list = sorted(set(days_list)) if days_list is not None else self.get_notice_days()
+        subscriptions = self.iter_expiring_subscriptions(days_list, today, after=after)
+        
+        stats = self.send_expiration_batch(
+            ((subscription, (subscription.end_date - today).days) for subscription in subscriptions),
+            concurrency=concurrency,
+            on_result=on_result,
+            today=today,
+            sorted_by_cliente=True,
+            on_chunk=on_chunk,
+        )
+        stats['days'] = days_list
+        return stats
+    
+    def run_daily_notifications(self, days_list: Optional[Iterable[int]] = None,
+                                retries: bool = True,
+                                on_result: Optional[Callable] = None,
+                                concurrency: Optional[int] = None,
+                                today: Optional[date] = None,
+                                after: Optional[Tuple[int, int]] = None,
+                                on_chunk: Optional[Callable] = None) -> Dict[str, Any]:
+        """
+        Pasada diaria con el ritmo configurado: avisos de vencimiento y etapa de reintentos
+        
+        Es lo que ejecutan el endpoint de cron y la tarea de `notification_scheduler`.
+        
+        Args:
+            days_list: Horizontes a notificar (default: EXPIRATION_DAYS_NOTICE)
+            retries: Ejecutar también los reintentos cuyo backoff ya venció
+            on_result: Callback opcional (subscription, days, result) por suscripción
+            concurrency: Envíos simultáneos (default: SEND_CONCURRENCY)
+            today: Fecha de referencia (default: hoy)
+            after: Cursor desde el que retomar (ver iter_expiring_subscriptions)
+            on_chunk: Ver send_expiration_batch
+        """
+        send_options = self.get_send_options()
+        concurrency = concurrency or send_options['concurrency']
+        stats = self.run_expiration_notifications(
+            days_list,
+            concurrency=concurrency,
+            on_result=on_result,
+            today=today,
+            after=after,
+            on_chunk=on_chunk,
+        )
+        if retries:
+            # Etapa de reintentos: fallos transitorios cuyo backoff ya venció
+            stats['retries'] = self.retry_due_notifications(concurrency=concurrency)
+        return stats
+    
+    def enqueue_expiration_notifications(self, days_list: Optional[Iterable[int]] = None,
+                                         today: Optional[date] = None,
+                                         coalesce: Optional[bool] = None,
+                                         spread: bool = False,
+                                         rate: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Deja en el outbox (PENDING, sin lease) las notificaciones de todos los horizontes
+        para que las envíen los workers de `run_notification_worker`
+        
+        Con `coalesce` (default: COALESCE_BY_CLIENT) cada cliente recibe un solo
+        mensaje; los registros de sus demás suscripciones quedan agrupados.
+        
+        Con `spread` cada mensaje recibe una franja de la ventana de envío
+        (ver scheduling.assign_send_slots) dimensionada con `rate`
+        (default: OUTBOUND_RATE_PER_SECOND).
+        
+        Returns:
+            Resumen con el total encolado, los mensajes, el detalle por horizonte
+            (`by_days`) y, con `spread`, el plan de franjas (`schedule`)
+        """
+        from .scheduling import assign_send_slots
+        from .models import NotificationLog
+        
+        today = today or date.today()
+        days_list = sorted(set(days_list)) if days_list is not None else self.get_notice_days()
+        coalesce = self.get_coalesce_by_client() if coalesce is None else coalesce
+        
+        items = [
+            (subscription, (subscription.end_date - today).days)
+            for subscription in self.get_expiring_subscriptions(days_list, today)
+        ]
+        already_sent = self.get_existing_dedup_keys(
+            NotificationLog.make_dedup_key(subscription.id, NotificationLog.NotificationType.EXPIRATION_WARNING,
+                                           days, today)
+            for subscription, days in items
+        )
+        pending = [
+            (subscription, days) for subscription, days in items
+            if NotificationLog.make_dedup_key(subscription.id, NotificationLog.NotificationType.EXPIRATION_WARNING,
+                                              days, today) not in already_sent
+        ]
+        groups = self.group_by_cliente(pending) if coalesce else [[item] for item in pending]
+        notification_logs = [
+            self.build_expiration_group(group, send_date=today, message=message)
+            for group, message in zip(groups, self.render_expiration_messages(groups))
+        ]
+        schedule = None
+        if spread:
+            schedule = assign_send_slots(notification_logs, rate or self.get_send_options()['rate'], today)
+        created = self.create_logs(notification_logs)
+        
+        rows = [row for notification_log in created for row in (notification_log, *notification_log.group_members)]
+        stats = {'total': len(rows), 'messages': len(created), 'skipped': len(items) - len(rows),
+                 'by_days': {}, 'days': days_list, 'schedule': schedule}
+        for notification_log in rows:
+            stats['by_days'][notification_log.days_notice] = stats['by_days'].get(notification_log.days_notice, 0) + 1
+        return stats
+    
+    def _create_expiration_message(self, subscription, days_until_expiration: int) -> str:
+        """
+        Crea el mensaje de notificación personalizado (plantilla de message_templates)
+        
+        Args:
+            subscription: Objeto Subscription
+            days_until_expiration: Días hasta el vencimiento
+            
+        Returns:
+            Mensaje formateado
+        """
+        return self.render_expiration_messages([[(subscription, days_until_expiration)]])[0]
     
     def send_renewal_confirmation(self, subscription) -> Dict[str, Any]:
         """
@@ -250,33 +1057,14 @@ Te recordamos que tu suscripción a *{service_name}* vence {urgency}.
         
         return self.whatsapp.send_message(
             subscription.cliente.telefono,
-            message
+            message,
+            lane=LANE_MANUAL,
         )
     
     def _create_renewal_message(self, subscription) -> str:
-        """Crea mensaje de confirmación de renovación"""
-        cliente_name = subscription.cliente.nombre_completo
-        service_name = subscription.service.nombre_mostrar
-        new_expiration = subscription.end_date.strftime('%d/%m/%Y')
-        
-        message = f"""
-✅ *TV Services - Renovación Confirmada*
-
-¡Hola *{cliente_name}*!
-
-Tu suscripción a *{service_name}* ha sido renovada exitosamente.
-
-📋 *Nueva información:*
-• Servicio: {service_name}
-• Nueva fecha de vencimiento: {new_expiration}
-• Estado: Activa ✅
-
-¡Gracias por confiar en nosotros! Sigue disfrutando de tu entretenimiento favorito.
-
-*TV Services* - Tu entretenimiento sin límites
-        """.strip()
-        
-        return message
+        """Crea mensaje de confirmación de renovación (plantilla de message_templates)"""
+        from .message_templates import get_message_renderer, subscription_row
+        return get_message_renderer().render_renewal(subscription_row(subscription))
 
 
 # Instancia global del servicio de notificaciones
@@ -0,0 +1,146 @@
+"""
+Pool de sesiones (números) de WaSender.
+
+Cada sesión es un número conectado con su propia API key, su ritmo máximo y
+su circuit breaker. Los mensajes se reparten entre ellas con rendezvous
+hashing sobre el teléfono del destinatario: cada destinatario tiene un orden
+de preferencia estable, así que una conversación sigue saliendo del mismo
+número mientras esté sano, y si esa sesión se desconecta (WaSender responde
+que no está conectada, o su circuito está abierto) sus destinatarios pasan a la siguiente de su lista sin mover al resto.
+
+Se configura con WASENDER_SESSIONS; sin él hay una sola sesión con
+WASENDER_API_KEY y WASENDER_SESSION_ID.
+"""
+
+import hashlib
+import json
+import threading
+from typing import Any, Dict, List, Optional
+
+from django.conf import settings
+
+from .circuit_breaker import CircuitBreaker
+from .throttling import TokenBucket
+
+
+class SenderSession:
+    """Una sesión de WaSender: credenciales, ritmo propio y estado de salud"""
+
+    def __init__(self, name: str, api_key: str, circuit: CircuitBreaker, session_id: str = '',
+                 rate: Optional[float] = None, burst: int = 1):
+        """
+        Args:
+            name: Nombre de la sesión (logs, health check)
+            api_key: API key de la sesión en WaSender
+            circuit: Circuit breaker propio de la sesión
+            session_id: Id de la sesión en WaSender
+            rate: Mensajes por segundo máximos de este número (None = sin límite propio)
+            burst: Ráfaga máxima de este número
+        """
+        self.name = name
+        self.api_key = api_key
+        self.session_id = session_id
+        self.circuit = circuit
+        self.limiter = TokenBucket(rate, burst) if rate else None
+
+    def score(self, recipient: str) -> int:
+        """Peso de rendezvous hashing de esta sesión para el destinatario"""
+        digest = hashlib.md5(f'{self.name}:{recipient}'.encode('utf-8')).digest()
+        return int.from_bytes(digest[:8], 'big')
+
+    def snapshot(self) -> Dict[str, Any]:
+        snapshot = self.circuit.snapshot()
+        snapshot['rate'] = self.limiter.rate if self.limiter else None
+        return snapshot
+
+
+class SessionPool:
+    """Sesiones de WaSender con ruteo fijo por destinatario y failover"""
+
+    def __init__(self, sessions: List[SenderSession]):
+        self.sessions = sessions
+
+    def __len__(self) -> int:
+        return len(self.sessions)
+
+    def route(self, recipient: str) -> List[SenderSession]:
+        """Sesiones en orden de preferencia para `recipient` (la primera sana es la suya)"""
+        return sorted(self.sessions, key=lambda session: session.score(recipient), reverse=True)
+
+    def is_open(self) -> bool:
+        """
+        True si todas las sesiones tienen el circuito abierto (no hay por dónde enviar)
+
+        Un pool vacío (sin API key configurada) no tiene circuito que abrir:
+        devuelve False y quien lo use debe comprobar len(pool).
+        """
+        return bool(self.sessions) and all(session.circuit.is_open() for session in self.sessions)
+
+    def retry_in(self) -> float:
+        """Segundos hasta que alguna sesión acepte una petición de prueba"""
+        if not self.sessions:
+            return 0.0
+        return min(session.circuit.retry_in() for session in self.sessions)
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Estado agregado (closed, degraded u open) y el de cada sesión, para el health check"""
+        sessions = {session.name: session.snapshot() for session in self.sessions}
+        states = {snapshot['state'] for snapshot in sessions.values()}
+        if states <= {CircuitBreaker.CLOSED}:
+            state = CircuitBreaker.CLOSED
+        elif self.is_open():
+            state = CircuitBreaker.OPEN
+        else:
+            state = 'degraded'
+        return {'state': state, 'sessions': sessions}
+
+
+def get_session_settings() -> List[Dict[str, Any]]:
+    """
+    Sesiones configuradas en WASENDER_SESSIONS (lista de dicts con name, api_key
+    y opcionales session_id, rate y burst), o la sesión única de WASENDER_API_KEY
+    """
+    sessions = getattr(settings, 'WASENDER_SESSIONS', None)
+    if not sessions:
+        sessions = [{
+            'name': 'default',
+            'api_key': getattr(settings, 'WASENDER_API_KEY', ''),
+            'session_id': getattr(settings, 'WASENDER_SESSION_ID', ''),
+        }]
+    names = [session.get('name') for session in sessions]
+    if not all(names) or len(set(names)) != len(names):
+        raise ValueError('Cada sesión de WASENDER_SESSIONS necesita un `name` único')
+    # Las sesiones sin API key no pueden enviar
+    return [session for session in sessions if session.get('api_key')]
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_session_pool() -> SessionPool:
+    """
+    Pool compartido por todo el proceso para la configuración actual
+
+    Los limiters y circuit breakers de cada sesión se comparten entre hilos y
+    entre instancias de WhatsAppService.
+    """
+    from .services import get_circuit_breaker
+
+    configured = get_session_settings()
+    key = json.dumps(configured, sort_keys=True)
+    if key not in _pools:
+        with _pools_lock:
+            if key not in _pools:
+                _pools[key] = SessionPool([
+                    SenderSession(
+                        name=session['name'],
+                        api_key=session['api_key'],
+                        session_id=str(session.get('session_id') or ''),
+                        circuit=get_circuit_breaker(f"wasender:{session['name']}"),
+                        rate=session.get('rate'),
+                        burst=session.get('burst', 1),
+                    )
+                    for session in configured
+                ])
+    return _pools[key]
@@ -0,0 +1,343 @@
+from datetime import date, timedelta
+from decimal import Decimal
+from io import StringIO
+from unittest import mock
+
+import httpx
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from . import inbound, outbox, runs, scheduler
+from .circuit_breaker import CircuitBreaker
+from .dispatch import LANE_BULK, LANES, LaneDispatcher
+from .message_templates import KIND_EXPIRATION, KIND_RENEWAL, MessageRenderer
+from .models import (
+    Cliente, InboundMessage, MessageTemplate, NotificationLog, NotificationRun, ScheduledJob, Service,
+    Subscription,
+)
+from .services import NotificationService, WhatsAppService, notification_service
+from .sessions import SenderSession, SessionPool
+
+
+def make_session(name='s1'):
+    return SenderSession(name, 'key', CircuitBreaker(f'test:{name}', failure_threshold=1, reset_timeout=60))
+
+
+class SessionPoolTests(TestCase):
+    def test_empty_pool_is_not_open(self):
+        self.assertFalse(SessionPool([]).is_open())
+
+    def test_pool_is_open_only_when_every_circuit_is_open(self):
+        first, second = make_session('s1'), make_session('s2')
+        pool = SessionPool([first, second])
+        first.circuit.record_failure()
+        self.assertFalse(pool.is_open())
+        second.circuit.record_failure()
+        self.assertTrue(pool.is_open())
+
+
+class SessionAuthErrorTests(TestCase):
+    def setUp(self):
+        self.first = SenderSession('s1', 'key-1', CircuitBreaker('test:s1', failure_threshold=5, reset_timeout=60))
+        self.second = SenderSession('s2', 'key-2', CircuitBreaker('test:s2', failure_threshold=5, reset_timeout=60))
+        self.service = WhatsAppService()
+        self.service.sessions = SessionPool([self.first, self.second])
+        self.service.dispatcher = None
+        self.calls = []
+
+    def send(self, status_code, message):
+        def handler(request):
+            self.calls.append(request.headers['Authorization'])
+            if len(self.calls) == 1:
+                return httpx.Response(status_code, json={'success': False, 'message': message})
+            return httpx.Response(200, json={'success': True})
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        with mock.patch('subscriptions.services.get_http_client', return_value=client):
+            return self.service.send_message('0991234567', 'hola')
+
+    def test_disconnected_session_fails_over(self):
+        result = self.send(403, 'Session is not connected')
+        self.assertTrue(result['success'])
+        self.assertEqual(len(self.calls), 2)
+
+    def test_rejected_api_key_is_a_configuration_error(self):
+        with self.assertLogs('subscriptions.services', level='ERROR') as logs:
+            result = self.send(401, 'Unauthenticated')
+        self.assertFalse(result['success'])
+        self.assertFalse(result['retryable'])
+        self.assertTrue(result['config_error'])
+        self.assertEqual(len(self.calls), 1)
+        session = self.first if result['session'] == 's1' else self.second
+        self.assertTrue(session.circuit.is_open())
+        self.assertTrue(any('Error de configuración' in line for line in logs.output))
+
+
+class EmptySessionPoolCommandTests(TransactionTestCase):
+    def test_notification_worker_exits_without_sessions(self):
+        stderr = StringIO()
+        with mock.patch.object(notification_service.whatsapp, 'sessions', SessionPool([])):
+            call_command('run_notification_worker', '--once', stdout=StringIO(), stderr=stderr)
+        self.assertIn('No hay sesiones de WaSender configuradas', stderr.getvalue())
+
+    def test_inbound_worker_processes_messages_without_sessions(self):
+        # Los clientes creados desde WhatsApp se asignan al primer usuario
+        User.objects.create_superuser('admin', 'admin@example.com', 'admin')
+        message = InboundMessage.objects.create(payload={'from': '0991234567', 'text': 'hola'})
+        stdout = StringIO()
+        with mock.patch('subscriptions.management.commands.process_inbound_messages.get_session_pool',
+                        return_value=SessionPool([])), \
+                mock.patch('subscriptions.services.get_session_pool', return_value=SessionPool([])):
+            call_command('process_inbound_messages', '--once', '--workers', '1', stdout=stdout)
+        message.refresh_from_db()
+        self.assertEqual(message.status, InboundMessage.InboundStatus.PROCESSED)
+        self.assertFalse(message.result['sent'])
+        self.assertIn('No hay sesiones de WaSender configuradas', stdout.getvalue())
+
+
+def message_row(**overrides):
+    row = {
+        'id': 1,
+        'service_id': None,
+        'end_date': date(2026, 1, 31),
+        'price': Decimal('15000'),
+        'cliente__nombres': "A & B <x>",
+        'cliente__apellidos': "O'Brien",
+        'service__nombre_mostrar': 'Netflix "Premium"',
+    }
+    row.update(overrides)
+    return row
+
+
+class MessageRendererTests(TestCase):
+    def test_messages_are_not_html_escaped(self):
+        renderer = MessageRenderer()
+        message = renderer.render_expiration_groups([[(message_row(), 3)]])[0]
+        self.assertIn("Hola *A & B <x> O'Brien*", message)
+        self.assertIn('*Netflix "Premium"*', message)
+        self.assertNotIn('&amp;', message)
+
+        renewal = renderer.render_renewal(message_row())
+        self.assertIn("A & B <x> O'Brien", renewal)
+
+    def test_database_template_is_not_escaped(self):
+        MessageTemplate.objects.create(notification_type=KIND_RENEWAL, body='Hola {{ cliente_name }}')
+        self.assertEqual(MessageRenderer().render_renewal(message_row()), "Hola A & B <x> O'Brien")
+
+    def test_one_template_per_type_service_and_urgency(self):
+        MessageTemplate.objects.create(notification_type=KIND_EXPIRATION, urgency='today', body='uno')
+        duplicate = MessageTemplate(notification_type=KIND_EXPIRATION, urgency='today', body='dos')
+        with self.assertRaises(ValidationError):
+            duplicate.full_clean()
+        with self.assertRaises(IntegrityError):
+            duplicate.save()
+
+
+class LaneDispatcherTests(TestCase):
+    def test_configure_replaces_rate_and_burst_of_every_lane(self):
+        dispatcher = LaneDispatcher(0.2, burst=1, sync_seconds=0)
+        dispatcher.configure(100, burst=5)
+        self.assertEqual(dispatcher.rate, 100)
+        self.assertEqual(dispatcher.burst, 5)
+        # La ráfaga nueva permite 5 envíos seguidos sin esperar
+        for _ in range(5):
+            self.assertLess(dispatcher.acquire(LANE_BULK), 0.5)
+        self.assertEqual(set(dispatcher.snapshot()), set(LANES))
+
+    def test_configure_rejects_non_positive_rate(self):
+        with self.assertRaises(ValueError):
+            LaneDispatcher(1, sync_seconds=0).configure(0)
+
+    @override_settings(NOTIFICATION_SETTINGS={'OUTBOUND_RATE_PER_SECOND': 3, 'OUTBOUND_BURST': 2})
+    def test_send_options_use_the_dispatcher_rate(self):
+        options = NotificationService.get_send_options()
+        self.assertEqual((options['rate'], options['burst']), (3, 2))
+
+
+@override_settings(NOTIFICATION_SETTINGS={
+    'INBOUND_MAX_ATTEMPTS': 3, 'RETRY_BASE_SECONDS': 60, 'RETRY_MAX_SECONDS': 3600,
+})
+class InboundMarkFailedTests(TestCase):
+    def test_failed_message_waits_before_next_attempt(self):
+        message = InboundMessage.objects.create(payload={'from': '0991234567', 'text': 'hola'})
+        message.locked_by = 'w1'
+        before = timezone.now()
+        inbound.mark_failed(message, 'IA caída')
+        inbound.flush_results([message])
+
+        message.refresh_from_db()
+        self.assertEqual(message.status, InboundMessage.InboundStatus.PENDING)
+        self.assertEqual(message.attempts, 1)
+        self.assertEqual(message.locked_by, '')
+        # backoff_delay con jitter 0.5: entre 30 y 60 segundos en el primer fallo
+        self.assertGreaterEqual(message.locked_until, before + timedelta(seconds=30))
+        self.assertLessEqual(message.locked_until, timezone.now() + timedelta(seconds=60))
+        self.assertEqual(inbound.lease_inbound_messages('w2'), [])
+
+    def test_backoff_grows_and_last_attempt_fails(self):
+        message = InboundMessage.objects.create(payload={'from': '0991234567', 'text': 'hola'}, attempts=1)
+        before = timezone.now()
+        inbound.mark_failed(message, 'IA caída')
+        self.assertGreaterEqual(message.locked_until, before + timedelta(seconds=60))
+
+        inbound.mark_failed(message, 'IA caída')
+        self.assertEqual(message.status, InboundMessage.InboundStatus.FAILED)
+        self.assertEqual(message.attempts, 3)
+        self.assertIsNone(message.locked_until)
+
+
+def make_subscription(telefono='0991234567'):
+    """Suscripción que vence hoy, de un cliente nuevo con `telefono`"""
+    user, _ = User.objects.get_or_create(username='operador')
+    service, _ = Service.objects.get_or_create(
+        nombre='netflix', defaults={'nombre_mostrar': 'Netflix', 'precio_base': 10}
+    )
+    cliente = Cliente.objects.create(creado_por=user, nombres='Ana', apellidos='Pérez', telefono=telefono)
+    return Subscription.objects.create(
+        cliente=cliente, service=service, price=10, start_date=date.today(), end_date=date.today()
+    )
+
+
+def make_notification_log(**overrides):
+    fields = {
+        'notification_type': NotificationLog.NotificationType.EXPIRATION_WARNING,
+        'status': NotificationLog.NotificationStatus.PENDING,
+        'phone_number': '0991234567',
+        'message_content': 'Tu suscripción vence hoy',
+        'days_notice': 0,
+    }
+    fields.update(overrides)
+    if 'subscription' not in fields:
+        fields['subscription'] = make_subscription(fields['phone_number'])
+    return NotificationLog.objects.create(**fields)
+
+
+class NotificationResultTests(TestCase):
+    def test_successful_retry_clears_previous_error(self):
+        notification_log = make_notification_log(
+            status=NotificationLog.NotificationStatus.FAILED, error_message='HTTP 503', retry_count=1,
+        )
+        notification_service.record_result(notification_log, {'success': True, 'data': {'msgId': 'abc'}},
+                                           commit=False)
+        notification_service.flush_results([notification_log])
+
+        notification_log.refresh_from_db()
+        self.assertEqual(notification_log.status, NotificationLog.NotificationStatus.SENT)
+        self.assertIsNone(notification_log.error_message)
+        self.assertEqual(notification_log.provider_message_id, 'abc')
+
+
+class ResumeRunTests(TestCase):
+    def test_resumed_run_sends_only_after_cursor_and_keeps_counters(self):
+        first, second, third = (make_subscription(f'099123456{i}') for i in range(3))
+        # Corrida interrumpida tras el checkpoint de la primera suscripción
+        counters = {'0': {'processed': 1, 'sent': 1, 'failed': 0, 'skipped': 0}}
+        run = runs.start_run([0], 'command', 'w1')
+        run.status = NotificationRun.RunStatus.RUNNING
+        run.run_date = date.today()
+        run.started_at = timezone.now()
+        run.total = 3
+        run.progress = counters
+        run.cursor_cliente_id = first.cliente_id
+        run.cursor_subscription_id = first.id
+        run.cursor_counters = {'progress': counters, 'messages': 1}
+        run.save()
+
+        with mock.patch.object(notification_service.whatsapp, 'send_message',
+                               return_value={'success': True, 'data': {'msgId': 'abc'}}) as send_message:
+            summary = runs.execute_run(run, concurrency=1, retries=False)
+
+        self.assertEqual(
+            sorted(call.args[0] for call in send_message.call_args_list),
+            sorted([second.cliente.telefono, third.cliente.telefono]),
+        )
+        self.assertFalse(NotificationLog.objects.filter(subscription=first).exists())
+        run.refresh_from_db()
+        self.assertEqual(run.status, NotificationRun.RunStatus.COMPLETED)
+        self.assertTrue(summary['resumed'])
+        self.assertEqual((summary['total'], summary['sent'], summary['messages']), (3, 3, 3))
+        self.assertEqual(run.cursor, (third.cliente_id, third.id))
+
+
+class OutboxLeaseTests(TestCase):
+    @override_settings(NOTIFICATION_SETTINGS={'OUTBOX_LEASE_SECONDS': 300})
+    def test_batch_lease_covers_the_whole_batch(self):
+        # 50 registros por worker, 2 workers a 0.2 msg/s: el lote tarda 500 s
+        self.assertEqual(outbox.get_batch_lease_seconds(50, 0.2, workers=2), 300 + 500)
+
+    def test_worker_does_not_send_or_save_rows_leased_by_another_worker(self):
+        notification_log = make_notification_log()
+        batch = outbox.lease_notifications('w1', lease_seconds=60)
+        self.assertEqual([row.id for row in batch], [notification_log.id])
+        self.assertTrue(outbox.renew_lease(batch[0], 'w1', 60))
+
+        # El lease venció y otro worker tomó y envió el registro
+        NotificationLog.objects.filter(pk=notification_log.pk).update(
+            locked_by='w2', status=NotificationLog.NotificationStatus.SENT
+        )
+        self.assertFalse(outbox.renew_lease(batch[0], 'w1', 60))
+        notification_service.record_result(batch[0], {'success': False, 'error': 'HTTP 500', 'retryable': True},
+                                           commit=False)
+        notification_service.flush_results(batch, worker_id='w1')
+
+        notification_log.refresh_from_db()
+        self.assertEqual(notification_log.status, NotificationLog.NotificationStatus.SENT)
+        self.assertEqual(notification_log.locked_by, 'w2')
+
+
+class SchedulerRunTests(TestCase):
+    def test_daily_job_runs_as_checkpointed_notification_run(self):
+        subscription = make_subscription()
+        with mock.patch.object(notification_service.whatsapp, 'send_message',
+                               return_value={'success': True, 'data': {'msgId': 'abc'}}):
+            summary = scheduler.urgent_reminders()
+
+        run = NotificationRun.objects.get(pk=summary['run_id'])
+        self.assertEqual(run.source, 'scheduler')
+        self.assertEqual(run.status, NotificationRun.RunStatus.COMPLETED)
+        self.assertEqual(run.cursor, (subscription.cliente_id, subscription.id))
+        self.assertEqual(summary['sent'], 1)
+
+    @override_settings(NOTIFICATION_SETTINGS={'SCHEDULER_MISFIRE_SECONDS': 3600})
+    def test_catch_up_starts_from_last_tick_within_misfire_window(self):
+        now = timezone.now().replace(second=0, microsecond=0)
+        ScheduledJob.objects.create(name='expiration_reminders', last_scheduled_for=now - timedelta(minutes=20))
+        ScheduledJob.objects.create(name='urgent_reminders', last_scheduled_for=now - timedelta(hours=3))
+
+        since = scheduler.get_catch_up_since(['expiration_reminders', 'urgent_reminders', 'retry_failed'], now)
+
+        self.assertEqual(since['expiration_reminders'], now - timedelta(minutes=20))
+        self.assertEqual(since['urgent_reminders'], now - timedelta(hours=1))
+        self.assertEqual(since['retry_failed'], now)
+
+
+@override_settings(CRON_SECRET='s3cret')
+class CronEndpointAccessTests(TestCase):
+    def setUp(self):
+        self.run = NotificationRun.objects.create(source='cron')
+        self.url = reverse('cron_notifications_status', args=[self.run.pk])
+
+    def test_status_requires_cron_secret_or_staff(self):
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.assertEqual(self.client.get(self.url, headers={'X-Cron-Secret': 'otro'}).status_code, 403)
+        self.assertEqual(self.client.get(self.url, headers={'X-Cron-Secret': 's3cret'}).status_code, 200)
+
+        self.client.force_login(User.objects.create_user('operador', password='x'))
+        self.assertEqual(self.client.get(self.url).status_code, 403)
+        self.client.force_login(User.objects.create_user('admin', password='x', is_staff=True))
+        self.assertEqual(self.client.get(self.url).status_code, 200)
+
+    @override_settings(CRON_SECRET='')
+    def test_status_without_configured_secret_is_staff_only(self):
+        self.assertEqual(self.client.get(self.url, headers={'X-Cron-Secret': ''}).status_code, 403)
+
+    def test_enqueue_requires_cron_secret(self):
+        self.assertEqual(self.client.post(reverse('cron_notifications')).status_code, 403)
+        response = self.client.post(reverse('cron_notifications'), headers={'X-Cron-Secret': 's3cret'})
+        self.assertEqual(response.status_code, 202)
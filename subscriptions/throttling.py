@@ -0,0 +1,92 @@
+"""
+Control de ritmo para envíos salientes de WhatsApp.
+
+El `TokenBucket` reemplaza las pausas fijas (`time.sleep(5)`) entre mensajes:
+permite ráfagas cortas hasta `burst` mensajes y luego limita el envío a
+`rate` mensajes por segundo, compartido entre todos los hilos que lo usen.
+
+`backoff_delay` calcula la espera entre reintentos de envíos fallidos.
+"""
+
+import random
+import threading
+import time
+
+
+class TokenBucket:
+    """Token bucket thread-safe (mensajes por segundo + ráfaga)"""
+
+    def __init__(self, rate: float, burst: int = 1):
+        if rate <= 0:
+            raise ValueError('rate debe ser mayor que 0')
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, now: float) -> None:
+        elapsed = now - self._updated
+        if elapsed > 0:
+            self._tokens = min(self.capacity, self._tokens + elapsed * self.rate)
+            self._updated = now
+
+    def set_rate(self, rate: float) -> None:
+        """Cambia el ritmo sin perder el saldo acumulado con el ritmo anterior"""
+        if rate <= 0:
+            raise ValueError('rate debe ser mayor que 0')
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = float(rate)
+
+    def try_acquire(self, tokens: int = 1) -> float:
+        """
+        Intenta consumir `tokens` sin bloquear.
+
+        Returns:
+            0 si se consumieron, o los segundos a esperar para que haya saldo
+        """
+        with self._lock:
+            self._refill(time.monotonic())
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return 0.0
+            return (tokens - self._tokens) / self.rate
+
+    def acquire(self, tokens: int = 1, timeout: float = None) -> bool:
+        """
+        Bloquea hasta poder consumir `tokens`.
+
+        Args:
+            tokens: Tokens a consumir (1 por mensaje)
+            timeout: Segundos máximos de espera (None = sin límite)
+
+        Returns:
+            True si se consumieron, False si se agotó el timeout
+        """
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if wait == 0:
+                return True
+            if deadline is not None:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    return False
+                wait = min(wait, remaining)
+            time.sleep(wait)
+
+
+def backoff_delay(attempt: int, base: float, cap: float, jitter: float = 0.5) -> float:
+    """
+    Espera exponencial con jitter antes del reintento número `attempt` (desde 0)
+
+    La espera nominal es base * 2^attempt, limitada a `cap`; se reduce al azar
+    hasta en una fracción `jitter` para que los reintentos de un lote grande no
+    lleguen todos a la vez.
+
+    Returns:
+        Segundos a esperar
+    """
+    delay = min(cap, base * (2 ** max(0, attempt)))
+    return delay * (1 - jitter * random.random())
@@ -7,6 +7,7 @@ from django.conf.urls.static import static
 from django.shortcuts import get_object_or_404
 from . import views
 from .payments import handle_stripe_webhook
+from .health import health_check
 
 urlpatterns = [
     # Páginas principales
@@ -53,6 +54,10 @@ urlpatterns = [
     
     # Cron jobs para Railway
     path('cron/notifications/', views.cron_notifications, name='cron_notifications'),
+    path('cron/notifications/<int:run_id>/', views.cron_notifications_status, name='cron_notifications_status'),
+    
+    # Estado del sistema (base de datos, Stripe, cola de mensajes entrantes)
+    path('health/', health_check, name='health_check'),
     
     # Recordatorio manual
     path('subscription/<int:subscription_id>/send-reminder/', views.send_manual_reminder, name='send_manual_reminder'),
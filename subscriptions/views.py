@@ -20,11 +20,12 @@ from django.http import JsonResponse, HttpResponseBadRequest, HttpResponseForbid
 from django.contrib.auth.models import User
 from django.db.models import Q
 
-from .models import Subscription, Service, Cliente, CategoriaServicio, Payment
+from .models import Subscription, Service, Cliente, CategoriaServicio, Payment, InboundMessage, NotificationRun
 from .forms import CustomUserCreationForm, SubscriptionForm, ServiceForm, PaymentForm
 from django.core.exceptions import PermissionDenied
 from django.contrib.auth import get_user_model
 from .payments import create_stripe_checkout_session, handle_stripe_webhook
+from .inbound import get_inbound_kind
 
 # Importación diferida para evitar importación circular
 ClientWithSubscriptionForm = None
@@ -957,47 +958,63 @@ def subscription_cancel(request, pk):
     return redirect('subscription_detail', pk=pk)
 
 
+def _is_cron_caller(request):
+    """
+    Si la petición viene del cron externo (header X-Cron-Secret igual a
+    CRON_SECRET) o de un usuario staff con sesión iniciada
+    """
+    import hmac
+    
+    configured_secret = getattr(settings, 'CRON_SECRET', '')
+    provided = request.headers.get('X-Cron-Secret', '')
+    if configured_secret and provided and hmac.compare_digest(provided, configured_secret):
+        return True
+    return request.user.is_authenticated and request.user.is_staff
+
+
 @csrf_exempt
 def cron_notifications(request):
     """
     Endpoint para ejecutar notificaciones desde cron externo
+    
+    Solo encola una corrida (NotificationRun) para todos los horizontes de
+    EXPIRATION_DAYS_NOTICE, o los indicados en `days`, y responde de inmediato
+    con su id; `notification_scheduler` la ejecuta en segundo plano. Si ya hay
+    una corrida en cola o en ejecución se devuelve esa.
+    
+    Con CRON_SECRET configurado exige el header X-Cron-Secret (o un usuario staff).
     """
+    if getattr(settings, 'CRON_SECRET', '') and not _is_cron_caller(request):
+        logger.warning('Petición de cron sin secret válido')
+        return HttpResponseForbidden('Invalid cron secret')
+    
     if request.method == 'POST':
         try:
-            import subprocess
-            import sys
+            from .runs import enqueue_run
             
-            # Ejecutar notificaciones para todos los días
-            results = []
+            notification_settings = getattr(settings, 'NOTIFICATION_SETTINGS', {})
+            if not notification_settings.get('ENABLE_WHATSAPP_NOTIFICATIONS', False):
+                return JsonResponse({
+                    'success': False,
+                    'error': 'Las notificaciones de WhatsApp están deshabilitadas'
+                })
             
-            for days in [0, 1, 3, 7]:
-                try:
-                    result = subprocess.run([
-                        sys.executable, 'manage.py', 'send_expiration_notifications', 
-                        '--days', str(days)
-                    ], capture_output=True, text=True, timeout=300)
-                    
-                    results.append({
-                        'days': days,
-                        'success': result.returncode == 0,
-                        'output': result.stdout,
-                        'error': result.stderr
-                    })
-                    
-                except Exception as e:
-                    results.append({
-                        'days': days,
-                        'success': False,
-                        'error': str(e)
-                    })
+            try:
+                days_list = [int(days) for days in request.POST.getlist('days')]
+            except ValueError:
+                return JsonResponse({'success': False, 'error': 'days debe ser una lista de enteros'}, status=400)
             
+            run, created = enqueue_run(days_list, source='cron')
             return JsonResponse({
                 'success': True,
-                'message': 'Notificaciones ejecutadas',
-                'results': results
-            })
+                'message': 'Corrida de notificaciones encolada' if created else 'Ya hay una corrida en curso',
+                'run_id': run.pk,
+                'status': run.status,
+                'status_url': reverse('cron_notifications_status', args=[run.pk]),
+            }, status=202)
             
         except Exception as e:
+            logger.exception('Error encolando notificaciones cron')
             return JsonResponse({
                 'success': False,
                 'error': str(e)
@@ -1009,6 +1026,24 @@ def cron_notifications(request):
     })
 
 
+@require_http_methods(['GET'])
+def cron_notifications_status(request, run_id):
+    """
+    Progreso por horizonte, fechas y resumen final de una corrida de notificaciones
+    
+    Expone cursores y errores internos: solo para el cron externo (X-Cron-Secret)
+    o usuarios staff.
+    """
+    from .runs import serialize_run
+    
+    if not _is_cron_caller(request):
+        return HttpResponseForbidden('Invalid cron secret')
+    run = NotificationRun.objects.filter(pk=run_id).first()
+    if run is None:
+        return JsonResponse({'success': False, 'error': 'Corrida no encontrada'}, status=404)
+    return JsonResponse({'success': True, 'run': serialize_run(run)})
+
+
 @login_required
 @require_POST
 def send_manual_reminder(request, subscription_id):
@@ -1137,14 +1172,13 @@ def handle_wasender_webhook(request):
 
     Flujo:
     - Verifica secret en header o en payload usando `WASENDER_WEBHOOK_SECRET`.
-    - Extrae teléfono y texto del payload (manejo tolerante a distintos formatos).
-    - Busca o crea un `Cliente` asociado al teléfono.
-    - Envuelve el cliente en un objeto ligero (LeadProxy) compatible con `WhatsAppBotIA`.
-    - Llama a la IA para procesar el mensaje y genera una respuesta.
-    - Envía la respuesta usando `WhatsAppService.send_message`.
-
-    Nota: Este handler es intencionalmente simple (sin persistencia de conversación).
-    Para producción recomendamos persistir `Conversation`/`Message` y procesar asíncronamente.
+    - Guarda el payload crudo como `InboundMessage` (mensaje o recibo de
+      entrega/lectura) y responde 200 de inmediato.
+
+    La búsqueda del `Cliente`, la IA y el envío de la respuesta los hacen los
+    workers de `python manage.py process_inbound_messages` (ver `inbound.py`),
+    para que una respuesta lenta de WaSender no bloquee al worker web ni
+    provoque reintentos del proveedor.
     """
     import json
     import logging
@@ -1158,6 +1192,8 @@ def handle_wasender_webhook(request):
         payload = json.loads(body) if body else request.POST.dict()
     except Exception:
         payload = request.POST.dict()
+    if not isinstance(payload, dict):
+        payload = {'data': payload}
 
     # Verificación del secret (header o campo en payload)
     header_secret = request.headers.get('X-Wasender-Secret') or request.META.get('HTTP_X_WASENDER_SECRET')
@@ -1172,107 +1208,13 @@ def handle_wasender_webhook(request):
         if provided != configured_secret:
             logger.warning('Webhook secret inválido')
             return HttpResponseForbidden('Invalid webhook secret')
+        # No guardar el secret junto con el mensaje
+        payload.pop('secret', None)
 
-    # Extraer texto y número (soportar varios formatos)
-    text = ''
-    phone = ''
-
-    # Campos comunes
-    for key in ('text', 'message', 'body', 'text_body'):
-        if key in payload and payload.get(key):
-            text = payload.get(key)
-            break
-
-    # Estructuras como messages: [{ 'text': { 'body': '...' } }]
-    if not text and isinstance(payload.get('messages'), list) and payload['messages']:
-        m = payload['messages'][0]
-        if isinstance(m.get('text'), dict):
-            text = m['text'].get('body', '')
-        else:
-            text = m.get('text') or m.get('body') or ''
-
-    # Números posibles
-    for key in ('from', 'from_number', 'wa_id', 'sender', 'phone', 'msisdn'):
-        if key in payload and payload.get(key):
-            phone = str(payload.get(key))
-            break
-
-    # Fallback: intentar leer request.POST fields
-    if not phone:
-        phone = request.POST.get('from') or request.POST.get('phone') or ''
-
-    # Normalizar teléfono
-    clean_digits = ''.join(filter(str.isdigit, phone))
-    clean_phone = ''
-    if clean_digits:
-        if clean_digits.startswith('593') or clean_digits.startswith('57'):
-            clean_phone = '+' + clean_digits
-        elif len(clean_digits) == 9:
-            # asumir Ecuador si vienen 9 dígitos locales
-            clean_phone = '+593' + clean_digits
-        else:
-            clean_phone = '+' + clean_digits
-
-    # Buscar cliente por teléfono (coincidencia flexible usando últimos dígitos)
-    cliente = None
-    try:
-        if clean_phone:
-            tail = clean_digits[-9:]
-            candidatos = Cliente.objects.filter(telefono__icontains=tail)
-            if candidatos.exists():
-                cliente = candidatos.first()
-
-        if not cliente:
-            # Crear cliente temporal asignado al primer superuser o primer usuario
-            from django.contrib.auth import get_user_model
-            User = get_user_model()
-            admin = User.objects.filter(is_superuser=True).first() or User.objects.first()
-            cliente = Cliente.objects.create(
-                creado_por=admin,
-                nombres='WhatsApp',
-                apellidos='Usuario',
-                telefono=clean_phone
-            )
-    except Exception as e:
-        logger.exception(f'Error buscando/creando Cliente para {clean_phone}: {e}')
-        return JsonResponse({'success': False, 'error': 'Error interno al gestionar cliente'}, status=500)
-
-    # Construir un objeto ligero compatible con WhatsAppBotIA
-    class LeadProxy:
-        def __init__(self, cliente):
-            self.nombre = cliente.nombres or cliente.nombre_completo
-            # Campos que usa la IA; mantener None si no existen
-            self.tipo_servicio_interes = None
-            self.presupuesto_estimado = None
-            self.zona = cliente.direccion or None
-            self.direccion = cliente.direccion or None
-            # Proveer conversacoes.count()
-            class ConvCounter:
-                def count(self_inner):
-                    return 0
-            self.conversaciones = ConvCounter()
-
-    lead = LeadProxy(cliente)
-
-    # Procesar el mensaje con la IA heurística existente
-    try:
-        from callcenter.ai_services import WhatsAppBotIA
-        bot = WhatsAppBotIA()
-        result = bot.procesar_mensaje(lead, text or '')
-    except Exception as e:
-        logger.exception(f'Error procesando mensaje con IA: {e}')
-        return JsonResponse({'success': False, 'error': 'Error al procesar mensaje'}, status=500)
-
-    # Enviar la respuesta usando el servicio de WhatsApp
     try:
-        from .services import WhatsAppService
-        wa = WhatsAppService()
-        respuesta_text = result.get('respuesta') if isinstance(result, dict) else str(result)
-        send_result = wa.send_message(clean_phone, respuesta_text)
-        logger.info(f'Webhook procesado. Envío a {clean_phone}: {send_result}')
+        inbound_message = InboundMessage.objects.create(payload=payload, kind=get_inbound_kind(payload))
     except Exception as e:
-        logger.exception(f'Error enviando respuesta WhatsApp: {e}')
-        # No fallar el webhook: responder 200 pero indicar fallo en envío
-        return JsonResponse({'success': True, 'handled': True, 'sent': False, 'error': str(e), 'ia_result': result})
+        logger.exception(f'Error guardando webhook entrante: {e}')
+        return JsonResponse({'success': False, 'error': 'Error interno al guardar el mensaje'}, status=500)
 
-    return JsonResponse({'success': True, 'handled': True, 'sent': True, 'ia_result': result})
+    return JsonResponse({'success': True, 'queued': True, 'id': inbound_message.pk})
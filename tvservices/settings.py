@@ -2,6 +2,7 @@
 Django settings for tvservices project.
 """
 
+import json
 import os
 from pathlib import Path
 from dotenv import load_dotenv
@@ -224,14 +225,76 @@ WASENDER_API_KEY = os.environ.get('WASENDER_API_KEY', '')
 WASENDER_SESSION_ID = os.environ.get('WASENDER_SESSION_ID', '')
 WASENDER_WEBHOOK_URL = os.environ.get('WASENDER_WEBHOOK_URL', '')
 WASENDER_WEBHOOK_SECRET = os.environ.get('WASENDER_WEBHOOK_SECRET', '')
+# Secreto del cron externo (header X-Cron-Secret) para encolar corridas y consultar su estado
+CRON_SECRET = os.environ.get('CRON_SECRET', '')
+# Cliente HTTP compartido (keep-alive): tamaño del pool y timeouts de conexión/lectura en segundos
+WASENDER_HTTP_POOL_SIZE = int(os.environ.get('WASENDER_HTTP_POOL_SIZE', '10'))
+WASENDER_CONNECT_TIMEOUT = float(os.environ.get('WASENDER_CONNECT_TIMEOUT', '5'))
+WASENDER_READ_TIMEOUT = float(os.environ.get('WASENDER_READ_TIMEOUT', '30'))
+# Circuit breaker: se abre tras N errores transitorios seguidos o con esa tasa de error en las últimas llamadas
+WASENDER_CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get('WASENDER_CIRCUIT_FAILURE_THRESHOLD', '5'))
+WASENDER_CIRCUIT_ERROR_RATE = float(os.environ.get('WASENDER_CIRCUIT_ERROR_RATE', '0.5'))
+WASENDER_CIRCUIT_WINDOW = int(os.environ.get('WASENDER_CIRCUIT_WINDOW', '20'))
+WASENDER_CIRCUIT_RESET_SECONDS = float(os.environ.get('WASENDER_CIRCUIT_RESET_SECONDS', '30'))
+# Varios números de envío: JSON con una lista de sesiones {"name", "api_key", "session_id", "rate", "burst"}
+# (rate y burst opcionales, por número). Vacío = una sola sesión con WASENDER_API_KEY y WASENDER_SESSION_ID
+WASENDER_SESSIONS = json.loads(os.environ.get('WASENDER_SESSIONS', '[]'))
 
 # Configuración de notificaciones
 NOTIFICATION_SETTINGS = {
     'ENABLE_WHATSAPP_NOTIFICATIONS': True,
     'EXPIRATION_DAYS_NOTICE': [0, 1, 3, 7],  # Días antes del vencimiento para notificar (0 = vence hoy)
     'NOTIFICATION_TIME_HOUR': 9,  # Hora del día para enviar notificaciones (24h format)
+    # Un solo recordatorio por cliente con todas sus suscripciones por vencer
+    'COALESCE_BY_CLIENT': os.environ.get('NOTIFICATION_COALESCE_BY_CLIENT', 'True').lower() == 'true',
+    # Envíos simultáneos a WaSender; el ritmo lo pone OUTBOUND_RATE_PER_SECOND
+    'SEND_CONCURRENCY': int(os.environ.get('NOTIFICATION_SEND_CONCURRENCY', '1')),
+    # Ventana de envío (hora local) para repartir los recordatorios encolados con --spread, en franjas de N minutos
+    'SEND_WINDOW_START': os.environ.get('NOTIFICATION_SEND_WINDOW_START', '09:00'),
+    'SEND_WINDOW_END': os.environ.get('NOTIFICATION_SEND_WINDOW_END', '12:00'),
+    'SEND_WINDOW_SLOT_MINUTES': int(os.environ.get('NOTIFICATION_SEND_WINDOW_SLOT_MINUTES', '5')),
+    # Carriles de envío (respuestas del bot > recordatorios manuales > masivos): único límite de ritmo.
+    # Mensajes/segundo de WaSender por proceso, repartidos entre los carriles activos según su peso.
+    # Default 0.2 = un mensaje cada 5 segundos, el ritmo que tolera WaSender sin bloquear el número;
+    # el --rate de los comandos lo reemplaza solo en ese proceso
+    'OUTBOUND_RATE_PER_SECOND': float(os.environ.get('NOTIFICATION_OUTBOUND_RATE', '0.2')),
+    'OUTBOUND_BURST': int(os.environ.get('NOTIFICATION_OUTBOUND_BURST', '1')),
+    'LANE_WEIGHTS': {
+        'interactive': int(os.environ.get('LANE_WEIGHT_INTERACTIVE', '6')),
+        'manual': int(os.environ.get('LANE_WEIGHT_MANUAL', '3')),
+        'bulk': int(os.environ.get('LANE_WEIGHT_BULK', '1')),
+    },
+    # Segundos sin tráfico tras los que un carril cede su parte, y cada cuánto se publican los carriles activos
+    'LANE_ACTIVE_SECONDS': int(os.environ.get('LANE_ACTIVE_SECONDS', '30')),
+    'LANE_SYNC_SECONDS': int(os.environ.get('LANE_SYNC_SECONDS', '5')),
+    # Outbox: segundos que un worker retiene un lote antes de que otro pueda retomarlo
+    'OUTBOX_LEASE_SECONDS': int(os.environ.get('NOTIFICATION_OUTBOX_LEASE_SECONDS', '300')),
+    # Tamaño de lote para bulk_create/bulk_update de NotificationLog
+    'LOG_BATCH_SIZE': int(os.environ.get('NOTIFICATION_LOG_BATCH_SIZE', '500')),
+    # Reintentos de envíos fallidos (solo errores transitorios): máximo de reintentos y espera exponencial
+    'RETRY_MAX_ATTEMPTS': int(os.environ.get('NOTIFICATION_RETRY_MAX_ATTEMPTS', '3')),
+    'RETRY_BASE_SECONDS': int(os.environ.get('NOTIFICATION_RETRY_BASE_SECONDS', '60')),
+    'RETRY_MAX_SECONDS': int(os.environ.get('NOTIFICATION_RETRY_MAX_SECONDS', '3600')),
+    # notification_scheduler: expresión cron (hora local) de cada tarea y duración máxima del lock de líder
+    'SCHEDULER_JOBS': {
+        'expiration_reminders': os.environ.get('SCHEDULER_EXPIRATION_CRON', '0 9 * * *'),
+        'urgent_reminders': os.environ.get('SCHEDULER_URGENT_CRON', '0 18 * * *'),
+        'retry_failed': os.environ.get('SCHEDULER_RETRY_CRON', '*/15 * * * *'),
+    },
+    'SCHEDULER_LOCK_SECONDS': int(os.environ.get('SCHEDULER_LOCK_SECONDS', str(6 * 3600))),
+    # Franjas perdidas durante un reinicio que se ejecutan al arrancar, si no son más antiguas que esto
+    'SCHEDULER_MISFIRE_SECONDS': int(os.environ.get('SCHEDULER_MISFIRE_SECONDS', '3600')),
+    # Cola de webhooks entrantes: intentos por mensaje y retraso máximo antes de marcar el health como 'lagging'
+    'INBOUND_MAX_ATTEMPTS': int(os.environ.get('INBOUND_MAX_ATTEMPTS', '3')),
+    'INBOUND_MAX_LAG_SECONDS': int(os.environ.get('INBOUND_MAX_LAG_SECONDS', '120')),
+    # Plantillas de mensajes: cada cuántos segundos cada proceso revisa si se editaron en el admin
+    'TEMPLATE_CHECK_SECONDS': int(os.environ.get('MESSAGE_TEMPLATE_CHECK_SECONDS', '30')),
 }
 
+# Importación de leads: procesar las importaciones en un hilo del proceso web que recibió el archivo.
+# Desactivar solo si run_import_worker corre con acceso a los mismos archivos (volumen o storage compartido)
+LEAD_IMPORT_INLINE_WORKER = os.environ.get('LEAD_IMPORT_INLINE_WORKER', 'True').lower() == 'true'
+
 # Authentication
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'home'